@@ -0,0 +1,168 @@
+"""Benchmark du streaming HF : ancien générateur `requests` vs client async partagé.
+
+Lance un faux Space HF local qui streame une réponse découpée en morceaux
+(avec des caractères accentués coupés entre deux morceaux), puis ouvre N
+streams simultanés avec chacune des deux implémentations.
+
+    python benchmarks/bench_hf_stream.py --clients 200 --chunks 20 --delay 0.05
+
+Pour chaque mode on affiche le temps total, le nombre maximal de streams
+ouverts en même temps côté serveur, le débit en streams/s, le p99 du délai
+avant le premier morceau et l'attente d'une
+requête synchrone quelconque (sonde `run_in_threadpool`) pendant les streams :
+c'est elle qui montre l'épuisement des workers du threadpool.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from pathlib import Path
+
+import requests
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services import hf_service  # noqa: E402
+
+ANSWER = "Pour poser un congé, allez dans l'écran « Demandes » et validez. ".encode("utf-8")
+
+
+class StubServer:
+    """Serveur HTTP/1.1 minimal (keep-alive, réponse chunked) qui compte les streams actifs."""
+
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+        # compteurs partagés avec le process du benchmark
+        self.active = multiprocessing.Value("i", 0)
+        self.peak = multiprocessing.Value("i", 0)
+
+    def reset(self):
+        self.active.value = self.peak.value = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+
+                with self.active.get_lock():
+                    self.active.value += 1
+                    self.peak.value = max(self.peak.value, self.active.value)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; charset=utf-8\r\n"
+                    b"Transfer-Encoding: chunked\r\n\r\n"
+                )
+                # découpe volontairement au milieu des caractères multi-octets
+                step = max(1, len(ANSWER) // self.chunks)
+                for i in range(0, len(ANSWER), step):
+                    part = ANSWER[i:i + step]
+                    writer.write(b"%x\r\n%s\r\n" % (len(part), part))
+                    await writer.drain()
+                    await asyncio.sleep(self.delay)
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+                with self.active.get_lock():
+                    self.active.value -= 1
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    def serve(self, port):
+        # process séparé : le serveur ne prend pas de CPU au client mesuré
+        async def run():
+            server = await asyncio.start_server(self.handle, "127.0.0.1", port, backlog=4096)
+            await server.serve_forever()
+        asyncio.run(run())
+
+
+def legacy_stream(url, question):
+    """Reprise de l'ancien `huggingface_stream` (requests, pas de timeout, decode par chunk)."""
+    response = requests.post(url, json={"inputs": question}, stream=True)
+    for chunk in response.iter_content(chunk_size=None):
+        yield chunk.decode("utf-8", errors="replace")
+
+
+async def consume(parts):
+    """Lit un stream complet, retourne (texte, délai avant premier morceau)."""
+    start = time.perf_counter()
+    text, first = "", None
+    async for part in parts:
+        if first is None:
+            first = time.perf_counter() - start
+        text += part
+    return text, first or 0.0
+
+
+def consume_legacy(url):
+    # même chemin que StreamingResponse sur un générateur synchrone
+    return consume(iterate_in_threadpool(legacy_stream(url, "congé")))
+
+
+def consume_async(url):
+    return consume(hf_service.stream("congé"))
+
+
+async def probe_threadpool(waits, stop):
+    # simule une autre route synchrone (ex. /admin) servie pendant les streams
+    while not stop.is_set():
+        start = time.perf_counter()
+        await run_in_threadpool(lambda: None)
+        waits.append(time.perf_counter() - start)
+        await asyncio.sleep(0.01)
+
+
+def p99(values):
+    values = sorted(values)
+    return values[max(0, int(len(values) * 0.99) - 1)] * 1000 if values else 0.0
+
+
+async def run_mode(name, open_stream, url, stub, clients):
+    stub.reset()
+    waits, stop = [], asyncio.Event()
+    probe = asyncio.create_task(probe_threadpool(waits, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(open_stream(url) for _ in range(clients)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    ok = [r for r in results if not isinstance(r, Exception)]
+    broken = sum(1 for text, _ in ok if "�" in text)
+    print(f"{name:<8} {elapsed:8.2f}s  pic simultané={stub.peak.value:<5} "
+          f"{clients / elapsed:8.1f} streams/s  1er octet p99={p99([t for _, t in ok]):7.1f}ms  "
+          f"sonde p99={p99(waits):7.1f}ms  erreurs={clients - len(ok)}  accents cassés={broken}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-connections", type=int, default=hf_service.HF_MAX_CONNECTIONS)
+    args = parser.parse_args()
+    hf_service.HF_MAX_CONNECTIONS = args.max_connections
+
+    stub = StubServer(args.chunks, args.delay)
+    server = multiprocessing.Process(target=stub.serve, args=(args.port,), daemon=True)
+    server.start()
+    await asyncio.sleep(0.5)
+    url = f"http://127.0.0.1:{args.port}/generate_stream"
+    hf_service.HF_URL = url
+
+    print(f"{args.clients} streams simultanés, ~{args.chunks * args.delay:.1f}s par stream")
+    await run_mode("avant", consume_legacy, url, stub, args.clients)
+    await run_mode("après", consume_async, url, stub, args.clients)
+
+    await hf_service.close_client()
+    server.terminate()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
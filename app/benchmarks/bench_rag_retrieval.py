@@ -0,0 +1,84 @@
+"""Benchmark du retrieval RAG en mémoire (services/rag_service.py).
+
+Construit un index de N chunks aux embeddings aléatoires (dimension de
+text-embedding-3-small par défaut), puis mesure :
+- la latence d'une recherche top-k (p50 / p99) ;
+- le coût d'un rafraîchissement incrémental (ajout + suppression de quelques chunks)
+  comparé à une reconstruction complète.
+
+    python benchmarks/bench_rag_retrieval.py --sizes 10000 100000 --dim 1536
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.rag_service import RagIndex, build_prompt  # noqa: E402
+
+
+def make_embedder(dim, counter):
+    rng = np.random.default_rng(0)
+
+    def embed(texts):
+        counter[0] += len(texts)
+        return rng.standard_normal((len(texts), dim), dtype=np.float32)
+    return embed
+
+
+def chunks(start, stop):
+    return [{"id_chunk": i, "contenu": f"chunk {i} " * 50, "page": None, "id_source": 1} for i in range(start, stop)]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000
+
+
+def bench(size, dim, queries, k, delta):
+    embedded = [0]
+    index = RagIndex(embed=make_embedder(dim, embedded), fetch=lambda: [])
+    corpus = chunks(0, size)
+
+    start = time.perf_counter()
+    index.sync(corpus)
+    build = time.perf_counter() - start
+
+    rng = np.random.default_rng(1)
+    latencies = []
+    for _ in range(queries):
+        q = rng.standard_normal(dim, dtype=np.float32)
+        t = time.perf_counter()
+        hits = index.search("", k=k, query_vector=q)
+        build_prompt("question", hits)
+        latencies.append(time.perf_counter() - t)
+
+    # rafraîchissement : `delta` chunks supprimés et `delta` nouveaux
+    embedded[0] = 0
+    updated = corpus[delta:] + chunks(size, size + delta)
+    start = time.perf_counter()
+    added, removed = index.sync(updated)
+    refresh = time.perf_counter() - start
+
+    print(f"{size:>8} chunks  matrice {index.matrix.nbytes / 1e6:7.1f} Mo  "
+          f"construction {build:6.2f}s  recherche p50={percentile(latencies, 50):6.2f}ms "
+          f"p99={percentile(latencies, 99):6.2f}ms  "
+          f"refresh +{added}/-{removed} {refresh * 1000:7.1f}ms ({embedded[0]} embeddés)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--delta", type=int, default=50)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        bench(size, args.dim, args.queries, args.k, args.delta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Micro-benchmark du filtre de chemins : ancien middleware `@app.middleware("http")`
+(BaseHTTPMiddleware) contre le middleware ASGI pur de services/request_filter.py.
+
+Les applications sont appelées directement en ASGI (pas de réseau) pour isoler
+le coût du middleware :
+- surcoût par requête sur une route simple (µs/requête, comparé à sans filtre) ;
+- délai avant le premier octet d'une StreamingResponse dont le premier morceau
+  est prêt immédiatement et les suivants arrivent toutes les `--delay` secondes.
+
+    python benchmarks/bench_request_filter.py --requests 20000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from services.request_filter import BlockedPathMiddleware  # noqa: E402
+
+
+def make_app(mode, delay):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(5):
+                yield f"token {i} "
+                await asyncio.sleep(delay)
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    if mode == "avant":
+        # reprise de l'ancien block_malicious_routes
+        @app.middleware("http")
+        async def block_malicious_routes(request: Request, call_next):
+            banned_keywords = ["phpunit", ".env", ".git", "config", "cms", "backup", "wp-admin"]
+            if any(bad in request.url.path.lower() for bad in banned_keywords):
+                return JSONResponse(status_code=403, content={"detail": "Forbidden"})
+            return await call_next(request)
+    elif mode == "après":
+        app.add_middleware(BlockedPathMiddleware)
+    return app
+
+
+def scope(path):
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [(b"host", b"bench")], "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+
+
+async def call(app, path, on_first_byte=None):
+    sent = []
+
+    async def receive():
+        # corps vide, puis client connecté jusqu'à la fin de la réponse
+        if not sent:
+            sent.append(True)
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if on_first_byte and message["type"] == "http.response.body" and message.get("body"):
+            on_first_byte()
+
+    await app(scope(path), receive, send)
+
+
+async def per_request(app, requests):
+    for _ in range(200):  # chauffe
+        await call(app, "/ping")
+    start = time.perf_counter()
+    for _ in range(requests):
+        await call(app, "/ping")
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def first_byte(app, samples):
+    delays = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        first = []
+        await call(app, "/stream", lambda: first or first.append(time.perf_counter() - start))
+        delays.append(first[0] * 1e6)
+    return statistics.median(delays)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.005)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("sans filtre", "avant", "après"):
+        app = make_app(mode, args.delay)
+        results[mode] = (await per_request(app, args.requests), await first_byte(app, args.samples))
+
+    base = results["sans filtre"][0]
+    for mode, (us, ttfb) in results.items():
+        print(f"{mode:<12} {us:8.1f} µs/requête (surcoût {us - base:+7.1f} µs)  "
+              f"premier octet stream médian {ttfb:8.1f} µs")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
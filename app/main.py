@@ -7,23 +7,38 @@ from fastapi.templating import Jinja2Templates
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.concurrency import run_in_threadpool
-import shutil
 from pathlib import Path
+from urllib.parse import urlencode
 import os
-import openai
 import requests
 from starlette.status import HTTP_401_UNAUTHORIZED
-from typing import Optional
+from typing import List, Optional
 import json
 import secrets
+import asyncio
+import time
 
 # ENV peut être "prod", "test", etc.
 ENV = os.getenv("ENV", "prod")
 
 if ENV == "test":
-     from app.services import openai_service
+     from app.services import openai_service, hf_service
+     from app.services.answer_cache import answer_cache, normalize_question
+     from app.services.singleflight import singleflight
+     from app.services.rag_service import rag_index, build_prompt
+     from app.services.admission import limiters, BackendOverloaded
+     from app.services import stream_metrics
+     from app.services.upload_service import ContentIndex, UploadSizeLimitMiddleware, save_upload
+     from app.services.request_filter import BlockedPathMiddleware
 else:
-     from services import openai_service
+     from services import openai_service, hf_service
+     from services.answer_cache import answer_cache, normalize_question
+     from services.singleflight import singleflight
+     from services.rag_service import rag_index, build_prompt
+     from services.admission import limiters, BackendOverloaded
+     from services import stream_metrics
+     from services.upload_service import ContentIndex, UploadSizeLimitMiddleware, save_upload
+     from services.request_filter import BlockedPathMiddleware
 
 # Création du microservices
 app = FastAPI(
@@ -37,6 +52,14 @@ Instrumentator(
     should_group_untemplated=False,
 ).instrument(app).expose(app)
 
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    # libère les pools de connexions keep-alive vers le Space HF et OpenAI
+    await hf_service.close_client()
+    await openai_service.close_client()
+
+
 # Dossier courant du fichier main.py
 BASE_DIR = Path(__file__).resolve().parent
 
@@ -49,6 +72,9 @@ DATA_BRUTE_DIR = BASE_DIR / "data-brute"
 STATIC_DIR.mkdir(parents=True, exist_ok=True)
 DATA_BRUTE_DIR.mkdir(parents=True, exist_ok=True)
 
+# Empreintes SHA-256 des PDF de data-brute, pour ignorer les ré-uploads identiques
+data_brute_index = ContentIndex(DATA_BRUTE_DIR)
+
 # Configuration Jinja2 et statiques
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
@@ -83,35 +109,57 @@ def check_credentials(credentials: HTTPBasicCredentials = Depends(security)):
     return credentials.username
 
 
-@app.middleware("http")
-async def block_malicious_routes(request: Request, call_next):
-    banned_keywords = ["phpunit", ".env", ".git", "config", "cms", "backup", "wp-admin"]
-    if any(bad in request.url.path.lower() for bad in banned_keywords):
-        return JSONResponse(status_code=403, content={"detail": "Forbidden"})
-    return await call_next(request)
+@app.exception_handler(BackendOverloaded)
+async def backend_overloaded_handler(request: Request, exc: BackendOverloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(hf_service.HFStreamError)
+async def hf_error_handler(request: Request, exc: hf_service.HFStreamError):
+    return JSONResponse(status_code=502, content={"detail": str(exc)})
+
+
+# Bloque les scans (phpunit, .env, wp-admin...) : middleware ASGI pur, sans toucher aux corps de réponse
+app.add_middleware(BlockedPathMiddleware)
+app.add_middleware(UploadSizeLimitMiddleware)
 
 
 # ################################## ADMIN ##################################################
 
 # Page Admin avec upload et liste des fichiers
 @app.get("/admin", response_class=HTMLResponse, summary="Page Admin", tags=["Admin"])
-def admin_page(request: Request, username: str = Depends(check_credentials)):
+def admin_page(request: Request, doublons: Optional[str] = None, username: str = Depends(check_credentials)):
     print(f"Bienvenue {username}, accès admin autorisé.")
     """route pour  servir le fichier html avec formulaire d'upload """
-    files = os.listdir(DATA_BRUTE_DIR)
+    # les fichiers cachés sont les uploads en cours d'écriture
+    files = [f for f in os.listdir(DATA_BRUTE_DIR) if not f.startswith(".")]
     return templates.TemplateResponse("admin.html", {
         "request": request,
-        "files": files
+        "files": files,
+        "doublons": doublons.split("|") if doublons else [],
+        "cache_size": len(answer_cache)
     })
 
 
-@app.post("/upload", summary="Uploader un fichier", tags=["Admin"])
-async def upload_file(file: UploadFile = File(...)):
+@app.post("/upload", summary="Uploader un ou plusieurs fichiers", tags=["Admin"])
+async def upload_file(file: List[UploadFile] = File(...)):
     """route pour permettre l'ajout de fichiers à indexer"""
-    destination = DATA_BRUTE_DIR / file.filename
-    with destination.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    return RedirectResponse(url="/admin", status_code=303)
+    duplicates = []
+    for upload in file:
+        name, sha256, duplicate_of = await save_upload(upload, DATA_BRUTE_DIR, data_brute_index)
+        if duplicate_of is not None:
+            # contenu identique déjà présent : pas de nouvelle extraction OCR + GPT
+            print(f"Upload ignoré : {name} est identique à {duplicate_of} ({sha256})")
+            duplicates.append(f"{name} = {duplicate_of}")
+
+    url = "/admin"
+    if duplicates:
+        url += "?" + urlencode({"doublons": "|".join(duplicates)})
+    return RedirectResponse(url=url, status_code=303)
 
 
 @app.post("/delete", summary="Supprimer un fichier", tags=["Admin"])
@@ -122,6 +170,7 @@ async def delete_file(filename: str = Form(...)):
 
     if file_path.exists():
         file_path.unlink()  # Ceci déclenchera le watchdog
+        data_brute_index.discard(safe_filename)
     else:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -131,6 +180,13 @@ async def delete_file(filename: str = Form(...)):
     return RedirectResponse(url="/admin", status_code=303)
 
 
+@app.post("/admin/cache/purge", summary="Vider le cache des réponses", tags=["Admin"])
+async def purge_answer_cache(username: str = Depends(check_credentials)):
+    purged = answer_cache.clear()
+    print(f"{username} a vidé le cache des réponses ({purged} entrées).")
+    return RedirectResponse(url="/admin", status_code=303)
+
+
 # ################################ AIDE EN LIGNE ##############################################
 
 # Chat avec GPT-4o
@@ -144,10 +200,18 @@ def chat_form(request: Request, username: str = Depends(check_credentials)):
 
 @app.post("/chat", response_class=HTMLResponse, summary="Obtenir une réponse", tags=["Chat"])
 async def answer(request: Request, question: str = Form(...)):
-    try:
-        answer = openai_service.ask_openai(question)
-    except Exception as e:
-        answer = f"Erreur lors de l'appel à l'API : {e}"
+    cached = answer_cache.get("openai", question)
+    if cached is not None:
+        answer = "".join(cached)
+    else:
+        # BackendOverloaded n'est pas rattrapée : réponse 429/503 immédiate
+        async with limiters["openai"].slot():
+            try:
+                chunks = stream_metrics.instrument("openai", openai_service.ask_openai(question))
+                answer = "".join([chunk async for chunk in chunks])
+                answer_cache.set("openai", question, [answer])
+            except Exception as e:
+                answer = f"Erreur lors de l'appel à l'API : {e}"
 
     return templates.TemplateResponse("chat.html", {
         "request": request,
@@ -156,49 +220,19 @@ async def answer(request: Request, question: str = Form(...)):
     })
 
 
-def ask_openai(question: str) -> str:
-    openai.api_key = os.getenv("OPENAI_API_KEY", "fake-key-for-tests")
-
-    # Utiliser json.dumps pour échapper correctement les caractères spéciaux
-    escaped_question = json.dumps(question, ensure_ascii=False)
-
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Tu es un assistant qui aide à comprendre une documation en ligne"},
-            {"role": "user", "content": escaped_question}
-        ],
-        temperature=0.3,
-        top_p=0.5,
-        stream=True
-    )
-
-    for chunk in response:
-        print(chunk)
-        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
-            yield chunk.choices[0].delta.content
-
+async def ask_openai(question: str):
+    # Client async partagé du service : la boucle d'événements n'est jamais bloquée
+    async for text in openai_service.ask_openai(question):
+        yield text
 
 
 HF_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
-HF_URL = "https://carozum-supportbot.hf.space/generate_stream"
-
 
-def huggingface_stream(question: str):
-    # Utilisation de json.dumps pour échapper correctement les caractères spéciaux
-    escaped_question = json.dumps(question, ensure_ascii=False)
 
-    response = requests.post(
-        HF_URL,
-        headers={
-            "Authorization": f"Bearer {HF_TOKEN}",
-            "Content-Type": "application/json"
-        },
-        json={"inputs": escaped_question},
-        stream=True
-    )
-    for chunk in response.iter_content(chunk_size=None):
-        yield chunk.decode("utf-8")
+async def huggingface_stream(question: str):
+    # Client async partagé : pas de worker du threadpool bloqué pendant le stream
+    async for text in hf_service.stream(question):
+        yield text
 
 
 @app.post("/ask_stream", summary="stream la réponse", tags=["stream"])
@@ -209,10 +243,40 @@ async def ask_stream(request: Request):
     question = data["question"]
     model_name = data.get("model", "hf")  # hf par défaut
 
+    # Tous les modèles autres qu'OpenAI sont servis par le même Space HF
     if model_name == "openai":
-        return StreamingResponse(ask_openai(question), media_type="text/plain")
+        backend, upstream = "openai", lambda: ask_openai(question)
     else:
-        return StreamingResponse(huggingface_stream(question), media_type="text/plain")
+        backend, upstream = "hf", lambda: huggingface_stream(question)
+
+    # En cas d'absence du cache, les questions identiques simultanées partagent un seul appel amont,
+    # qui seul occupe un créneau du backend
+    def produce():
+        return singleflight.stream(
+            backend, normalize_question(question),
+            lambda: limiters[backend].stream(lambda: stream_metrics.instrument(backend, upstream()))
+        )
+
+    return await start_stream(answer_cache.stream(backend, question, produce))
+
+
+async def start_stream(chunks):
+    """Attend le premier morceau avant d'envoyer les en-têtes.
+
+    Un refus d'admission ou une erreur du backend devient ainsi une vraie
+    réponse HTTP (429/503/502) au lieu d'un stream 200 vide.
+    """
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return StreamingResponse(iter(()), media_type="text/plain")
+
+    async def rest():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(rest(), media_type="text/plain")
 
 
 # ############################# VALIDATION DES Q/A ########################################
@@ -250,7 +314,13 @@ def call_mistral_raft(question):
     return f"Réponse RAFT à : {question}"
 
 def call_mistral_raft_rag(question):
-    return f"Réponse RAFT + RAG à : {question}"
+    # Étape de retrieval : top-k des chunks de la base, puis génération par le Space HF
+    try:
+        rag_index.refresh()
+        hits = rag_index.search(question)
+    except Exception as e:
+        return f"Exception RAG : {e}"
+    return call_mistral_classic(build_prompt(question, hits))
 
 def call_mixtral(question):
     return f"Réponse Mixtral à : {question}"
@@ -258,20 +328,8 @@ def call_mixtral(question):
 def call_customerbot(question):
     return f"Réponse du modèle Mistral Customerbot à : {question}"
 
-def call_gpt4o(question):
-    openai.api_key = os.getenv("OPENAI_API_KEY", "fake-key-for-tests")
-    escaped_question = json.dumps(question, ensure_ascii=False)
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Tu es un assistant qui aide à comprendre une documentation en ligne"},
-            {"role": "user", "content": escaped_question}
-        ],
-        temperature=0.3,
-        top_p=0.5
-    )
-
-    return response.choices[0].message.content
+async def call_gpt4o(question):
+    return await openai_service.ask_openai_simple(question)
 
 
 model_colors = {
@@ -284,6 +342,74 @@ model_colors = {
 }
 
 
+# Fonctions d'appel de chaque modèle comparé
+evaluation_models = {
+    "Mistral 7B FT classique": call_mistral_classic,
+    "Mistral 7B FT RAFT": call_mistral_raft,
+    "Mistral 7B RAFT + RAG": call_mistral_raft_rag,
+    "Mixtral 12B FT": call_mixtral,
+    "Mistral customerbot": call_customerbot,
+    "GPT-4o": call_gpt4o,
+}
+
+# Backend réellement appelé par chaque modèle (les autres sont encore simulés)
+model_backends = {
+    "Mistral 7B FT classique": "hf",
+    "Mistral 7B RAFT + RAG": "hf",
+    "GPT-4o": "openai",
+}
+
+# Délai maximal (s) accordé à chaque modèle avant de l'afficher en "délai dépassé"
+EVAL_TIMEOUT = float(os.getenv("EVAL_TIMEOUT", "30"))
+model_timeouts = {
+    "Mistral 7B FT classique": float(os.getenv("EVAL_TIMEOUT_MISTRAL_CLASSIC", "60")),
+    "GPT-4o": float(os.getenv("EVAL_TIMEOUT_GPT4O", "30")),
+}
+
+
+async def call_evaluation_model(model: str, question: str):
+    call = evaluation_models[model]
+    backend = model_backends.get(model)
+
+    # les appels async (GPT-4o) restent sur la boucle et s'annulent avec la requête :
+    # le créneau est rendu à l'annulation
+    if asyncio.iscoroutinefunction(call):
+        if backend is None:
+            return await call(question)
+        async with limiters[backend].slot():
+            return await call(question)
+
+    # les autres passent par le threadpool ; un thread ne s'annule pas, son créneau
+    # n'est rendu qu'à sa fin réelle (délai dépassé compris)
+    if backend is None:
+        return await run_in_threadpool(call, question)
+    return await limiters[backend].run_detached(lambda: run_in_threadpool(call, question))
+
+
+async def run_evaluation_model(model: str, question: str) -> dict:
+    """Interroge un modèle dans le threadpool sous son propre délai ; ne lève jamais."""
+    timeout = model_timeouts.get(model, EVAL_TIMEOUT)
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(call_evaluation_model(model, question), timeout)
+        status_ = "ok"
+    except asyncio.TimeoutError:
+        response = f"Délai dépassé ({timeout:g}s)"
+        status_ = "timeout"
+    except BackendOverloaded as e:
+        response = str(e)
+        status_ = "overloaded"
+    except Exception as e:
+        response = f"Erreur : {e}"
+        status_ = "error"
+    return {
+        "model": model,
+        "response": response,
+        "status": status_,
+        "elapsed": round(time.perf_counter() - start, 3),
+    }
+
+
 @app.get("/evaluation", response_class=HTMLResponse)
 async def evaluation_get(request: Request):
     return templates.TemplateResponse("evaluation.html", {
@@ -295,14 +421,11 @@ async def evaluation_get(request: Request):
 
 @app.post("/evaluation", response_class=HTMLResponse)
 async def evaluation_post(request: Request, question: str = Form(...)):
-    responses = {
-        "Mistral 7B FT classique": await run_in_threadpool(call_mistral_classic, question),
-        "Mistral 7B FT RAFT": await run_in_threadpool(call_mistral_raft, question),
-        "Mistral 7B RAFT + RAG": await run_in_threadpool(call_mistral_raft_rag, question),
-        "Mixtral 12B FT": await run_in_threadpool(call_mixtral, question),
-        "Mistral customerbot": await run_in_threadpool(call_customerbot, question),
-        "GPT-4o": await run_in_threadpool(call_gpt4o, question),
-    }
+    # Tous les modèles en parallèle : la page attend le plus lent, pas la somme
+    results = await asyncio.gather(
+        *(run_evaluation_model(model, question) for model in evaluation_models)
+    )
+    responses = {r["model"]: r["response"] for r in results}
 
     return templates.TemplateResponse("evaluation.html", {
         "request": request,
@@ -310,3 +433,21 @@ async def evaluation_post(request: Request, question: str = Form(...)):
         "responses": responses,
         "model_colors": model_colors
     })
+
+
+@app.post("/evaluation/stream", summary="Comparer les modèles en streaming", tags=["Evaluation"])
+async def evaluation_stream(question: str = Form(...)):
+    """Envoie (SSE) la réponse de chaque modèle dès qu'elle arrive."""
+    async def events():
+        tasks = [asyncio.create_task(run_evaluation_model(model, question)) for model in evaluation_models]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                yield f"event: answer\ndata: {json.dumps(result, ensure_ascii=False)}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            # client déconnecté : on n'attend pas les modèles restants
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
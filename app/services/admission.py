@@ -0,0 +1,143 @@
+# Contrôle d'admission des appels aux modèles : au-delà d'un nombre d'appels simultanés
+# par backend, les requêtes attendent dans une file bornée, puis sont refusées
+# rapidement (429/503 + Retry-After) au lieu de s'empiler jusqu'à épuiser le conteneur.
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from prometheus_client import Counter, Gauge, Histogram
+
+IN_FLIGHT = Gauge("llm_backend_in_flight", "Appels en cours vers le backend", ["backend"])
+QUEUE_DEPTH = Gauge("llm_backend_queue_depth", "Requêtes en attente d'un créneau", ["backend"])
+QUEUE_WAIT = Histogram(
+    "llm_backend_queue_wait_seconds",
+    "Temps passé dans la file avant l'appel au backend",
+    ["backend"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REJECTED = Counter("llm_backend_rejected_total", "Requêtes refusées par le contrôle d'admission", ["backend", "reason"])
+
+
+class BackendOverloaded(Exception):
+    """Le backend est saturé : file pleine ("queue_full") ou attente trop longue ("timeout")."""
+
+    def __init__(self, backend: str, reason: str, retry_after: int):
+        super().__init__(f"Backend {backend} saturé ({reason}), réessayez dans {retry_after}s")
+        self.backend = backend
+        self.reason = reason
+        self.retry_after = retry_after
+        # file pleine : le client envoie trop ; attente dépassée : le backend est lent
+        self.status_code = 429 if reason == "queue_full" else 503
+
+
+class BackendLimiter:
+    """Limite de concurrence avec file d'attente FIFO bornée et temps d'attente maximal.
+
+    Les attentes sont des futures créées dans la boucle courante : le limiteur
+    n'est lié à aucune boucle asyncio particulière.
+    """
+
+    def __init__(self, backend: str, max_concurrent: int, max_queue: int, max_wait: float):
+        self.backend = backend
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self._waiters = deque()
+
+    @property
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.max_wait))
+
+    def _reject(self, reason: str):
+        REJECTED.labels(backend=self.backend, reason=reason).inc()
+        raise BackendOverloaded(self.backend, reason, self.retry_after)
+
+    async def acquire(self):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            IN_FLIGHT.labels(backend=self.backend).set(self.active)
+            QUEUE_WAIT.labels(backend=self.backend).observe(0)
+            return
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        QUEUE_DEPTH.labels(backend=self.backend).set(len(self._waiters))
+        start = time.perf_counter()
+        try:
+            # le créneau est transmis directement par release() : active ne change pas
+            await asyncio.wait_for(waiter, self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject("timeout")
+        except asyncio.CancelledError:
+            # annulé juste après avoir reçu le créneau : on le rend
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            QUEUE_DEPTH.labels(backend=self.backend).set(len(self._waiters))
+            QUEUE_WAIT.labels(backend=self.backend).observe(time.perf_counter() - start)
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                QUEUE_DEPTH.labels(backend=self.backend).set(len(self._waiters))
+                return
+        self.active -= 1
+        IN_FLIGHT.labels(backend=self.backend).set(self.active)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_detached(self, start):
+        """Exécute la coroutine `start()` sous un créneau rendu à sa fin réelle, même si l'appelant abandonne.
+
+        Pour le travail qui ne s'annule pas (appel bloquant dans le threadpool) : l'appelant
+        qui dépasse son délai est libéré tout de suite, mais le créneau reste pris jusqu'à
+        la fin du thread, la concurrence réelle vers le backend reste bornée par max_concurrent.
+        """
+        await self.acquire()
+        task = asyncio.create_task(start())
+        task.add_done_callback(self._release_after)
+        return await asyncio.shield(task)
+
+    def _release_after(self, task):
+        if not task.cancelled():
+            task.exception()  # résultat récupéré : pas d'avertissement si l'appelant est parti
+        self.release()
+
+    async def stream(self, produce):
+        """Stream `produce()` en occupant un créneau pendant toute sa durée."""
+        async with self.slot():
+            async for chunk in produce():
+                yield chunk
+
+
+def _limiter(backend: str, concurrency: str, queue: str, max_wait: str) -> BackendLimiter:
+    prefix = f"ADMISSION_{backend.upper()}"
+    return BackendLimiter(
+        backend,
+        max_concurrent=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        max_queue=int(os.getenv(f"{prefix}_QUEUE", queue)),
+        max_wait=float(os.getenv(f"{prefix}_MAX_WAIT", max_wait)),
+    )
+
+
+limiters = {
+    "openai": _limiter("openai", "32", "64", "10"),
+    "hf": _limiter("hf", "8", "32", "15"),
+}
@@ -0,0 +1,101 @@
+# Cache des réponses des modèles : les mêmes questions Octime reviennent sans cesse,
+# inutile de repayer un appel GPT-4o ou HF à chaque fois.
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # secondes
+
+CACHE_HITS = Counter("answer_cache_hits_total", "Réponses servies depuis le cache", ["model"])
+CACHE_MISSES = Counter("answer_cache_misses_total", "Réponses absentes du cache", ["model"])
+CACHE_ENTRIES = Gauge("answer_cache_entries", "Nombre de réponses en cache")
+
+
+def normalize_question(question: str) -> str:
+    """Forme canonique d'une question : minuscules, sans accents, espaces réduits.
+
+    "Comment poser un  Congé ?" et "comment poser un conge" donnent la même clé.
+    """
+    text = unicodedata.normalize("NFKD", question.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"\s+", " ", text)
+    return text.strip(" ?!.")
+
+
+class AnswerCache:
+    """Cache LRU borné avec expiration, stockant les réponses morceau par morceau."""
+
+    def __init__(self, maxsize: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # clé -> (expiration, [morceaux])
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, question: str):
+        return model, normalize_question(question)
+
+    def get(self, model: str, question: str) -> Optional[List[str]]:
+        """Retourne les morceaux de la réponse en cache, ou None."""
+        key = self.key(model, question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                CACHE_MISSES.labels(model=model).inc()
+                return None
+            self._entries.move_to_end(key)
+        CACHE_HITS.labels(model=model).inc()
+        return entry[1]
+
+    def set(self, model: str, question: str, chunks: List[str]):
+        if self.maxsize <= 0:
+            return
+        key = self.key(model, question)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, list(chunks))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self) -> int:
+        """Vide le cache et retourne le nombre d'entrées supprimées."""
+        with self._lock:
+            purged = len(self._entries)
+            self._entries.clear()
+            CACHE_ENTRIES.set(0)
+        return purged
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def stream(self, model: str, question: str, produce) -> AsyncIterator[str]:
+        """Rejoue la réponse en cache, sinon stream `produce()` en l'enregistrant.
+
+        La réponse n'est mise en cache que si le stream amont va jusqu'au bout :
+        une erreur ou une déconnexion du client ne laisse pas de réponse tronquée.
+        """
+        cached = self.get(model, question)
+        if cached is not None:
+            for chunk in cached:
+                yield chunk
+            return
+
+        chunks = []
+        async for chunk in produce():
+            chunks.append(chunk)
+            yield chunk
+        self.set(model, question, chunks)
+
+
+answer_cache = AnswerCache()
@@ -0,0 +1,94 @@
+# pour isoler la logique de streaming depuis le Space Hugging Face
+# Un seul client HTTP asynchrone par process : les connexions keep-alive sont
+# réutilisées d'une question à l'autre et aucun thread n'est bloqué pendant le stream.
+import asyncio
+import codecs
+import json
+import os
+from typing import AsyncIterator, Optional
+
+import httpx
+
+HF_TOKEN = os.getenv("HUGGING_FACE_TOKEN")
+HF_URL = os.getenv("HF_URL", "https://carozum-supportbot.hf.space/generate_stream")
+
+# Délais configurables (en secondes)
+HF_CONNECT_TIMEOUT = float(os.getenv("HF_CONNECT_TIMEOUT", "5"))
+HF_READ_TIMEOUT = float(os.getenv("HF_READ_TIMEOUT", "60"))
+HF_FIRST_BYTE_TIMEOUT = float(os.getenv("HF_FIRST_BYTE_TIMEOUT", "30"))
+
+# Taille du pool de connexions partagé
+HF_MAX_CONNECTIONS = int(os.getenv("HF_MAX_CONNECTIONS", "100"))
+HF_MAX_KEEPALIVE = int(os.getenv("HF_MAX_KEEPALIVE", "20"))
+
+
+class HFStreamError(Exception):
+    """Erreur remontée par le Space HF (statut HTTP ou délai dépassé)."""
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Retourne le client partagé du process, créé au premier appel."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HF_READ_TIMEOUT, connect=HF_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HF_MAX_CONNECTIONS,
+                max_keepalive_connections=HF_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    """Ferme le pool de connexions (arrêt de l'application)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def stream(question: str) -> AsyncIterator[str]:
+    """Stream la réponse du Space HF, décodée en UTF-8 de façon incrémentale.
+
+    Un caractère multi-octets (é, à, ç...) coupé entre deux chunks réseau est
+    conservé dans le décodeur jusqu'à l'arrivée de ses octets manquants.
+    """
+    # Utilisation de json.dumps pour échapper correctement les caractères spéciaux
+    escaped_question = json.dumps(question, ensure_ascii=False)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async with get_client().stream(
+        "POST",
+        HF_URL,
+        headers={
+            "Authorization": f"Bearer {HF_TOKEN}",
+            "Content-Type": "application/json"
+        },
+        json={"inputs": escaped_question},
+    ) as response:
+        if response.status_code != 200:
+            raise HFStreamError(f"Erreur HF ({response.status_code})")
+
+        chunks = response.aiter_bytes()
+        try:
+            first = await asyncio.wait_for(chunks.__anext__(), HF_FIRST_BYTE_TIMEOUT)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            raise HFStreamError(f"Pas de réponse HF après {HF_FIRST_BYTE_TIMEOUT}s")
+
+        text = decoder.decode(first)
+        if text:
+            yield text
+        async for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
@@ -1,38 +1,127 @@
 # pour isoler la logique liée à OpenAI et pouvoir changer de  modèle plus facilement
+# Un seul client asynchrone par process (pool de connexions keep-alive) : un worker
+# sert de nombreuses conversations sans bloquer la boucle d'événements.
+import asyncio
 import os
+import random
+import time
+from typing import AsyncIterator, List, Optional
+
+import httpx
 import openai
 
-def ask_openai_simple(question: str) -> str:
-    openai.api_key = os.getenv("OPENAI_API_KEY", "fake-key-for-tests")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_RETRY_BASE = float(os.getenv("OPENAI_RETRY_BASE", "0.5"))  # secondes
+OPENAI_RETRY_MAX = float(os.getenv("OPENAI_RETRY_MAX", "8"))
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Tu es un assistant qui aide à comprendre une documation en ligne"},
-            {"role": "user", "content": question}
-        ],
-        temperature=0.3,
-        top_p=0.5
-    )
+# Clé obligatoire hors tests : l'application refuse de démarrer plutôt que d'appeler OpenAI avec une fausse clé
+if os.getenv("OPENAI_API_KEY"):
+    OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
+elif os.getenv("ENV", "prod") == "test":
+    OPENAI_API_KEY = "fake-key-for-tests"
+else:
+    raise RuntimeError("OPENAI_API_KEY n'est pas définie")
+
+SYSTEM_PROMPT = "Tu es un assistant qui aide à comprendre une documentation en ligne"
+
+# Erreurs transitoires : on réessaie, les autres (clé invalide, requête mal formée) remontent
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,  # inclut APITimeoutError
+    openai.InternalServerError,
+)
+
+_client: Optional[openai.AsyncOpenAI] = None
+
+# Client synchrone partagé, pour le code qui tourne dans le threadpool (embeddings du RAG)
+sync_client = openai.OpenAI(
+    api_key=OPENAI_API_KEY,
+    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5),
+    max_retries=0,  # mêmes retries que le client asynchrone, gérés ici
+)
+
+
+def _retry_delay(attempt: int) -> float:
+    """Backoff exponentiel avec jitter complet."""
+    return random.uniform(0, min(OPENAI_RETRY_MAX, OPENAI_RETRY_BASE * 2 ** attempt))
+
+
+def get_client() -> openai.AsyncOpenAI:
+    """Retourne le client partagé du process, créé au premier appel."""
+    global _client
+    if _client is None or _client.is_closed():
+        _client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=5),
+            max_retries=0,  # les retries sont gérés ici, avec jitter
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=20),
+            ),
+        )
+    return _client
 
-    return response.choices[0].message.content
 
+async def close_client():
+    """Ferme le pool de connexions (arrêt de l'application)."""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
 
 
-def ask_openai(question: str) -> str:
-    openai.api_key = os.getenv("OPENAI_API_KEY", "fake-key-for-tests")
+def _messages(question: str):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": question}
+    ]
+
+
+async def _create(**kwargs):
+    """Appel chat.completions avec backoff exponentiel et jitter complet sur les erreurs transitoires."""
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            return await get_client().chat.completions.create(
+                model=OPENAI_MODEL,
+                temperature=0.3,
+                top_p=0.5,
+                **kwargs
+            )
+        except RETRYABLE_ERRORS:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+
+
+def embed_texts(texts: List[str], model: str):
+    """Embeddings des textes (un seul lot) via le client synchrone partagé, avec la même politique de retry.
+
+    Bloquant : à appeler depuis le threadpool, jamais depuis la boucle d'événements.
+    """
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            response = sync_client.embeddings.create(model=model, input=texts)
+            return [item.embedding for item in response.data]
+        except RETRYABLE_ERRORS:
+            if attempt == OPENAI_MAX_RETRIES:
+                raise
+            time.sleep(_retry_delay(attempt))
+
+
+async def ask_openai_simple(question: str) -> str:
+    response = await _create(messages=_messages(question))
+    return response.choices[0].message.content
+
 
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "Tu es un assistant qui aide à comprendre une documentation en ligne"},
-            {"role": "user", "content": question}
-        ],
-        temperature=0.3,
-        top_p=0.5,
-        stream=True
-    )
+async def ask_openai(question: str) -> AsyncIterator[str]:
+    """Stream les morceaux de la réponse.
 
-    for chunk in response:
-        if "choices" in chunk and chunk["choices"][0].get("delta", {}).get("content"):
-            yield chunk["choices"][0]["delta"]["content"]
+    Seule l'ouverture du stream est réessayée : une coupure en cours de réponse
+    remonte à l'appelant, qui a déjà pu envoyer une partie du texte.
+    """
+    stream = await _create(messages=_messages(question), stream=True)
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
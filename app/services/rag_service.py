@@ -0,0 +1,142 @@
+# Recherche des chunks pertinents (RAG) pour le modèle "Mistral 7B RAFT + RAG".
+# Les chunks viennent de l'API ETL (aide_ligne_chunk), leurs embeddings sont gardés
+# dans une seule matrice float32 contiguë et la recherche est un produit matrice-vecteur.
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+import requests
+
+if os.getenv("ENV", "prod") == "test":
+    from app.services import openai_service
+else:
+    from services import openai_service
+
+ETL_API_URL = os.getenv("ETL_API_URL", "http://etl:5000")
+RAG_EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "text-embedding-3-small")
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+RAG_REFRESH_INTERVAL = float(os.getenv("RAG_REFRESH_INTERVAL", "60"))  # secondes
+RAG_EMBED_BATCH = 256
+
+
+def embed_openai(texts: List[str]) -> np.ndarray:
+    """Embeddings OpenAI des textes, par lots, en float32 (client partagé d'openai_service, bloquant)."""
+    vectors = []
+    for i in range(0, len(texts), RAG_EMBED_BATCH):
+        vectors.extend(openai_service.embed_texts(texts[i:i + RAG_EMBED_BATCH], RAG_EMBEDDING_MODEL))
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def fetch_chunks() -> List[dict]:
+    """Liste des chunks (id_chunk, contenu, page, id_source) exposée par l'API ETL."""
+    response = requests.get(f"{ETL_API_URL}/chunks", timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def estimate_tokens(text: str) -> int:
+    # approximation suffisante pour un budget de prompt (~4 caractères par token)
+    return len(text) // 4 + 1
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class RagIndex:
+    """Index vectoriel en mémoire, rafraîchi de façon incrémentale.
+
+    `matrix` contient une ligne normalisée par chunk (float32, C-contiguë) :
+    la similarité cosinus d'une question avec tout le corpus est un seul `matrix @ q`.
+    """
+
+    def __init__(self, embed: Callable[[List[str]], np.ndarray] = embed_openai,
+                 fetch: Callable[[], List[dict]] = fetch_chunks):
+        self.embed = embed
+        self.fetch = fetch
+        self.ids = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.chunks: List[dict] = []
+        self.last_refresh = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def sync(self, chunks: List[dict]):
+        """Aligne l'index sur `chunks` : seuls les chunks nouveaux sont embeddés.
+
+        Retourne (nombre ajoutés, nombre supprimés).
+        """
+        wanted = {c["id_chunk"]: c for c in chunks}
+        known = set(self.ids.tolist())
+        added = [c for id_chunk, c in wanted.items() if id_chunk not in known]
+        keep = np.fromiter((i in wanted for i in self.ids.tolist()), dtype=bool, count=len(self.ids))
+        removed = int((~keep).sum())
+
+        # calcul des embeddings hors du verrou : les recherches continuent pendant ce temps
+        new_vectors = _normalize(self.embed([c["contenu"] for c in added])) if added else None
+
+        with self._lock:
+            ids, matrix = self.ids[keep], self.matrix[keep]
+            kept_chunks = [c for c, k in zip(self.chunks, keep) if k]
+            if new_vectors is not None:
+                matrix = new_vectors if not len(ids) else np.vstack([matrix, new_vectors])
+                ids = np.concatenate([ids, np.fromiter((c["id_chunk"] for c in added), dtype=np.int64)])
+                kept_chunks.extend(added)
+            self.ids = ids
+            self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+            self.chunks = kept_chunks
+            self.last_refresh = time.monotonic()
+        return len(added), removed
+
+    def refresh(self, force: bool = False):
+        """Recharge la liste des chunks depuis l'ETL si le dernier rafraîchissement est ancien."""
+        # un seul rafraîchissement à la fois, les autres appels réutilisent son résultat
+        with self._refresh_lock:
+            if force or not self.last_refresh or time.monotonic() - self.last_refresh > RAG_REFRESH_INTERVAL:
+                return self.sync(self.fetch())
+        return 0, 0
+
+    def search(self, question: str, k: int = RAG_TOP_K, query_vector: Optional[np.ndarray] = None):
+        """Top-k des chunks par similarité cosinus : liste de (score, chunk), meilleur d'abord."""
+        with self._lock:
+            matrix, chunks = self.matrix, self.chunks
+        if not chunks:
+            return []
+        if query_vector is None:
+            query_vector = self.embed([question])[0]
+        query = query_vector.astype(np.float32) / (np.linalg.norm(query_vector) or 1.0)
+
+        scores = matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), chunks[i]) for i in top]
+
+
+def build_prompt(question: str, hits, budget_tokens: int = RAG_CONTEXT_TOKENS) -> str:
+    """Prompt RAG : les meilleurs chunks tant qu'ils tiennent dans le budget de tokens."""
+    context, used = [], 0
+    for _, chunk in hits:
+        cost = estimate_tokens(chunk["contenu"])
+        if used + cost > budget_tokens:
+            break
+        context.append(chunk["contenu"])
+        used += cost
+
+    documentation = "\n\n".join(f"[Document {i + 1}]\n{text}" for i, text in enumerate(context))
+    return (
+        "Réponds à la question en t'appuyant uniquement sur la documentation Octime ci-dessous.\n\n"
+        f"{documentation}\n\n"
+        f"Question : {question}"
+    )
+
+
+rag_index = RagIndex()
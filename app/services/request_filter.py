@@ -0,0 +1,53 @@
+# Filtre des requêtes de scan (phpunit, .env, wp-admin...) en middleware ASGI pur :
+# seul le chemin est examiné, avec une unique regex précompilée, et les réponses
+# (dont les StreamingResponse de /ask_stream) passent sans être ré-emballées.
+import json
+import os
+import re
+from typing import Iterable
+
+from prometheus_client import Counter
+
+DEFAULT_BLOCKED_KEYWORDS = "phpunit,.env,.git,config,cms,backup,wp-admin"
+
+BLOCKED_REQUESTS = Counter("blocked_requests_total", "Requêtes bloquées par le filtre de chemins", ["rule"])
+
+FORBIDDEN_BODY = json.dumps({"detail": "Forbidden"}).encode()
+
+
+def load_blocked_keywords():
+    """Mots-clés interdits dans le chemin, configurables via BLOCKED_PATH_KEYWORDS (séparés par des virgules)."""
+    raw = os.getenv("BLOCKED_PATH_KEYWORDS", DEFAULT_BLOCKED_KEYWORDS)
+    return [k.strip().lower() for k in raw.split(",") if k.strip()]
+
+
+class BlockedPathMiddleware:
+    """Répond 403 aux requêtes HTTP dont le chemin contient un mot-clé interdit."""
+
+    def __init__(self, app, keywords: Iterable[str] = None):
+        self.app = app
+        keywords = list(keywords) if keywords is not None else load_blocked_keywords()
+        # alternatives les plus longues d'abord : la règle comptée est la plus spécifique
+        keywords.sort(key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(k.lower()) for k in keywords)) if keywords else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.pattern is None:
+            await self.app(scope, receive, send)
+            return
+
+        match = self.pattern.search(scope["path"].lower())
+        if match is None:
+            await self.app(scope, receive, send)
+            return
+
+        BLOCKED_REQUESTS.labels(rule=match.group(0)).inc()
+        await send({
+            "type": "http.response.start",
+            "status": 403,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(FORBIDDEN_BODY)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": FORBIDDEN_BODY})
@@ -0,0 +1,97 @@
+# Regroupement des requêtes identiques en cours : quand la même question arrive
+# plusieurs fois dans la même seconde, un seul stream amont est ouvert et tous les
+# demandeurs en reçoivent les morceaux.
+import asyncio
+from typing import AsyncIterator, Callable, Hashable
+
+from prometheus_client import Counter
+
+COALESCED = Counter(
+    "singleflight_coalesced_total",
+    "Requêtes rattachées à un stream amont déjà en cours",
+    ["model"],
+)
+
+
+class _Flight:
+    """Un appel amont en cours et les morceaux déjà reçus."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.task = None
+
+    def notify(self):
+        # un nouvel Event par étape : chaque abonné attend celui qu'il a lu
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+
+class StreamSingleFlight:
+    """Partage un même stream amont entre toutes les requêtes de même clé."""
+
+    def __init__(self):
+        self._flights = {}
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def _run(self, key: Hashable, flight: _Flight, produce: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in produce():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except (Exception, asyncio.CancelledError) as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._release(key, flight)
+            flight.notify()
+
+    def _release(self, key: Hashable, flight: _Flight):
+        # la clé est libérée dès la fin : aucune réponse n'est resservie plus tard
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def stream(self, model: str, key: Hashable, produce: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Stream la réponse de `produce()`, partagée avec les requêtes identiques en cours.
+
+        Un abonné arrivé en cours de route reçoit d'abord les morceaux déjà produits.
+        Une erreur amont est relancée chez tous les abonnés.
+        """
+        key = (model, key)
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._run(key, flight, produce))
+            flight.task.add_done_callback(lambda task: self._release(key, flight))
+        else:
+            COALESCED.labels(model=model).inc()
+
+        flight.subscribers += 1
+        sent = 0
+        try:
+            while True:
+                changed = flight.changed
+                while sent < len(flight.chunks):
+                    yield flight.chunks[sent]
+                    sent += 1
+                if flight.done and sent == len(flight.chunks):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await changed.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # plus personne n'écoute : inutile de continuer à payer l'appel amont.
+                # Clé libérée avant l'annulation : une requête qui arrive ensuite ouvre un
+                # nouvel appel au lieu de rejoindre celui-ci et de recevoir CancelledError.
+                self._release(key, flight)
+                flight.task.cancel()
+
+
+singleflight = StreamSingleFlight()
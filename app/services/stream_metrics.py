@@ -0,0 +1,84 @@
+# Métriques de génération des réponses : la durée HTTP mesurée par Instrumentator ne dit
+# rien de la latence ressentie sur un stream. On mesure ici, par modèle, le délai avant
+# le premier token, l'écart entre tokens, la durée totale et le débit en tokens/s.
+import time
+from typing import AsyncIterator
+
+from prometheus_client import Counter, Histogram
+
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Délai entre l'appel au modèle et le premier token reçu",
+    ["model"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30, 60),
+)
+INTER_TOKEN = Histogram(
+    "llm_inter_token_seconds",
+    "Écart entre deux morceaux successifs d'un stream",
+    ["model"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+GENERATION_TIME = Histogram(
+    "llm_generation_seconds",
+    "Durée totale de génération d'une réponse",
+    ["model"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+TOKENS_PER_SECOND = Histogram(
+    "llm_output_tokens_per_second",
+    "Débit de génération (tokens de sortie / durée de génération)",
+    ["model"],
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+OUTPUT_TOKENS = Counter("llm_output_tokens_total", "Tokens de sortie générés", ["model"])
+# Streams terminés sans aucun token (vides, ou en échec avant le premier) : hors des histogrammes,
+# où un délai de 0 s ferait croire à un modèle rapide au moment précis où il est en panne
+STREAMS_WITHOUT_TOKEN = Counter(
+    "llm_streams_without_token_total",
+    "Streams terminés sans aucun token reçu",
+    ["model", "reason"],
+)
+
+
+def count_tokens(text: str) -> int:
+    # estimation (~4 caractères par token) : même règle pour tous les modèles
+    return max(1, len(text) // 4) if text else 0
+
+
+def observe_completion(model: str, elapsed: float, text: str, first_token: float = None):
+    """Enregistre une réponse complète (non streamée : premier token = fin de la réponse)."""
+    tokens = count_tokens(text)
+    TIME_TO_FIRST_TOKEN.labels(model=model).observe(elapsed if first_token is None else first_token)
+    GENERATION_TIME.labels(model=model).observe(elapsed)
+    OUTPUT_TOKENS.labels(model=model).inc(tokens)
+    if elapsed > 0 and tokens:
+        TOKENS_PER_SECOND.labels(model=model).observe(tokens / elapsed)
+
+
+async def instrument(model: str, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Relaie un stream en mesurant ses temps.
+
+    Un stream en échec n'alimente pas les histogrammes ; sans aucun token (vide ou
+    en échec avant le premier), il est compté dans llm_streams_without_token_total.
+    """
+    start = previous = time.perf_counter()
+    first_token = None
+    text = []
+    try:
+        async for chunk in chunks:
+            now = time.perf_counter()
+            if first_token is None:
+                first_token = now - start
+            else:
+                INTER_TOKEN.labels(model=model).observe(now - previous)
+            previous = now
+            text.append(chunk)
+            yield chunk
+    except Exception:
+        if first_token is None:
+            STREAMS_WITHOUT_TOKEN.labels(model=model, reason="error").inc()
+        raise
+    if first_token is None:
+        STREAMS_WITHOUT_TOKEN.labels(model=model, reason="empty").inc()
+        return
+    observe_completion(model, time.perf_counter() - start, "".join(text), first_token)
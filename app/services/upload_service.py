@@ -0,0 +1,189 @@
+# Écriture des PDF uploadés dans data-brute : copie par morceaux dans un fichier
+# temporaire caché, SHA-256 calculé au fil de l'eau, puis renommage atomique.
+# Le watchdog ne voit donc jamais un PDF à moitié écrit, et un contenu déjà
+# présent (même sous un autre nom) n'est pas réécrit.
+import hashlib
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+# taille totale d'une requête d'upload (lot de plusieurs fichiers + enveloppe multipart)
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ContentIndex:
+    """SHA-256 -> nom des fichiers présents dans le répertoire, construit au premier usage."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._by_hash: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._by_hash is None:
+            self._by_hash = {
+                hash_file(path): path.name
+                for path in self.directory.iterdir()
+                if path.is_file() and not path.name.startswith(".")
+            }
+        return self._by_hash
+
+    def claim(self, sha256: str, name: str) -> Optional[str]:
+        """Réserve `sha256` pour `name`, ou retourne le nom du fichier existant au même contenu.
+
+        La vérification et l'enregistrement se font sous le même verrou : deux
+        uploads simultanés du même contenu ne sont pas écrits tous les deux.
+        """
+        with self._lock:
+            by_hash = self._load()
+            existing = by_hash.get(sha256)
+            if existing is not None and (self.directory / existing).exists():
+                return existing
+            for known, known_name in list(by_hash.items()):
+                if known_name == name:
+                    del by_hash[known]  # fichier remplacé sous le même nom
+            by_hash[sha256] = name
+            return None
+
+    def release(self, sha256: str, name: str):
+        """Annule la réservation de `claim` (fichier finalement non écrit)."""
+        with self._lock:
+            if self._by_hash is not None and self._by_hash.get(sha256) == name:
+                del self._by_hash[sha256]
+
+    def discard(self, name: str):
+        with self._lock:
+            if self._by_hash is not None:
+                for known, known_name in list(self._by_hash.items()):
+                    if known_name == name:
+                        del self._by_hash[known]
+
+
+async def save_upload(upload: UploadFile, directory: Path, index: ContentIndex,
+                      max_bytes: int = UPLOAD_MAX_BYTES):
+    """Enregistre un fichier uploadé ; retourne (nom, sha256, doublon de).
+
+    `doublon de` est le nom du fichier existant au contenu identique, auquel
+    cas rien n'est écrit dans le répertoire.
+    """
+    # Protection contre chemins relatifs malveillants
+    name = os.path.basename(upload.filename or "")
+    if not name or name.startswith("."):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Nom de fichier invalide")
+
+    # nom caché sans extension .pdf : ignoré par le watchdog et la page admin
+    tmp_path = directory / f".{name}.{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with tmp_path.open("wb") as buffer:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{name} dépasse la taille maximale ({max_bytes} octets)"
+                    )
+                digest.update(chunk)
+                await run_in_threadpool(buffer.write, chunk)
+
+        sha256 = digest.hexdigest()
+        duplicate_of = await run_in_threadpool(index.claim, sha256, name)
+        if duplicate_of is not None:
+            return name, sha256, duplicate_of
+
+        try:
+            os.replace(tmp_path, directory / name)  # atomique : le PDF apparaît complet
+        except OSError:
+            # contenu réservé mais jamais écrit : les prochains uploads identiques doivent passer
+            index.release(sha256, name)
+            raise
+        return name, sha256, None
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """Refuse (413) les requêtes d'upload trop grosses avant que le formulaire ne soit lu.
+
+    Middleware ASGI pur : Content-Length est vérifié avant tout, et un corps sans
+    Content-Length (chunked) est compté au fil de la lecture, sans attendre que
+    Starlette l'ait entièrement mis sur disque.
+    """
+
+    def __init__(self, app, paths: Iterable[str] = ("/upload",), max_bytes: int = UPLOAD_MAX_REQUEST_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Requête trop volumineuse (maximum {self.max_bytes} octets)"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        too_large = rejected = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise _BodyTooLarge()  # interrompt la lecture du formulaire
+            return message
+
+        async def limited_send(message):
+            nonlocal rejected
+            if not too_large:
+                await send(message)
+            elif not rejected:
+                # la réponse d'erreur de l'application (400 du parseur) est remplacée par un 413
+                rejected = True
+                await self._reject(send)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except _BodyTooLarge:
+            if not rejected:
+                await self._reject(send)
@@ -6,11 +6,23 @@ from pathlib import Path
 ENV = os.getenv("ENV", "prod")
 
 if ENV == "test":
-    from app.main import openai_service  # pour pytest ou exécution spéciale
-    from app.main import app
+    from app.main import openai_service, hf_service  # pour pytest ou exécution spéciale
+    from app.main import app, evaluation_models, model_timeouts, answer_cache, run_evaluation_model
+    from app.services.answer_cache import normalize_question
+    from app.services.singleflight import StreamSingleFlight
+    from app.services import stream_metrics
+    from app.services.rag_service import RagIndex, build_prompt, embed_openai
+    from app.services.admission import BackendLimiter, BackendOverloaded, limiters
+    from app.services.upload_service import ContentIndex, UploadSizeLimitMiddleware, save_upload
 else:
-    from main import openai_service
-    from main import app
+    from main import openai_service, hf_service
+    from main import app, evaluation_models, model_timeouts, answer_cache, run_evaluation_model
+    from services.answer_cache import normalize_question
+    from services.singleflight import StreamSingleFlight
+    from services import stream_metrics
+    from services.rag_service import RagIndex, build_prompt, embed_openai
+    from services.admission import BackendLimiter, BackendOverloaded, limiters
+    from services.upload_service import ContentIndex, UploadSizeLimitMiddleware, save_upload
 
 client = TestClient(app)
 
@@ -20,6 +32,17 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 # pour isoler la logique liée à OpenAI et pouvoir changer de  modèle plus facilement
 import os
 import openai
+import httpx
+import asyncio
+import numpy as np
+from types import SimpleNamespace
+import io
+import json
+import time
+import uuid
+from fastapi import UploadFile
+from fastapi.security import HTTPBasic
+from prometheus_client import REGISTRY
 
 
 
@@ -31,16 +54,16 @@ PASSWORD = os.getenv("BASIC_AUTH_PASSWORD")
 
 
 def test_chat_post(monkeypatch):
-    # Mock la fonction ask_openai directement
-    def mock_ask_openai(question: str) -> str:
-        return "Réponse mockée"
+    # Mock la fonction ask_openai directement (générateur async du service)
+    async def mock_ask_openai(question: str):
+        yield "Réponse mockée"
 
     monkeypatch.setattr(openai_service, "ask_openai", mock_ask_openai)
 
     response = client.post(
         "/chat",
         data={"question": "Qu'est-ce qu'une API ?"},
-        auth=(USERNAME, PASSWORD)
+        auth=(USERNAME, PASSWORD),
     )
 
     assert response.status_code == 200
@@ -60,8 +83,385 @@ def test_upload_file(tmp_path):
     with open(test_file, "rb") as f:
         response = client.post(
             "/upload",
-            auth=(USERNAME, PASSWORD)
+            auth=(USERNAME, PASSWORD),
             files={"file": ("test.pdf", f, "application/pdf")})
 
     assert response.status_code == 200
     assert "test.pdf" in response.text
+
+
+def test_ask_stream_hf_multibyte_split(monkeypatch):
+    # "é" (0xC3 0xA9) coupé entre deux chunks réseau
+    body = "Poser un congé payé".encode("utf-8")
+    cut = body.index(b"\xa9")
+
+    async def chunks():
+        yield body[:cut]
+        yield body[cut:]
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=chunks()))
+    monkeypatch.setattr(hf_service, "_client", httpx.AsyncClient(transport=transport))
+
+    response = client.post("/ask_stream", json={"question": "Congé ?", "model": "hf"})
+
+    assert response.status_code == 200
+    assert response.text == "Poser un congé payé"
+
+
+def test_evaluation_stream_slow_model_times_out(monkeypatch):
+    def slow_model(question):
+        time.sleep(2)
+        return "trop tard"
+
+    monkeypatch.setitem(evaluation_models, "Mistral 7B FT classique", slow_model)
+    monkeypatch.setitem(evaluation_models, "GPT-4o", lambda question: "Réponse GPT")
+    monkeypatch.setitem(model_timeouts, "Mistral 7B FT classique", 0.2)
+
+    start = time.perf_counter()
+    response = client.post("/evaluation/stream", data={"question": "Congé ?"})
+    elapsed = time.perf_counter() - start
+
+    results = [
+        json.loads(block.split("data: ", 1)[1])
+        for block in response.text.split("\n\n")
+        if block.startswith("event: answer")
+    ]
+    by_model = {r["model"]: r for r in results}
+
+    assert response.status_code == 200
+    assert elapsed < 1.5
+    assert len(results) == len(evaluation_models)
+    assert by_model["Mistral 7B FT classique"]["status"] == "timeout"
+    assert by_model["GPT-4o"]["response"] == "Réponse GPT"
+    # le modèle lent arrive en dernier, les autres ne l'attendent pas
+    assert results[-1]["model"] == "Mistral 7B FT classique"
+
+
+def test_normalize_question():
+    assert normalize_question("Comment poser un  Congé ?") == "comment poser un conge"
+    assert normalize_question("comment  POSER un conge") == "comment poser un conge"
+
+
+def test_ask_stream_replays_cached_answer(monkeypatch):
+    answer_cache.clear()
+    calls = []
+
+    async def fake_stream(question):
+        calls.append(question)
+        for token in ["Allez ", "dans ", "Demandes."]:
+            yield token
+
+    monkeypatch.setattr(hf_service, "stream", fake_stream)
+
+    first = client.post("/ask_stream", json={"question": "Comment poser un congé ?"})
+    second = client.post("/ask_stream", json={"question": "comment poser un CONGE"})
+
+    assert first.text == second.text == "Allez dans Demandes."
+    assert len(calls) == 1
+
+    response = client.post("/admin/cache/purge", auth=(USERNAME, PASSWORD), follow_redirects=False)
+    assert response.status_code == 303
+    assert len(answer_cache) == 0
+
+
+def test_singleflight_shares_one_upstream_call():
+    flights = StreamSingleFlight()
+    calls = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def upstream():
+            calls.append(1)
+            yield "Allez "
+            await gate.wait()
+            yield "dans Demandes."
+
+        async def read():
+            return "".join([c async for c in flights.stream("hf", "conge", upstream)])
+
+        first = asyncio.create_task(read())
+        await asyncio.sleep(0.01)  # le premier morceau est déjà parti
+        late = asyncio.create_task(read())
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await asyncio.gather(first, late)
+
+    assert asyncio.run(scenario()) == ["Allez dans Demandes.", "Allez dans Demandes."]
+    assert len(calls) == 1
+    assert flights.in_flight() == 0
+
+
+def test_singleflight_rejoin_after_last_subscriber_left():
+    flights = StreamSingleFlight()
+    calls = []
+
+    async def scenario():
+        async def upstream():
+            calls.append(1)
+            yield f"appel {len(calls)}"
+            await asyncio.sleep(10)
+
+        first = flights.stream("hf", "q", upstream)
+        assert await first.__anext__() == "appel 1"
+        await first.aclose()  # dernier abonné parti : appel amont annulé
+        assert flights.in_flight() == 0
+
+        # même clé juste après, avant que la tâche annulée ait fini : nouvel appel amont
+        second = flights.stream("hf", "q", upstream)
+        assert await second.__anext__() == "appel 2"
+        await second.aclose()
+
+    asyncio.run(scenario())
+    assert len(calls) == 2
+
+
+def test_singleflight_propagates_errors():
+    flights = StreamSingleFlight()
+
+    async def scenario():
+        async def upstream():
+            yield "Allez "
+            await asyncio.sleep(0.01)
+            raise RuntimeError("HF indisponible")
+
+        async def read():
+            return "".join([c async for c in flights.stream("hf", "conge", upstream)])
+
+        return await asyncio.gather(read(), read(), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_rag_index_incremental_refresh_and_search():
+    vocabulary = ["congé", "badge", "planning", "compteur"]
+    embedded = []
+
+    def embed(texts):
+        embedded.extend(texts)
+        return np.array([[t.count(w) for w in vocabulary] for t in texts], dtype=np.float32)
+
+    def chunk(id_chunk, contenu):
+        return {"id_chunk": id_chunk, "contenu": contenu, "page": None, "id_source": 1}
+
+    index = RagIndex(embed=embed, fetch=lambda: [])
+    index.sync([chunk(1, "poser un congé"), chunk(2, "badger avec le badge")])
+    assert index.matrix.dtype == np.float32 and index.matrix.flags["C_CONTIGUOUS"]
+
+    embedded.clear()
+    added, removed = index.sync([chunk(2, "badger avec le badge"), chunk(3, "consulter son planning")])
+    assert (added, removed) == (1, 1)
+    assert embedded == ["consulter son planning"]  # seul le nouveau chunk est embeddé
+
+    hits = index.search("mon planning ?")
+    assert hits[0][1]["id_chunk"] == 3
+    assert [c["id_chunk"] for _, c in hits] == [3, 2]
+    assert "consulter son planning" in build_prompt("mon planning ?", hits[:1])
+
+
+def test_rag_embeddings_use_shared_client_with_retries(monkeypatch):
+    calls = []
+
+    def create(model, input):
+        calls.append(input)
+        if len(calls) == 1:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[float(len(t)), 1.0]) for t in input])
+
+    monkeypatch.setattr(openai_service, "sync_client", SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+    monkeypatch.setattr(openai_service, "OPENAI_RETRY_BASE", 0)
+
+    vectors = embed_openai(["badge", "congé"])
+    assert vectors.dtype == np.float32 and vectors.tolist() == [[5.0, 1.0], [5.0, 1.0]]
+    assert len(calls) == 2  # erreur transitoire réessayée par la politique d'openai_service
+    assert openai.api_key is None  # aucune clé globale posée sur le module openai
+
+
+def test_backend_limiter_queue_and_shedding():
+    limiter = BackendLimiter("hf", max_concurrent=1, max_queue=1, max_wait=0.05)
+
+    async def scenario():
+        await limiter.acquire()                           # créneau occupé
+        queued = asyncio.create_task(limiter.acquire())   # attend dans la file
+        await asyncio.sleep(0)
+        try:
+            await limiter.acquire()                       # file pleine
+        except BackendOverloaded as e:
+            full = e
+        try:
+            await queued                                  # attente trop longue
+        except BackendOverloaded as e:
+            late = e
+        return full, late
+
+    full, late = asyncio.run(scenario())
+    assert (full.reason, full.status_code) == ("queue_full", 429)
+    assert (late.reason, late.status_code) == ("timeout", 503)
+    limiter.release()
+    assert limiter.active == 0
+
+
+def test_evaluation_timeout_keeps_slot_until_thread_finishes(monkeypatch):
+    limiter = BackendLimiter("hf", max_concurrent=1, max_queue=4, max_wait=5)
+    monkeypatch.setitem(limiters, "hf", limiter)
+    monkeypatch.setitem(model_timeouts, "Mistral 7B FT classique", 0.05)
+    monkeypatch.setitem(evaluation_models, "Mistral 7B FT classique", lambda q: time.sleep(0.3) or "lent")
+
+    async def scenario():
+        result = await run_evaluation_model("Mistral 7B FT classique", "Question ?")
+        held = limiter.active  # délai dépassé, mais le thread tourne encore
+        await asyncio.sleep(0.5)
+        return result, held
+
+    result, held = asyncio.run(scenario())
+    assert result["status"] == "timeout"
+    assert held == 1
+    assert limiter.active == 0
+
+
+def test_ask_stream_sheds_load_with_retry_after(monkeypatch):
+    answer_cache.clear()
+    monkeypatch.setitem(limiters, "hf", BackendLimiter("hf", max_concurrent=0, max_queue=0, max_wait=3))
+
+    response = client.post("/ask_stream", json={"question": "Question jamais posée", "model": "hf"})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_ask_stream_records_generation_metrics(monkeypatch):
+    answer_cache.clear()
+
+    async def fake_stream(question):
+        for token in ["Cliquez ", "sur ", "Valider."]:
+            await asyncio.sleep(0.01)
+            yield token
+
+    monkeypatch.setattr(hf_service, "stream", fake_stream)
+    client.post("/ask_stream", json={"question": "Comment valider ?", "model": "hf"})
+
+    metrics = client.get("/metrics").text
+    assert 'llm_time_to_first_token_seconds_count{model="hf"}' in metrics
+    assert 'llm_inter_token_seconds_count{model="hf"}' in metrics
+    assert 'llm_output_tokens_per_second_count{model="hf"}' in metrics
+
+
+def test_stream_metrics_skip_ttft_without_token():
+    def sample(name, **labels):
+        return REGISTRY.get_sample_value(name, {"model": "sans-token", **labels}) or 0
+
+    async def empty():
+        return
+        yield
+
+    async def failing():
+        raise RuntimeError("backend en panne")
+        yield
+
+    async def scenario():
+        assert [c async for c in stream_metrics.instrument("sans-token", empty())] == []
+        try:
+            [c async for c in stream_metrics.instrument("sans-token", failing())]
+        except RuntimeError:
+            pass
+
+    asyncio.run(scenario())
+    assert sample("llm_time_to_first_token_seconds_count") == 0
+    assert sample("llm_streams_without_token_total", reason="empty") == 1
+    assert sample("llm_streams_without_token_total", reason="error") == 1
+
+
+def test_openai_service_streams_and_retries(monkeypatch):
+    attempts = []
+
+    async def fake_stream():
+        for text in ["Bonjour", None, " Octime"]:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+    async def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        return fake_stream()
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(openai_service, "get_client", lambda: fake_client)
+    monkeypatch.setattr(openai_service, "OPENAI_RETRY_BASE", 0)
+
+    async def read():
+        return "".join([c async for c in openai_service.ask_openai("Bonjour ?")])
+
+    assert asyncio.run(read()) == "Bonjour Octime"
+    assert len(attempts) == 2
+    assert attempts[-1]["stream"] is True
+
+
+def test_upload_batch_skips_identical_content():
+    content = b"%PDF-1.4 " + uuid.uuid4().hex.encode()
+    first_name = f"{uuid.uuid4().hex}.pdf"
+    copy_name = f"{uuid.uuid4().hex}.pdf"
+
+    response = client.post(
+        "/upload",
+        auth=(USERNAME, PASSWORD),
+        files=[("file", (first_name, content, "application/pdf")),
+               ("file", (copy_name, content, "application/pdf"))])
+
+    upload_dir = PROJECT_ROOT / "app" / "data-brute"
+    assert response.status_code == 200
+    assert first_name in response.text
+    assert f"{copy_name} = {first_name}" in response.text
+    assert not (upload_dir / copy_name).exists()
+    assert not any(p.name.endswith(".part") for p in upload_dir.iterdir())
+    (upload_dir / first_name).unlink()
+
+
+def test_upload_size_limit_checked_before_form_parsing():
+    upload_app = UploadSizeLimitMiddleware(app, max_bytes=1024)
+    limited = TestClient(upload_app)
+    content = b"%PDF-1.4 " + b"x" * 4096
+
+    # Content-Length annoncé trop grand : refusé sans lire le corps
+    response = limited.post("/upload", auth=(USERNAME, PASSWORD),
+                            files={"file": ("gros.pdf", content, "application/pdf")})
+    assert response.status_code == 413
+
+    # corps sans Content-Length (chunked) : refusé dès que le compte dépasse la limite
+    def chunks():
+        for i in range(0, len(content), 512):
+            yield content[i:i + 512]
+
+    response = limited.post("/upload", auth=(USERNAME, PASSWORD), content=chunks(),
+                            headers={"content-type": "multipart/form-data; boundary=x"})
+    assert response.status_code == 413
+
+
+def test_failed_replace_releases_content_claim(tmp_path, monkeypatch):
+    index = ContentIndex(tmp_path)
+    upload = UploadFile(io.BytesIO(b"%PDF-1.4 contenu"), filename="a.pdf")
+
+    def failing_replace(src, dst):
+        raise OSError("disque plein")
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    try:
+        asyncio.run(save_upload(upload, tmp_path, index))
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    # même contenu réenvoyé : écrit, pas pris pour un doublon d'un fichier inexistant
+    upload = UploadFile(io.BytesIO(b"%PDF-1.4 contenu"), filename="b.pdf")
+    name, sha256, duplicate_of = asyncio.run(save_upload(upload, tmp_path, index))
+    assert duplicate_of is None and (tmp_path / "b.pdf").exists()
+
+
+def test_blocked_paths_are_rejected_and_counted():
+    response = client.get("/wp-admin/setup.php")
+    assert response.status_code == 403
+    assert response.json() == {"detail": "Forbidden"}
+    assert client.get("/.ENV").status_code == 403
+
+    assert client.get("/evaluation").status_code == 200
+    assert 'blocked_requests_total{rule="wp-admin"}' in client.get("/metrics").text
@@ -0,0 +1,134 @@
+"""Montée en charge de l'API ETL : accès psycopg2 dans le threadpool (DB_DRIVER=sync) vs asyncpg (async).
+
+Démarre l'API (uvicorn, un seul worker, process séparé) dans chaque mode, puis
+envoie des requêtes en continu avec 10, 100 et 1000 clients simultanés. Chaque
+requête vise un fichier différent (`{id}` remplacé par un id_source tiré au sort)
+et le cache de réponses est désactivé : chaque requête va jusqu'à PostgreSQL.
+Utilise la base du benchmark JSON (créée et remplie si besoin, variables POSTGRES_*).
+
+    POSTGRES_HOST=localhost python benchmarks/bench_async_concurrency.py --duration 10
+
+`--slow` ajoute à chaque requête une attente côté PostgreSQL (pg_sleep, en ms) pour
+simuler une requête analytique lente : en mode sync, chacune occupe un thread.
+Pour chaque mode et chaque palier : débit (req/s), latences p50/p99 et erreurs
+(503 pool saturé, délais dépassés).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from bench_db_pool import percentile  # noqa: E402
+from bench_json_fast_path import BENCH_DB, seed, server_conn  # noqa: E402
+
+LEVELS = (10, 100, 1000)
+
+
+def serve(port, driver, slow_ms):
+    os.environ.update(POSTGRES_DB=BENCH_DB, DB_DRIVER=driver, RESPONSE_CACHE_ENTRIES="0")
+    import uvicorn
+    import etl_api
+    if slow_ms:
+        # requête lente simulée : la page de chunks attend `slow_ms` côté serveur
+        etl_api.CHUNKS_BY_FILE_QUERY = (
+            "SELECT id_chunk, titre, contenu, page, nombre_tokens, id_source "
+            f"FROM aide_ligne_chunk, pg_sleep({slow_ms / 1000})"
+        )
+    uvicorn.run(etl_api.app, host="127.0.0.1", port=port, log_level="error", backlog=4096)
+
+
+async def request(reader, writer, path):
+    """GET HTTP/1.1 sur une connexion gardée ouverte ; retourne le statut (réponses à Content-Length)."""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(head.split(b" ", 2)[1])
+
+
+async def load(port, path, files, clients, duration):
+    # client HTTP minimal sur asyncio : avec 1000 connexions, httpx mesurerait surtout httpx
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        connection = None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                connection = connection or await asyncio.open_connection("127.0.0.1", port)
+                status = await asyncio.wait_for(request(*connection, path.format(id=random.randint(1, files))), 30)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                errors += 1
+                connection = None
+                continue
+            if status != 200:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+        if connection:
+            connection[1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def run_mode(driver, args, files):
+    server = multiprocessing.Process(target=serve, args=(args.port, driver, args.slow), daemon=True)
+    server.start()
+    for _ in range(100):  # attente du démarrage
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", args.port)
+            await request(reader, writer, "/fichiers?limit=1")
+            writer.close()
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+
+    for clients in args.levels:
+        latencies, errors, elapsed = await load(args.port, args.path, files, clients, args.duration)
+        print(f"{driver:<6} {clients:>5} clients  {len(latencies) / elapsed:8.1f} req/s  "
+              f"p50={percentile(latencies, 0.5):8.1f}ms  p99={percentile(latencies, 0.99):8.1f}ms  "
+              f"erreurs={errors}")
+    server.terminate()
+    server.join()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Q/R de la base de benchmark")
+    parser.add_argument("--duration", type=float, default=10, help="secondes par palier")
+    parser.add_argument("--levels", type=lambda v: [int(n) for n in v.split(",")], default=list(LEVELS))
+    parser.add_argument("--path", default="/chunks/{id}?limit=20")
+    parser.add_argument("--slow", type=float, default=0, help="attente PostgreSQL ajoutée par requête (ms)")
+    parser.add_argument("--drivers", default="sync,async")
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+
+    seed(args.rows)
+    conn = server_conn(BENCH_DB)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT max(id_source) FROM aide_ligne_fichier")
+        files = cur.fetchone()[0]
+    conn.close()
+
+    print(f"{args.path} sur {files} fichiers, {args.duration:.0f}s par palier"
+          + (f", +{args.slow:.0f}ms par requête" if args.slow else ""))
+    for driver in args.drivers.split(","):
+        await run_mode(driver, args, files)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+"""Test de charge de l'API ETL : une connexion psycopg2 par requête vs pool partagé.
+
+Démarre l'API (uvicorn, process séparé) dans chacun des deux modes, puis
+envoie des requêtes en continu avec N clients simultanés pendant D secondes.
+Nécessite une base PostgreSQL accessible (variables POSTGRES_*).
+
+    POSTGRES_HOST=localhost python benchmarks/bench_db_pool.py --clients 50 --duration 10
+
+Pour chaque mode on affiche le débit (req/s), les latences p50/p99 et le
+nombre d'erreurs (ex. « too many connections » côté PostgreSQL).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+
+def serve(port, legacy):
+    os.environ["DB_DRIVER"] = "sync"  # ce benchmark compare les deux accès psycopg2
+    import uvicorn
+    import db
+    import etl_api
+    if legacy:
+        # comportement d'origine : psycopg2.connect à chaque requête
+        etl_api.get_connection = db.connect
+    uvicorn.run(etl_api.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] * 1000 if values else 0.0
+
+
+async def load(url, clients, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, elapsed
+
+
+async def run_mode(name, legacy, args):
+    server = multiprocessing.Process(target=serve, args=(args.port, legacy), daemon=True)
+    server.start()
+    base = f"http://127.0.0.1:{args.port}"
+    async with httpx.AsyncClient() as client:
+        for _ in range(50):
+            try:
+                await client.get(f"{base}/fichiers")
+                break
+            except httpx.HTTPError:
+                await asyncio.sleep(0.1)
+
+    latencies, errors, elapsed = await load(f"{base}{args.path}", args.clients, args.duration)
+    print(f"{name:<8} {len(latencies) / elapsed:8.1f} req/s  p50={percentile(latencies, 0.5):7.1f}ms  "
+          f"p99={percentile(latencies, 0.99):7.1f}ms  erreurs={errors}")
+    server.terminate()
+    server.join()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--path", default="/fichier/1")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients simultanés sur {args.path}, {args.duration:.0f}s par mode")
+    await run_mode("avant", True, args)
+    await run_mode("après", False, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
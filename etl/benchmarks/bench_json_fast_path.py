@@ -0,0 +1,144 @@
+"""Benchmark de /qa : sérialisation Python (pydantic, JSONL Python) vs JSON produit par PostgreSQL.
+
+Crée (si besoin) une base dédiée, y applique les migrations et y insère N Q/R,
+puis appelle l'application ASGI dans un process neuf par mode, en jetant le
+corps au fil de l'eau. Nécessite un PostgreSQL accessible (variables POSTGRES_*).
+
+    POSTGRES_HOST=localhost python benchmarks/bench_json_fast_path.py --rows 1000000
+
+Pour chaque mode on affiche la durée, le temps CPU du process API (threads
+compris ; le travail de PostgreSQL n'y figure pas), le pic de mémoire
+résidente au-delà de celle du process au repos, et la taille de la réponse.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from pathlib import Path
+
+import psycopg2
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT.parent))
+
+BENCH_DB = "etl_bench_json"
+MODES = [
+    ("pydantic", "/qa"),
+    ("jsonl", "/qa?format=jsonl"),
+    ("pg json", "/qa?fast=true"),
+    ("pg jsonl", "/qa?format=jsonl&fast=true"),
+]
+
+
+def server_conn(dbname):
+    return psycopg2.connect(dbname=dbname, user=os.environ["POSTGRES_USER"],
+                            password=os.environ["POSTGRES_PASSWORD"],
+                            host=os.environ.get("POSTGRES_HOST", "db"), port="5432")
+
+
+def seed(rows):
+    admin = server_conn("postgres")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB,))
+        if not cur.fetchone():
+            cur.execute(f"CREATE DATABASE {BENCH_DB} ENCODING 'UTF8' TEMPLATE template0")
+    admin.close()
+
+    from migrations.migrate import migrate
+    conn = server_conn(BENCH_DB)
+    migrate(conn)
+    with conn, conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM aide_ligne_qa")
+        if cur.fetchone()[0] == rows:
+            return
+        print(f"insertion de {rows} Q/R...")
+        cur.execute("TRUNCATE aide_ligne_fichier RESTART IDENTITY CASCADE")
+        chunks = max(1, rows // 100)
+        cur.execute("INSERT INTO aide_ligne_fichier (nom_fichier) SELECT 'bench_' || n || '.pdf' "
+                    "FROM generate_series(1, %s) n", (max(1, chunks // 10),))
+        cur.execute("""
+            INSERT INTO aide_ligne_chunk (titre, contenu, id_source, page, nombre_tokens)
+            SELECT 'Titre', 'Contenu du chunk n°' || n || ' : « accents », "guillemets" et \\ antislash',
+                   1 + n %% (SELECT count(*) FROM aide_ligne_fichier), n %% 40, 120
+            FROM generate_series(1, %s) n
+        """, (chunks,))
+        cur.execute("""
+            INSERT INTO aide_ligne_qa (question, réponse, id_chunk)
+            SELECT 'Comment valider la saisie n°' || n || ' ?', 'Cliquez sur « Valider » puis confirmez.',
+                   1 + n %% %s
+            FROM generate_series(1, %s) n
+        """, (chunks, rows))
+        cur.execute("ANALYZE")
+    conn.close()
+
+
+def run(path, results):
+    os.environ["POSTGRES_DB"] = BENCH_DB
+    os.environ["RESPONSE_CACHE_MAX_BODY"] = "0"  # on mesure la sérialisation, pas le cache
+    import etl_api
+
+    raw_path, _, query = path.partition("?")
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+             "path": raw_path, "raw_path": raw_path.encode(), "query_string": query.encode(),
+             "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80), "root_path": ""}
+    size = 0
+    status = None
+    request_sent = False
+
+    async def receive():
+        # requête vide une fois, puis aucun message : le client ne se déconnecte pas
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal size, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    asyncio.run(etl_api.app(scope, receive, send))
+    elapsed = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    results.put({
+        "status": status,
+        "elapsed": elapsed,
+        "cpu": usage.ru_utime + usage.ru_stime - baseline.ru_utime - baseline.ru_stime,
+        "rss": (usage.ru_maxrss - baseline.ru_maxrss) / 1024,  # Mo (ru_maxrss en Ko sous Linux)
+        "size": size / 1024 / 1024,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--modes", default=",".join(name for name, _ in MODES))
+    args = parser.parse_args()
+    seed(args.rows)
+
+    ctx = multiprocessing.get_context("spawn")  # process neuf : pic mémoire propre à chaque mode
+    print(f"{args.rows} Q/R sur /qa")
+    for name, path in MODES:
+        if name not in args.modes.split(","):
+            continue
+        results = ctx.Queue()
+        process = ctx.Process(target=run, args=(path, results))
+        process.start()
+        r = results.get()
+        process.join()
+        print(f"{name:<9} statut={r['status']}  {r['elapsed']:7.2f}s  CPU={r['cpu']:7.2f}s  "
+              f"pic mémoire=+{r['rss']:7.1f} Mo  réponse={r['size']:7.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
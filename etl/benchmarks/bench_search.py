@@ -0,0 +1,63 @@
+"""Latence de /search sur un corpus d'un million de Q/R.
+
+Réutilise la base de bench_json_fast_path.py (créée et remplie si besoin), y
+applique les migrations (colonnes tsvector + index GIN), puis exécute chaque
+requête de recherche plusieurs fois et affiche p50 / p99 et le nombre de lignes
+classées.
+
+    POSTGRES_HOST=localhost python benchmarks/bench_search.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+from bench_json_fast_path import BENCH_DB, seed, server_conn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+QUERIES = [
+    ("terme rare", "saisie n°424242"),
+    ("expression", '"valider la saisie" n°4242'),
+    ("terme très fréquent", "valider"),
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(0, int(len(values) * q) - 1)] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    seed(args.rows)
+
+    os.environ["POSTGRES_DB"] = BENCH_DB
+    from psycopg2.extras import RealDictCursor
+    import etl_api
+
+    conn = server_conn(BENCH_DB)
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        print(f"{args.rows} Q/R")
+        for name, q in QUERIES:
+            sql, params = etl_api.search_query(q, limit=20)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+                times.append(time.perf_counter() - start)
+            cur.execute("SELECT count(*) AS n FROM aide_ligne_qa WHERE search_vector @@ websearch_to_tsquery('french', %s)", (q,))
+            matches = cur.fetchone()["n"]
+            print(f"{name:<20} {q!r:<28} correspondances={matches:<8} page={len(rows):<3} "
+                  f"p50={percentile(times, 0.5):8.1f}ms  p99={percentile(times, 0.99):8.1f}ms")
+    conn.rollback()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
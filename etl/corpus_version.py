@@ -0,0 +1,86 @@
+# Version courante du corpus (table corpus_version, migration 0003), suivie par
+# LISTEN/NOTIFY : tant que l'écoute est active, connaître la version ne coûte
+# aucun aller-retour vers PostgreSQL.
+import logging
+import select
+import threading
+
+import psycopg2.extensions
+
+from db import connect, get_pool
+
+CHANNEL = "corpus_version"
+VERSION_QUERY = "SELECT version FROM corpus_version"
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusVersion:
+    """Version du corpus ; relue en base seulement quand l'écoute NOTIFY n'est pas active."""
+
+    def __init__(self, connect=connect, reconnect_delay=5.0):
+        self.connect = connect
+        self.reconnect_delay = reconnect_delay
+        self._version = None  # None : pas d'écoute fiable, on lit la table
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _read(self, conn):
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+            cur.execute(VERSION_QUERY)
+            return cur.fetchone()[0]
+
+    def peek(self):
+        """Version connue par l'écoute NOTIFY, sans accès à la base ; None si l'écoute est inactive."""
+        return self._version
+
+    def get(self) -> int:
+        version = self._version
+        if version is not None:
+            return version
+        with get_pool().connection() as conn:
+            return self._read(conn)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL}")
+                # LISTEN avant la lecture : aucune incrémentation ne peut passer entre les deux
+                with self._lock:
+                    self._version = self._read(conn)
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        version = int(conn.notifies.pop(0).payload)
+                        with self._lock:
+                            self._version = max(self._version, version)
+            except Exception as e:
+                logger.warning(f"Écoute de {CHANNEL} interrompue : {e}")
+            finally:
+                with self._lock:
+                    self._version = None
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(self.reconnect_delay)
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._listen, name="corpus-version", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+corpus_version = CorpusVersion()
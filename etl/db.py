@@ -0,0 +1,316 @@
+# Pool de connexions PostgreSQL partagé par toutes les routes de l'API ETL :
+# plus de handshake TCP + authentification par requête, et un nombre de connexions
+# borné quel que soit le nombre de clients simultanés.
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from prometheus_client import Counter, Gauge, Histogram
+
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # attente max d'une connexion (s)
+DB_POOL_HEALTHCHECK_IDLE = float(os.getenv("DB_POOL_HEALTHCHECK_IDLE", "30"))  # ping si inactive depuis (s)
+DB_STREAM_BATCH = int(os.getenv("DB_STREAM_BATCH", "2000"))  # lignes par aller-retour pour les exports
+DB_COPY_BUFFER = int(os.getenv("DB_COPY_BUFFER", "16"))  # blocs COPY en attente d'envoi au client
+DB_COPY_BLOCK = 64 * 1024  # octets par bloc envoyé
+# accès à la base des routes : "async" (asyncpg, module db_async) ou "sync" (psycopg2 dans le threadpool)
+DB_DRIVER = os.getenv("DB_DRIVER", "async")
+
+POOL_SIZE = Gauge("etl_db_pool_connections", "Connexions ouvertes par le pool")
+POOL_IN_USE = Gauge("etl_db_pool_in_use", "Connexions empruntées par une requête")
+POOL_WAITING = Gauge("etl_db_pool_waiting", "Requêtes en attente d'une connexion")
+POOL_ACQUIRE_WAIT = Histogram(
+    "etl_db_pool_acquire_seconds",
+    "Attente pour obtenir une connexion du pool",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+POOL_TIMEOUTS = Counter("etl_db_pool_timeouts_total", "Requêtes sans connexion dans le délai imparti")
+POOL_DISCARDED = Counter("etl_db_pool_discarded_total", "Connexions fermées car hors d'usage")
+
+
+class PoolTimeout(Exception):
+    """Aucune connexion libre dans le délai DB_POOL_TIMEOUT."""
+
+
+def connect():
+    return psycopg2.connect(
+        database=os.environ["POSTGRES_DB"],
+        user=os.environ["POSTGRES_USER"],
+        password=os.environ["POSTGRES_PASSWORD"],
+        host=os.environ.get("POSTGRES_HOST", "db"),
+        port="5432",
+        cursor_factory=RealDictCursor,
+    )
+
+
+class ConnectionPool:
+    """Pool de connexions thread-safe (routes sync servies par le threadpool de FastAPI).
+
+    Les connexions libres sont réutilisées de la plus récente à la plus ancienne ;
+    une connexion restée inactive plus de `healthcheck_idle` secondes est vérifiée
+    par un `SELECT 1` avant d'être prêtée, et remplacée si elle est morte. Le verrou ne
+    couvre que la réservation : ouverture et ping se font hors verrou.
+    """
+
+    def __init__(self, minconn=DB_POOL_MIN, maxconn=DB_POOL_MAX, timeout=DB_POOL_TIMEOUT,
+                 healthcheck_idle=DB_POOL_HEALTHCHECK_IDLE, factory=connect):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_idle = healthcheck_idle
+        self.factory = factory
+        self._idle = []  # (connexion, instant de retour au pool)
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
+
+    def _open(self):
+        conn = self.factory()
+        self._size += 1
+        POOL_SIZE.set(self._size)
+        return conn
+
+    def _discard(self, conn):
+        self._size -= 1
+        POOL_SIZE.set(self._size)
+        POOL_DISCARDED.inc()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reserve(self, deadline):
+        """Sous le verrou : une connexion libre (à vérifier) ou une place pour en ouvrir une ((None, None)).
+
+        Ouverture et ping se font ensuite hors verrou : une connexion lente ne bloque ni
+        les autres demandes ni les retours au pool.
+        """
+        with self._cond:
+            self._waiting += 1
+            POOL_WAITING.set(self._waiting)
+            try:
+                while True:
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.maxconn:
+                        self._size += 1  # place réservée pour la connexion ouverte hors verrou
+                        POOL_SIZE.set(self._size)
+                        return None, None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        POOL_TIMEOUTS.inc()
+                        raise PoolTimeout(f"Aucune connexion PostgreSQL libre après {self.timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+                POOL_WAITING.set(self._waiting)
+                POOL_IN_USE.set(self._size - len(self._idle))
+
+    def _release(self, conn=None):
+        """Rend la place d'une connexion morte (fermée hors verrou) ou jamais ouverte, et réveille un appelant."""
+        if conn is not None:
+            POOL_DISCARDED.inc()
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._size -= 1
+            POOL_SIZE.set(self._size)
+            POOL_IN_USE.set(self._size - len(self._idle))
+            self._cond.notify()
+
+    def getconn(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        try:
+            while True:
+                conn, idle_since = self._reserve(deadline)
+                if conn is None:
+                    try:
+                        return self.factory()
+                    except Exception:
+                        self._release()
+                        raise
+                if self._healthy(conn, idle_since):
+                    return conn
+                self._release(conn)
+        finally:
+            POOL_ACQUIRE_WAIT.observe(time.monotonic() - start)
+
+    def putconn(self, conn, broken=False):
+        if broken or conn.closed:
+            self._release(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            POOL_IN_USE.set(self._size - len(self._idle))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Prête une connexion : commit si tout va bien, rollback sinon, puis retour au pool."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            if conn.closed or conn.status is None:
+                broken = True
+            self.putconn(conn, broken=broken)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Pool du process, créé au premier appel (les variables d'environnement sont lues à ce moment)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def iter_batches(query, params=None, batch_size=None):
+    """Exécute `query` sur un curseur nommé (côté serveur) et produit les lignes par lots.
+
+    Seul le lot courant est en mémoire, quelle que soit la taille du résultat ;
+    la connexion reste empruntée au pool jusqu'à la fin (ou l'abandon) de l'itération.
+    """
+    batch_size = batch_size or DB_STREAM_BATCH
+    with get_pool().connection() as conn:
+        with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+            cur.itersize = batch_size
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+
+# row_to_json n'émet jamais de retour à la ligne brut : en CSV avec des caractères de
+# guillemet et de séparation absents du JSON, chaque ligne sort telle quelle, sans
+# l'échappement des antislashs du format texte de COPY.
+COPY_JSON_SQL = (
+    "COPY (SELECT row_to_json(t) FROM ({query}) t) TO STDOUT "
+    "WITH (FORMAT csv, QUOTE E'\\x01', DELIMITER E'\\x02')"
+)
+
+
+class _CopyCancelled(Exception):
+    pass
+
+
+class _QueueWriter:
+    """Fichier minimal pour copy_expert : les lignes reçues (une par write) sont regroupées
+    en blocs d'environ DB_COPY_BLOCK octets avant de partir dans la file du consommateur."""
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= DB_COPY_BLOCK:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        block, self.buffer = bytes(self.buffer), bytearray()
+        while not self.cancelled.is_set():
+            try:
+                self.chunks.put(block, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+        raise _CopyCancelled()  # client parti : COPY interrompu, connexion rendue
+
+
+def copy_json_lines(query, params=None):
+    """Produit le résultat de `query` en JSONL (octets) généré par PostgreSQL via COPY.
+
+    Aucun objet Python par ligne : les blocs renvoyés par le serveur sont transmis
+    tels quels. Le COPY tourne dans un thread dédié, la file bornée fait contre-pression.
+    """
+    chunks = queue.Queue(maxsize=DB_COPY_BUFFER)
+    cancelled = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            with get_pool().connection() as conn:
+                with conn.cursor() as cur:
+                    sql = cur.mogrify(COPY_JSON_SQL.format(query=query), params)
+                    writer = _QueueWriter(chunks, cancelled)
+                    cur.copy_expert(sql, writer)
+                    writer.flush()
+            result = done
+        except _CopyCancelled:
+            return
+        except Exception as e:
+            result = e
+        while not cancelled.is_set():
+            try:
+                chunks.put(result, timeout=0.5)
+                return
+            except queue.Full:
+                pass
+
+    threading.Thread(target=produce, name="copy-json", daemon=True).start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        cancelled.set()
@@ -0,0 +1,187 @@
+# Accès PostgreSQL asynchrone de l'API ETL (asyncpg), utilisé quand DB_DRIVER=async :
+# les routes attendent la base sans occuper de thread, un seul worker sert donc
+# des centaines de clients simultanés avec DB_POOL_MAX connexions.
+# Les requêtes gardent la syntaxe psycopg2 (%s) ; elles sont traduites en $1, $2...
+# et préparées une fois par connexion (cache de requêtes préparées d'asyncpg).
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+
+import asyncpg
+from prometheus_client import Gauge
+
+import db
+from db import (
+    DB_POOL_MAX, DB_POOL_MIN, DB_POOL_TIMEOUT, DB_COPY_BLOCK, DB_COPY_BUFFER,
+    POOL_ACQUIRE_WAIT, POOL_TIMEOUTS, PoolTimeout,
+)
+
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))  # requêtes préparées gardées par connexion
+
+ASYNC_POOL_SIZE = Gauge("etl_db_async_pool_connections", "Connexions ouvertes par le pool asyncpg")
+ASYNC_POOL_IN_USE = Gauge("etl_db_async_pool_in_use", "Connexions asyncpg empruntées par une requête")
+
+_pool = None
+_pool_loop = None
+_pool_lock = None
+
+
+@lru_cache(maxsize=512)
+def to_asyncpg(sql: str) -> str:
+    """`%s` (psycopg2) -> `$1`, `$2`... (asyncpg)."""
+    parts = sql.split("%s")
+    return parts[0] + "".join(f"${i}{part}" for i, part in enumerate(parts[1:], start=1))
+
+
+def _timestamp_text(value):
+    # format texte : accepte les datetime comme les chaînes ISO (valeurs des curseurs de pagination)
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _parse_timestamp(value):
+    # PostgreSQL retire les zéros finaux des fractions de seconde (refusés par fromisoformat en 3.10)
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f" if "." in value else "%Y-%m-%d %H:%M:%S")
+
+
+async def _init_connection(conn):
+    # mêmes types Python que psycopg2 : json décodé, timestamp en datetime
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    await conn.set_type_codec("timestamp", encoder=_timestamp_text, decoder=_parse_timestamp,
+                              schema="pg_catalog", format="text")
+
+
+def _terminate(pool):
+    if pool is None:
+        return
+    try:
+        pool.terminate()
+    except RuntimeError:
+        pass  # boucle déjà fermée : les sockets se ferment avec les objets
+
+
+async def get_async_pool() -> asyncpg.Pool:
+    """Pool asyncpg de la boucle d'événements courante, créé au premier appel."""
+    global _pool, _pool_loop, _pool_lock
+    loop = asyncio.get_running_loop()
+    if _pool_loop is not loop:
+        # autre boucle (client de test sans lifespan...) : les connexions de l'ancienne sont inutilisables
+        _terminate(_pool)
+        _pool, _pool_loop, _pool_lock = None, loop, asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                database=os.environ["POSTGRES_DB"],
+                user=os.environ["POSTGRES_USER"],
+                password=os.environ["POSTGRES_PASSWORD"],
+                host=os.environ.get("POSTGRES_HOST", "db"),
+                port=5432,
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                statement_cache_size=DB_STATEMENT_CACHE,
+                init=_init_connection,
+            )
+    return _pool
+
+
+async def close_async_pool():
+    global _pool, _pool_loop
+    if _pool is not None:
+        if _pool_loop is asyncio.get_running_loop():
+            await _pool.close()
+        else:
+            _terminate(_pool)
+        _pool, _pool_loop = None, None
+
+
+ASYNC_POOL_SIZE.set_function(lambda: _pool.get_size() if _pool is not None else 0)
+ASYNC_POOL_IN_USE.set_function(lambda: _pool.get_size() - _pool.get_idle_size() if _pool is not None else 0)
+
+
+class _Acquire:
+    """Emprunt d'une connexion, limité à DB_POOL_TIMEOUT comme le pool synchrone."""
+
+    async def __aenter__(self):
+        pool = await get_async_pool()
+        start = time.monotonic()
+        try:
+            self.conn = await pool.acquire(timeout=DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            POOL_TIMEOUTS.inc()
+            raise PoolTimeout(f"Aucune connexion PostgreSQL libre après {DB_POOL_TIMEOUT}s") from None
+        finally:
+            POOL_ACQUIRE_WAIT.observe(time.monotonic() - start)
+        self.pool = pool
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.pool.release(self.conn)
+
+
+def acquire() -> _Acquire:
+    return _Acquire()
+
+
+async def fetch_all(query, params=()):
+    """Toutes les lignes de `query`, en dicts (comme RealDictCursor)."""
+    async with acquire() as conn:
+        rows = await conn.fetch(to_asyncpg(query), *params)
+    return [dict(row) for row in rows]
+
+
+async def iter_batches(query, params=(), batch_size=None):
+    """Équivalent asynchrone de db.iter_batches : curseur serveur, lignes par lots."""
+    batch_size = batch_size or db.DB_STREAM_BATCH
+    async with acquire() as conn:
+        async with conn.transaction(readonly=True):
+            cursor = await conn.cursor(to_asyncpg(query), *params)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+
+
+async def copy_json_lines(query, params=()):
+    """Équivalent asynchrone de db.copy_json_lines : JSONL produit par PostgreSQL via COPY.
+
+    Les données reçues sont regroupées en blocs d'environ DB_COPY_BLOCK octets ;
+    la file bornée fait contre-pression sur le COPY, annulé si le client part.
+    """
+    chunks = asyncio.Queue(maxsize=DB_COPY_BUFFER)
+    done = object()
+    buffer = bytearray()
+
+    async def sink(data):
+        buffer.extend(data)
+        if len(buffer) >= DB_COPY_BLOCK:
+            await chunks.put(bytes(buffer))
+            buffer.clear()
+
+    async def produce():
+        try:
+            async with acquire() as conn:
+                await conn.copy_from_query(
+                    f"SELECT row_to_json(t) FROM ({to_asyncpg(query)}) t", *params,
+                    output=sink, format="csv", quote="\x01", delimiter="\x02",
+                )
+            if buffer:
+                await chunks.put(bytes(buffer))
+            await chunks.put(done)
+        except Exception as e:
+            await chunks.put(e)
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        task.cancel()
@@ -1,9 +1,21 @@
-from fastapi import FastAPI, HTTPException
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from prometheus_client import make_asgi_app
+from typing import List, Optional
+from datetime import datetime
+import json
 import os
-from models import FichierItem, DatasetItem, ChunkWithQA, ChunkOnly, QAItem, QAWithChunkItem, ChunkItem
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+import db
+import db_async
+from db import get_pool, close_pool, PoolTimeout
+from migrations.migrate import migrate
+from corpus_version import corpus_version
+from response_cache import ResponseCacheMiddleware
+from export_dataset import EXPORT_FORMATS, build_export, export_path
+from export_embeddings import EMBEDDING_FORMATS, build_embeddings, embeddings_path
+from pagination import PAGE_MAX, InvalidCursor, page_query, split_page
+from models import FichierItem, DatasetItem, ChunkWithQA, ChunkOnly, QAItem, QAWithChunkItem, ChunkItem, SearchHit
 
 app = FastAPI(
     title="ETL API",
@@ -11,35 +23,193 @@ app = FastAPI(
     version="1.0.0"
 )
 
+app.mount("/metrics", make_asgi_app())
+app.add_middleware(ResponseCacheMiddleware, version=corpus_version)
+
+
 def get_connection():
-    return psycopg2.connect(
-        database=os.environ["POSTGRES_DB"],
-        user=os.environ["POSTGRES_USER"],
-        password=os.environ["POSTGRES_PASSWORD"],
-        host=os.environ.get("POSTGRES_HOST", "db"),
-        port="5432",
-        cursor_factory=RealDictCursor,
-    )
+    """Connexion empruntée au pool du process, rendue à la sortie du bloc `with`."""
+    return get_pool().connection()
+
+
+@app.on_event("startup")
+def startup():
+    # le watchdog migre aussi au démarrage : verrou consultatif côté migrations
+    with get_connection() as conn:
+        migrate(conn)
+    corpus_version.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    corpus_version.stop()
+    await db_async.close_async_pool()
+    close_pool()
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_timeout_handler(request: Request, exc: PoolTimeout):
+    # pool saturé : le client peut réessayer, inutile de laisser la file grossir
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+    return JSONResponse(status_code=400, content={"detail": str(exc)})
+
+
+def list_filters(since=None, id_source=None, min_tokens=None, max_tokens=None,
+                 created="created_at", source="id_source", tokens="nombre_tokens"):
+    """Conditions SQL (et paramètres) des filtres communs aux listes."""
+    conditions, params = [], []
+    for column, op, value in (
+        (created, ">=", since),
+        (source, "=", id_source),
+        (tokens, ">=", min_tokens),
+        (tokens, "<=", max_tokens),
+    ):
+        if value is not None:
+            conditions.append(f"{column} {op} %s")
+            params.append(value)
+    return conditions, params
+
+
+# Accès à la base des routes selon DB_DRIVER : asyncpg (db_async) sans bloquer la boucle,
+# ou psycopg2 (db) dans le threadpool de Starlette. Mêmes requêtes, mêmes lignes (dicts).
+
+def fetch_all_sync(query, params=()):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+
+async def fetch_all(query, params=()):
+    if db.DB_DRIVER == "async":
+        return await db_async.fetch_all(query, params)
+    return await run_in_threadpool(fetch_all_sync, query, params)
+
+
+def row_batches(query, params=()):
+    """Lignes de `query` par lots (itérateur asynchrone), depuis un curseur serveur."""
+    if db.DB_DRIVER == "async":
+        return db_async.iter_batches(query, params)
+    return iterate_in_threadpool(db.iter_batches(query, params))
+
+
+def json_blocks(query, params=()):
+    """JSONL de `query` produit par PostgreSQL (COPY), en blocs d'octets (itérateur asynchrone)."""
+    if db.DB_DRIVER == "async":
+        return db_async.copy_json_lines(query, params)
+    return iterate_in_threadpool(db.copy_json_lines(query, params))
+
+
+async def fetch_page(response: Response, select, conditions, params, key, cursor, limit, descending=False):
+    """Exécute une page keyset ; le curseur de la page suivante part dans l'en-tête X-Next-Cursor."""
+    sql, params = page_query(select, conditions, params, key, cursor, limit, descending)
+    rows = await fetch_all(sql, params)
+    rows, next_cursor = split_page(rows, limit, key)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
+
+async def prepend(first, rest):
+    """`first` puis les éléments de l'itérateur asynchrone `rest`, refermé à la fin (ou à l'abandon)."""
+    try:
+        yield first
+        async for item in rest:
+            yield item
+    finally:
+        await rest.aclose()
+
+
+async def jsonl_response(query, params=()):
+    """Export JSONL (une ligne JSON par enregistrement) streamé depuis un curseur serveur.
+
+    Les lignes partent au fil des lots : mémoire constante et premier octet immédiat.
+    """
+    batches = row_batches(query, params)
+    # ouvre le curseur avant d'envoyer les en-têtes : une erreur SQL ou un pool saturé
+    # donne encore un vrai code HTTP au lieu d'un flux tronqué
+    first = await anext(batches, [])
+
+    async def lines():
+        async for rows in prepend(first, batches):
+            if rows:
+                yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+async def as_json_array(first, chunks):
+    """Assemble des blocs JSONL en tableau JSON : chaque fin de ligne devient une virgule."""
+    yield b"["
+    pending = b""
+    async for chunk in prepend(first, chunks):
+        if not chunk:
+            continue
+        data = chunk.replace(b"\n", b",")
+        yield pending
+        # la virgule finale n'est émise que si une autre ligne suit
+        pending = data[-1:] if data.endswith(b",") else b""
+        yield data[:-1] if pending else data
+    yield b"]"
+
+
+async def postgres_json_response(query, params=(), lines=False):
+    """Chemin rapide : JSON (tableau) ou JSONL produit par PostgreSQL, transmis octet pour octet.
+
+    Ni dict par ligne, ni validation pydantic, ni re-sérialisation côté Python.
+    """
+    chunks = json_blocks(query, params)
+    first = await anext(chunks, b"")  # comme jsonl_response : erreurs remontées avant les en-têtes
+    if lines:
+        return StreamingResponse(prepend(first, chunks), media_type="application/x-ndjson")
+    return StreamingResponse(as_json_array(first, chunks), media_type="application/json")
+
+
+async def export_response(query, params, format, fast):
+    if fast:
+        return await postgres_json_response(query, params, lines=format == "jsonl")
+    return await jsonl_response(query, params)
 
 
 # ----------- ROUTE 1 : /fichiers ----------- #
 
+# Paramètres communs aux listes : sans `limit`, tout est renvoyé (comportement historique).
+# Avec `limit`, la réponse porte l'en-tête X-Next-Cursor à repasser en `cursor`
+# (avec les mêmes filtres) pour obtenir la page suivante ; absent sur la dernière page.
+LIMIT = Query(None, ge=1, le=PAGE_MAX, description="Taille de page")
+CURSOR = Query(None, description="Curseur opaque reçu dans X-Next-Cursor")
+SINCE = Query(None, description="Seulement les lignes créées depuis cette date (ISO 8601)")
+FORMAT = Query("json", pattern="^(json|jsonl)$")
+FAST = Query(False, description="JSON produit par PostgreSQL, sans validation pydantic (`limit` ignoré)")
+
+
+FICHIERS_QUERY = "SELECT id_source, nom_fichier, created_at FROM aide_ligne_fichier"
+
+
 @app.get("/fichiers", response_model=List[FichierItem], summary="Lister les fichiers", tags=["Fichiers"])
-def get_fichiers():
+async def get_fichiers(response: Response, limit: Optional[int] = LIMIT, cursor: Optional[str] = CURSOR,
+                 since: Optional[datetime] = SINCE):
     """Retourne la liste des fichiers présents dans la base, triée par date d'insertion."""
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT id_source, nom_fichier, created_at FROM aide_ligne_fichier ORDER BY created_at DESC")
-                rows = cur.fetchall()
-                return [
-                    {
-                        "id_source": r["id_source"],
-                        "nom_fichier": r["nom_fichier"],
-                        "created_at": r["created_at"].isoformat()
-                    }
-                    for r in rows
-                ]
+        conditions, params = list_filters(since=since)
+        rows = await fetch_page(
+            response, FICHIERS_QUERY,
+            conditions, params, ("created_at", "id_source"), cursor, limit, descending=True
+        )
+        return [
+            {
+                "id_source": r["id_source"],
+                "nom_fichier": r["nom_fichier"],
+                "created_at": r["created_at"].isoformat()
+            }
+            for r in rows
+        ]
+    except (PoolTimeout, InvalidCursor):
+        raise
     except Exception as e:
         import traceback
         print("Erreur dans /fichiers :", e)
@@ -50,108 +220,264 @@ def get_fichiers():
 
 # ----------- ROUTE 2 : /dataset ----------- #
 
+DATASET_QUERY = """
+    SELECT qa.id_qa, qa.question, qa.réponse as response
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON qa.id_chunk = c.id_chunk
+"""
+DATASET_EXPORT_QUERY = """
+    SELECT qa.question, qa.réponse as response
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON qa.id_chunk = c.id_chunk
+"""
+
+
+def qa_filters(since, id_source, min_tokens, max_tokens):
+    return list_filters(since, id_source, min_tokens, max_tokens,
+                        created="qa.created_at", source="c.id_source", tokens="c.nombre_tokens")
+
+
 @app.get("/dataset", response_model=List[DatasetItem], summary="Dataset Q/R", tags=["Dataset"])
-def get_dataset():
-    """Retourne toutes les paires question/réponse en les joignant avec leurs chunks et fichiers d'origine."""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("SELECT question, réponse as response FROM aide_ligne_qa;")
-            return cur.fetchall()
-            # return [{"question": row["question"],"context":row[' "response": row["réponse"]} for row in rows]
+async def get_dataset(response: Response, format: str = FORMAT, fast: bool = FAST, limit: Optional[int] = LIMIT,
+                cursor: Optional[str] = CURSOR, since: Optional[datetime] = SINCE,
+                id_source: Optional[int] = None, min_tokens: Optional[int] = None,
+                max_tokens: Optional[int] = None):
+    """Retourne toutes les paires question/réponse en les joignant avec leurs chunks et fichiers d'origine.
+
+    `format=jsonl` streame le dataset ligne par ligne (export pour le fine-tuning) ;
+    les filtres s'appliquent, `limit` est ignoré. `fast=true` fait sérialiser par PostgreSQL.
+    """
+    conditions, params = qa_filters(since, id_source, min_tokens, max_tokens)
+    if format == "jsonl" or fast:
+        query, params = page_query(DATASET_EXPORT_QUERY, conditions, params, ("qa.id_qa",), cursor)
+        return await export_response(query, params, format, fast)
+    return await fetch_page(response, DATASET_QUERY, conditions, params, ("qa.id_qa",), cursor, limit)
+
+
+FILE_RESPONSE_BLOCK = 1024 * 1024
+
+
+def file_response(path, media_type: str, filename: str) -> StreamingResponse:
+    """Envoie un fichier d'export ouvert tout de suite : s'il est supprimé pendant l'envoi
+    (version remplacée puis nettoyée), le descripteur ouvert reste lisible jusqu'à la fin."""
+    handle = open(path, "rb")
+    size = os.fstat(handle.fileno()).st_size
+
+    def blocks():
+        with handle:
+            while block := handle.read(FILE_RESPONSE_BLOCK):
+                yield block
+
+    return StreamingResponse(blocks(), media_type=media_type, headers={
+        "Content-Length": str(size),
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+
+
+EXPORT_MEDIA_TYPES = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.file"}
+
+
+@app.get("/dataset/export", summary="Export Parquet / Arrow", tags=["Dataset"])
+def export_dataset(format: str = Query("parquet", pattern="^(parquet|arrow)$")):
+    """Dataset complet (question, réponse, contexte, nb tokens, id_source, fichier) en Parquet ou Arrow IPC.
 
+    Le fichier est construit une fois par version du corpus puis servi tel quel.
+    """
+    version = corpus_version.peek()
+    path = export_path(version, format) if version is not None else None
+    if path is None or not path.exists():
+        path = build_export(format)
+    return file_response(path, EXPORT_MEDIA_TYPES[format], f"dataset{EXPORT_FORMATS[format]}")
+
+
+EMBEDDING_MEDIA_TYPES = {"npy": "application/octet-stream", "arrow": "application/vnd.apache.arrow.file"}
+
+
+@app.get("/embeddings", summary="Embeddings des chunks (.npy / Arrow)", tags=["Chunks"])
+def export_embeddings(format: str = Query("npy", pattern="^(npy|arrow)$")):
+    """Tous les embeddings des chunks (id_chunk, id_source, vecteur float32) en .npy structuré ou Arrow IPC.
+
+    Fichiers lisibles sans copie en mmap : `np.load(f, mmap_mode="r")["embedding"]`,
+    `pa.ipc.open_file(pa.memory_map(f))`. Construits une fois par version du corpus.
+    """
+    version = corpus_version.peek()
+    path = embeddings_path(version, format) if version is not None else None
+    if path is None or not path.exists():
+        path = build_embeddings(format)
+    return file_response(path, EMBEDDING_MEDIA_TYPES[format], f"embeddings{EMBEDDING_FORMATS[format]}")
 
 
 # ------------------ ROUTE 3 : /qa/{id} ------------------------ #
 
+QA_BY_FILE_QUERY = """
+    SELECT qa.id_qa, qa.question, qa.réponse, qa.id_chunk
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON c.id_chunk = qa.id_chunk
+    WHERE c.id_source = %s
+    ORDER BY qa.id_qa
+"""
+
+
 @app.get("/qa/{id}", response_model=List[QAItem], summary="Q/R par fichier", tags=["QA"])
-def get_qa_by_file_id(id: int):
+async def get_qa_by_file_id(id: int):
     """Retourne toutes les Q/R associées à un fichier spécifique (via id_source)."""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT qa.id_qa, qa.question, qa.réponse, qa.id_chunk
-                FROM aide_ligne_qa qa
-                JOIN aide_ligne_chunk c ON c.id_chunk = qa.id_chunk
-                WHERE c.id_source = %s
-		ORDER BY qa.id_qa;
-            """, (id,))
-            return cur.fetchall()
+    return await fetch_all(QA_BY_FILE_QUERY, (id,))
 
 # ------------------ ROUTE 4 : /fichier/{id} ------------------------ #
 
+CHUNKS_WITH_QA_QUERY = """
+    SELECT c.id_chunk, c.titre, c.contenu, c.page, c.nombre_tokens,
+        COALESCE(json_agg(json_build_object('question', q.question, 'réponse', q.réponse))
+            FILTER (WHERE q.id_qa IS NOT NULL), '[]') as questions_reponses
+    FROM aide_ligne_chunk c
+    LEFT JOIN aide_ligne_qa q ON c.id_chunk = q.id_chunk
+    WHERE c.id_source = %s
+    GROUP BY c.id_chunk, c.titre, c.contenu, c.page, c.nombre_tokens
+    ORDER BY c.page, c.id_chunk
+"""
+
+
 @app.get("/fichier/{id}", response_model=List[ChunkWithQA], summary="Chunks + Q/R", tags=["Chunks"])
-def get_chunks_with_qa_by_file_id(id: int):
+async def get_chunks_with_qa_by_file_id(id: int):
     """Retourne tous les chunks + Q/R associés à un fichier (id_source)."""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT c.id_chunk, c.titre, c.contenu, c.page, c.nombre_tokens,
-                    COALESCE(json_agg(json_build_object('question', q.question, 'réponse', q.réponse))
-                        FILTER (WHERE q.id_qa IS NOT NULL), '[]') as questions_reponses
-                FROM aide_ligne_chunk c
-                LEFT JOIN aide_ligne_qa q ON c.id_chunk = q.id_chunk
-                WHERE c.id_source = %s
-                GROUP BY c.id_chunk, c.titre, c.contenu, c.page, c.nombre_tokens
-                ORDER BY c.page, c.id_chunk;
-            """, (id,))
-            return cur.fetchall()
+    return await fetch_all(CHUNKS_WITH_QA_QUERY, (id,))
 
 # ------------------ ROUTE 5 : /chunks/{id} ------------------------ #
 
+CHUNKS_BY_FILE_QUERY = "SELECT id_chunk, titre, contenu, page, nombre_tokens, id_source FROM aide_ligne_chunk"
+
+
 @app.get("/chunks/{id}", response_model=List[ChunkOnly], summary="Chunks seuls", tags=["Chunks"])
-def get_chunks_by_file_id(id: int):
+async def get_chunks_by_file_id(id: int, response: Response, limit: Optional[int] = LIMIT,
+                          cursor: Optional[str] = CURSOR, since: Optional[datetime] = SINCE,
+                          min_tokens: Optional[int] = None, max_tokens: Optional[int] = None):
     """Retourne les chunks d'un fichier avec leurs métadonnées (titre, contenu, nb tokens, page...)."""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id_chunk, titre, contenu, page, nombre_tokens, id_source
-                FROM aide_ligne_chunk
-                WHERE id_source = %s;
-            """, (id,))
-            return cur.fetchall()
+    conditions, params = list_filters(since, id, min_tokens, max_tokens)
+    return await fetch_page(
+        response, CHUNKS_BY_FILE_QUERY,
+        conditions, params, ("id_chunk",), cursor, limit
+    )
 
 # ----------- ROUTE 6 : /qa ----------- #
 
+QA_CONTEXT_QUERY = """
+    SELECT qa.id_qa, qa.question, qa.réponse as response, c.contenu as context
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON qa.id_chunk = c.id_chunk
+"""
+QA_CONTEXT_EXPORT_QUERY = """
+    SELECT qa.question, qa.réponse as response, c.contenu as context
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON qa.id_chunk = c.id_chunk
+"""
+
+
 @app.get("/qa", response_model=List[QAWithChunkItem], summary="Q/R + Contexte", tags=["QA"])
-def get_qa_with_context():
-    """Retourne les questions, réponses, et contexte associé (chunk)"""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT qa.question, qa.réponse as response, c.contenu as context
-                FROM aide_ligne_qa qa
-                JOIN aide_ligne_chunk c ON qa.id_chunk = c.id_chunk;
-            """)
-            rows = cur.fetchall()
-            return [
-                {
-                    "question": r["question"],
-                    "response": r["response"],
-                    "context": r["context"]
-                }
-                for r in rows
-            ]
+async def get_qa_with_context(response: Response, format: str = FORMAT, fast: bool = FAST, limit: Optional[int] = LIMIT,
+                        cursor: Optional[str] = CURSOR, since: Optional[datetime] = SINCE,
+                        id_source: Optional[int] = None, min_tokens: Optional[int] = None,
+                        max_tokens: Optional[int] = None):
+    """Retourne les questions, réponses, et contexte associé (chunk)
+
+    `format=jsonl` streame le résultat ligne par ligne (filtres appliqués, `limit` ignoré).
+    `fast=true` fait sérialiser par PostgreSQL.
+    """
+    conditions, params = qa_filters(since, id_source, min_tokens, max_tokens)
+    if format == "jsonl" or fast:
+        query, params = page_query(QA_CONTEXT_EXPORT_QUERY, conditions, params, ("qa.id_qa",), cursor)
+        return await export_response(query, params, format, fast)
+    rows = await fetch_page(response, QA_CONTEXT_QUERY, conditions, params, ("qa.id_qa",), cursor, limit)
+    return [
+        {
+            "question": r["question"],
+            "response": r["response"],
+            "context": r["context"]
+        }
+        for r in rows
+    ]
 
 
 # ----------- ROUTE 7 : /chunks ----------- #
 
+CHUNKS_QUERY = "SELECT id_chunk, contenu, page, id_source FROM aide_ligne_chunk"
+
+
 @app.get("/chunks", response_model=List[ChunkItem], summary="Chunks disponibles", tags=["Chunks"])
-def get_chunks():
+async def get_chunks(response: Response, fast: bool = FAST, limit: Optional[int] = LIMIT, cursor: Optional[str] = CURSOR,
+               since: Optional[datetime] = SINCE, id_source: Optional[int] = None,
+               min_tokens: Optional[int] = None, max_tokens: Optional[int] = None):
     """Retourne tous les chunks présents en base avec leur contenu et métadonné.es"""
-    with get_connection() as conn:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id_chunk, contenu, page, id_source
-                FROM aide_ligne_chunk;
-            """)
-            rows = cur.fetchall()
-            return [
-                {
-                    "id_chunk": r["id_chunk"],
-                    "contenu": r["contenu"],
-                    "page": r["page"],
-                    "id_source": r["id_source"]
-                }
-                for r in rows
-            ]
+    conditions, params = list_filters(since, id_source, min_tokens, max_tokens)
+    if fast:
+        return await postgres_json_response(*page_query(CHUNKS_QUERY, conditions, params, ("id_chunk",), cursor))
+    rows = await fetch_page(
+        response, CHUNKS_QUERY,
+        conditions, params, ("id_chunk",), cursor, limit
+    )
+    return [
+        {
+            "id_chunk": r["id_chunk"],
+            "contenu": r["contenu"],
+            "page": r["page"],
+            "id_source": r["id_source"]
+        }
+        for r in rows
+    ]
+
+
+# ----------- ROUTE 8 : /search ----------- #
+
+SEARCH_HITS = {
+    "chunk": """
+        SELECT 'chunk' AS type, c.id_chunk AS id, c.id_source, c.titre, c.contenu AS texte,
+               ts_rank_cd(c.search_vector, q.query)::float8 AS rank
+        FROM aide_ligne_chunk c, q
+        WHERE c.search_vector @@ q.query
+    """,
+    "qa": """
+        SELECT 'qa' AS type, qa.id_qa AS id, c.id_source, qa.question AS titre,
+               qa.question || ' ' || qa.réponse AS texte,
+               ts_rank_cd(qa.search_vector, q.query)::float8 AS rank
+        FROM aide_ligne_qa qa
+        JOIN aide_ligne_chunk c ON c.id_chunk = qa.id_chunk, q
+        WHERE qa.search_vector @@ q.query
+    """,
+}
+SEARCH_KEY = ("rank", "type", "id")
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MinWords=15, MaxWords=35, MaxFragments=2"
+
+
+def search_query(q, type="all", id_source=None, cursor=None, limit=20):
+    """Requête d'une page de résultats : (sql, paramètres)."""
+    hits = [SEARCH_HITS[t] for t in (("chunk", "qa") if type == "all" else (type,))]
+    conditions, params = list_filters(id_source=id_source)
+    page, params = page_query(
+        "SELECT * FROM (" + " UNION ALL ".join(hits) + ") hits",
+        conditions, params, SEARCH_KEY, cursor, limit, descending=True
+    )
+    sql = f"""
+        WITH q AS (SELECT websearch_to_tsquery('french', %s) AS query)
+        SELECT page.type, page.id, page.id_source, page.titre, page.rank,
+               ts_headline('french', page.texte, q.query, '{HEADLINE_OPTIONS}') AS extrait
+        FROM ({page}) page, q
+        ORDER BY page.rank DESC, page.type DESC, page.id DESC
+    """
+    return sql, [q] + params
+
+
+@app.get("/search", response_model=List[SearchHit], summary="Recherche plein texte", tags=["Recherche"])
+async def search(response: Response,
+           q: str = Query(..., min_length=1, description='Texte recherché (syntaxe web : "expression exacte", -exclu, or)'),
+           type: str = Query("all", pattern="^(all|chunk|qa)$"), id_source: Optional[int] = None,
+           limit: int = Query(20, ge=1, le=100), cursor: Optional[str] = CURSOR):
+    """Recherche en français dans les chunks et les Q/R, résultats classés avec extraits surlignés.
 
+    Pagination par X-Next-Cursor comme les listes. Les extraits (ts_headline, coûteux)
+    ne sont calculés que pour les lignes de la page.
+    """
+    sql, params = search_query(q, type, id_source, cursor, limit)
+    rows = await fetch_all(sql, params)
+    rows, next_cursor = split_page(rows, limit, SEARCH_KEY)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
@@ -0,0 +1,156 @@
+# Export colonne du dataset de fine-tuning (Parquet compressé ou fichier Arrow IPC),
+# construit par lots depuis un curseur serveur, sans passer par JSON. Le fichier est
+# gardé sur disque par version du corpus : tant qu'elle ne change pas, un
+# téléchargement n'est qu'un envoi de fichier.
+#
+#     python export_dataset.py --format parquet -o dataset.parquet
+import argparse
+import os
+import threading
+import uuid
+from pathlib import Path
+
+import psycopg2.extensions
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from db import get_pool
+
+EXPORT_DIR = Path(os.getenv("EXPORT_DIR", "/tmp/etl_exports"))
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "50000"))  # lignes par lot = par row group Parquet
+
+EXPORT_QUERY = """
+    SELECT qa.question, qa.réponse AS response, c.contenu AS context,
+           c.nombre_tokens, c.id_source, f.nom_fichier
+    FROM aide_ligne_qa qa
+    JOIN aide_ligne_chunk c ON c.id_chunk = qa.id_chunk
+    JOIN aide_ligne_fichier f ON f.id_source = c.id_source
+    ORDER BY qa.id_qa
+"""
+
+SCHEMA = pa.schema([
+    ("question", pa.string()),
+    ("response", pa.string()),
+    ("context", pa.string()),
+    ("nombre_tokens", pa.int32()),
+    ("id_source", pa.int32()),
+    ("nom_fichier", pa.string()),
+])
+
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+
+def versioned_path(name: str, version: int, extension: str, directory: Path = None) -> Path:
+    return (directory or EXPORT_DIR) / f"{name}_v{version}{extension}"
+
+
+def export_path(version: int, format: str, directory: Path = None) -> Path:
+    return versioned_path("dataset", version, EXPORT_FORMATS[format], directory)
+
+
+def _writer(path: Path, format: str):
+    if format == "parquet":
+        return pq.ParquetWriter(path, SCHEMA, compression="zstd")
+    # fichier IPC non compressé : lisible en mmap (pa.memory_map + pa.ipc.open_file) sans copie
+    return pa.ipc.new_file(path, SCHEMA)
+
+
+def write_export(conn, path: Path, format: str, batch_size: int = None) -> int:
+    """Écrit le dataset dans `path` par lots de lignes ; retourne le nombre de lignes."""
+    batch_size = batch_size or EXPORT_BATCH
+    rows_written = 0
+    # curseur tuple : pas de dict par ligne, les colonnes sont obtenues par zip(*lignes)
+    with conn.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor) as cur, \
+            _writer(path, format) as writer:
+        cur.itersize = batch_size
+        cur.execute(EXPORT_QUERY)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), SCHEMA)]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=SCHEMA))
+            rows_written += len(rows)
+    return rows_written
+
+
+def build_export(format: str, directory: Path = None) -> Path:
+    """Fichier d'export de la version courante du corpus, construit s'il n'existe pas encore."""
+    return build_versioned_file("dataset", EXPORT_FORMATS[format],
+                                lambda conn, path: write_export(conn, path, format), directory)
+
+
+def begin_snapshot(conn):
+    """Ouvre la transaction de `conn` en REPEATABLE READ : toutes ses requêtes voient le même instantané."""
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+
+
+def build_versioned_file(name: str, extension: str, write, directory: Path = None) -> Path:
+    """Fichier `name` de la version courante du corpus, écrit par `write(conn, chemin)` s'il n'existe pas.
+
+    Les fichiers `name` des versions antérieures à la précédente sont supprimés (prune_exports).
+    """
+    directory = directory or EXPORT_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    with get_pool().connection() as conn:
+        begin_snapshot(conn)  # même instantané pour la version et les données exportées
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM corpus_version")
+            version = cur.fetchone()["version"]
+        path = versioned_path(name, version, extension, directory)
+        if path.exists():
+            return path
+
+        with _build_locks_guard:
+            lock = _build_locks.setdefault(path, threading.Lock())
+        with lock:  # deux téléchargements simultanés ne construisent pas deux fois le fichier
+            if not path.exists():
+                tmp_path = directory / f".{path.name}.{uuid.uuid4().hex}.part"
+                try:
+                    write(conn, tmp_path)
+                    os.replace(tmp_path, path)  # atomique : jamais de fichier à moitié écrit servi
+                finally:
+                    if tmp_path.exists():
+                        tmp_path.unlink()
+                prune_exports(directory, keep=version, name=name)
+    return path
+
+
+def prune_exports(directory: Path, keep: int, name: str = "dataset"):
+    """Supprime les exports `name` antérieurs à `keep`, sauf la version juste avant (copie de grâce).
+
+    Les versions plus récentes ne sont jamais touchées : un constructeur dont
+    l'instantané a vu une version N peut finir après celui de la version N+1.
+    """
+    prefix = f"{name}_v"
+    by_version = {}
+    for path in directory.glob(f"{prefix}*"):
+        version = path.name[len(prefix):].split(".")[0]
+        if version.isdigit():
+            by_version.setdefault(int(version), []).append(path)
+    older = sorted(version for version in by_version if version < keep)
+    for version in older[:-1]:
+        for path in by_version[version]:
+            path.unlink(missing_ok=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export du dataset Q/R en Parquet ou Arrow IPC")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("-o", "--output", type=Path, help="fichier de sortie (sinon : cache EXPORT_DIR)")
+    args = parser.parse_args()
+
+    if args.output is None:
+        print(build_export(args.format))
+        return
+    with get_pool().connection() as conn:
+        begin_snapshot(conn)
+        rows = write_export(conn, args.output, args.format)
+    print(f"{rows} lignes écrites dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# Export binaire des embeddings des chunks (table aide_ligne_chunk_embedding, remplie
+# par le watchdog) : les vecteurs float32 sont recopiés octet pour octet depuis la base,
+# sans décodage. Même cache que l'export du dataset : un fichier par version du corpus.
+#  - .npy : tableau structuré (id_chunk, id_source, embedding[dimension]), à ouvrir
+#    sans copie avec np.load(chemin, mmap_mode="r") ;
+#  - .arrow : fichier IPC (id_chunk, id_source, embedding en fixed_size_list<float32>),
+#    à ouvrir sans copie avec pa.ipc.open_file(pa.memory_map(chemin)).
+#
+#     python export_embeddings.py --format npy -o embeddings.npy
+import argparse
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import psycopg2.extensions
+import pyarrow as pa
+
+from db import get_pool
+from export_dataset import EXPORT_BATCH, begin_snapshot, build_versioned_file, versioned_path
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-mpnet-base-v2")
+EMBEDDING_FORMATS = {"npy": ".npy", "arrow": ".arrow"}
+
+EMBEDDINGS_SIZE_QUERY = """
+    SELECT count(*), min(dimension), max(dimension)
+    FROM aide_ligne_chunk_embedding
+    WHERE modele = %s
+"""
+
+EMBEDDINGS_QUERY = """
+    SELECT e.id_chunk, c.id_source, e.vecteur
+    FROM aide_ligne_chunk_embedding e
+    JOIN aide_ligne_chunk c ON c.id_chunk = e.id_chunk
+    WHERE e.modele = %s
+    ORDER BY e.id_chunk
+"""
+
+
+def embeddings_path(version: int, format: str, directory: Path = None) -> Path:
+    return versioned_path("embeddings", version, EMBEDDING_FORMATS[format], directory)
+
+
+def npy_dtype(dimension: int) -> np.dtype:
+    return np.dtype([("id_chunk", "<i4"), ("id_source", "<i4"), ("embedding", "<f4", (dimension,))])
+
+
+def arrow_schema(dimension: int, model: str) -> pa.Schema:
+    return pa.schema([
+        ("id_chunk", pa.int32()),
+        ("id_source", pa.int32()),
+        ("embedding", pa.list_(pa.float32(), dimension)),
+    ], metadata={"modele": model})
+
+
+def _batches(conn, model: str, batch_size: int):
+    """(ids des chunks, ids des fichiers, matrice float32) par lots, depuis un curseur serveur."""
+    with conn.cursor(name=f"embeddings_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.itersize = batch_size
+        cur.execute(EMBEDDINGS_QUERY, (model,))
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            id_chunks, id_sources, vectors = zip(*rows)
+            # octets bruts concaténés puis vus comme float32 : aucun float Python créé
+            yield id_chunks, id_sources, np.frombuffer(b"".join(vectors), dtype="<f4")
+
+
+def write_embeddings(conn, path: Path, format: str, model: str = None, batch_size: int = None) -> int:
+    """Écrit les embeddings de `model` dans `path` ; retourne le nombre de vecteurs.
+
+    Le comptage et la lecture des lignes doivent voir le même instantané
+    (transaction ouverte par begin_snapshot) : le .npy est dimensionné d'après le comptage.
+    """
+    model = model or EMBEDDING_MODEL
+    batch_size = batch_size or EXPORT_BATCH
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        cur.execute(EMBEDDINGS_SIZE_QUERY, (model,))
+        count, dimension, max_dimension = cur.fetchone()
+    if dimension != max_dimension:
+        raise ValueError(f"Embeddings {model} de dimensions différentes ({dimension} et {max_dimension})")
+    dimension = dimension or 0
+
+    if format == "npy":
+        # en-tête .npy écrit d'après le nombre de lignes, puis remplissage par lots en mmap
+        array = np.lib.format.open_memmap(path, mode="w+", dtype=npy_dtype(dimension), shape=(count,))
+        start = 0
+        for id_chunks, id_sources, flat in _batches(conn, model, batch_size):
+            end = start + len(id_chunks)
+            if end > count:
+                raise RuntimeError(f"Plus d'embeddings lus que comptés ({count}) : lecture hors instantané")
+            array["id_chunk"][start:end] = id_chunks
+            array["id_source"][start:end] = id_sources
+            array["embedding"][start:end] = flat.reshape(-1, dimension)
+            start = end
+        if start != count:
+            raise RuntimeError(f"{start} embeddings lus pour {count} comptés : lecture hors instantané")
+        array.flush()
+        del array
+        return count
+
+    schema = arrow_schema(dimension, model)
+    with pa.ipc.new_file(path, schema) as writer:
+        for id_chunks, id_sources, flat in _batches(conn, model, batch_size):
+            writer.write_batch(pa.RecordBatch.from_arrays([
+                pa.array(id_chunks, type=pa.int32()),
+                pa.array(id_sources, type=pa.int32()),
+                pa.FixedSizeListArray.from_arrays(pa.array(flat), dimension),
+            ], schema=schema))
+    return count
+
+
+def build_embeddings(format: str, directory: Path = None) -> Path:
+    """Fichier d'embeddings de la version courante du corpus, construit s'il n'existe pas encore."""
+    return build_versioned_file("embeddings", EMBEDDING_FORMATS[format],
+                                lambda conn, path: write_embeddings(conn, path, format), directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export des embeddings des chunks en .npy ou Arrow IPC")
+    parser.add_argument("--format", choices=sorted(EMBEDDING_FORMATS), default="npy")
+    parser.add_argument("-o", "--output", type=Path, help="fichier de sortie (sinon : cache EXPORT_DIR)")
+    args = parser.parse_args()
+
+    if args.output is None:
+        print(build_embeddings(args.format))
+        return
+    with get_pool().connection() as conn:
+        begin_snapshot(conn)  # comptage et lignes du même instantané
+        rows = write_embeddings(conn, args.output, args.format)
+    print(f"{rows} embeddings écrits dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -55,3 +55,13 @@ class ChunkItem(BaseModel):
     contenu: str
     page: Optional[int] = None
     id_source: int
+
+# route /search
+
+class SearchHit(BaseModel):
+    type: str  # "chunk" ou "qa"
+    id: int  # id_chunk ou id_qa
+    id_source: int
+    titre: Optional[str] = None  # titre du chunk ou question
+    extrait: str  # passage avec les termes trouvés entre <mark></mark>
+    rank: float
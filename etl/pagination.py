@@ -0,0 +1,62 @@
+# Pagination par clé (keyset) des listes de l'API ETL : la page suivante repart
+# de la dernière clé vue (`WHERE (clé) > (dernière valeur)`) au lieu d'un OFFSET,
+# le coût d'une page reste donc le même à la page 1 et à la page 10 000.
+import base64
+import binascii
+import json
+import os
+from typing import List, Optional, Sequence
+
+PAGE_MAX = int(os.getenv("PAGE_MAX", "1000"))
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou ne correspondant pas à la route."""
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Curseur opaque : la clé de la dernière ligne, en JSON encodé base64 url-safe."""
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor("Curseur invalide") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Curseur invalide")
+    return values
+
+
+def page_query(select: str, conditions: List[str], params: list, key: Sequence[str],
+               cursor: Optional[str] = None, limit: Optional[int] = None, descending: bool = False):
+    """Complète `select` avec les filtres, la reprise après `cursor`, le tri sur `key` et la limite.
+
+    Une ligne de plus que `limit` est demandée : sa présence indique qu'il existe une page suivante.
+    """
+    conditions, params = list(conditions), list(params)
+    if cursor:
+        values = decode_cursor(cursor, len(key))
+        placeholders = ", ".join(["%s"] * len(values))
+        conditions.append(f"({', '.join(key)}) {'<' if descending else '>'} ({placeholders})")
+        params.extend(values)
+    sql = select
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY " + ", ".join(f"{column} {'DESC' if descending else 'ASC'}" for column in key)
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit + 1)
+    return sql, params
+
+
+def split_page(rows: list, limit: Optional[int], key: Sequence[str]):
+    """Retourne (lignes de la page, curseur de la page suivante ou None)."""
+    if not limit or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor([last[column.split(".")[-1]] for column in key])
@@ -0,0 +1,119 @@
+# Cache HTTP des lectures de l'API ETL, indexé sur la version du corpus :
+# les données ne changent qu'à l'ingestion ou la suppression d'un PDF, une réponse
+# reste donc valable tant que la version n'a pas bougé.
+#  - ETag = version du corpus : If-None-Match identique -> 304 sans requête SQL ;
+#  - sinon, réponse rejouée depuis la mémoire si elle a été calculée à la même version.
+import os
+from collections import OrderedDict
+
+from prometheus_client import Counter
+from starlette.concurrency import run_in_threadpool
+
+from corpus_version import corpus_version as default_corpus_version
+
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "256"))
+RESPONSE_CACHE_MAX_BODY = int(os.getenv("RESPONSE_CACHE_MAX_BODY", str(8 * 1024 * 1024)))  # octets
+
+CACHE_HITS = Counter("etl_response_cache_hits_total", "Réponses servies depuis le cache mémoire")
+CACHE_MISSES = Counter("etl_response_cache_misses_total", "Réponses calculées (absentes du cache ou périmées)")
+NOT_MODIFIED = Counter("etl_not_modified_total", "Réponses 304 (If-None-Match à jour)")
+
+EXCLUDED_PATHS = ("/metrics", "/docs", "/redoc", "/openapi.json")
+
+
+def etag_matches(header: bytes, etag: bytes) -> bool:
+    for candidate in header.split(b","):
+        candidate = candidate.strip()
+        if candidate == b"*" or candidate.removeprefix(b"W/") == etag:
+            return True
+    return False
+
+
+class ResponseCacheMiddleware:
+    """Middleware ASGI : ETag sur les GET, 304 et cache LRU des réponses 200 de la version courante."""
+
+    def __init__(self, app, version=None, max_entries: int = RESPONSE_CACHE_ENTRIES,
+                 max_body: int = RESPONSE_CACHE_MAX_BODY):
+        self.app = app
+        self.version = version or default_corpus_version
+        self.max_entries = max_entries
+        self.max_body = max_body
+        self.cache_version = None
+        self._entries = OrderedDict()  # (chemin, query string) -> (statut, en-têtes, corps)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _get(self, key, version):
+        if version != self.cache_version:
+            # nouvelle version du corpus : tout le cache est périmé
+            self._entries.clear()
+            self.cache_version = version
+            return None
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _set(self, key, version, entry):
+        if version != self.cache_version:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or scope["path"].startswith(EXCLUDED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        version = self.version.peek()
+        if version is None:
+            try:
+                version = await run_in_threadpool(self.version.get)
+            except Exception:
+                # version illisible : on sert la requête normalement, sans cache
+                await self.app(scope, receive, send)
+                return
+
+        etag = b'"c%d"' % version
+        validators = [(b"etag", etag), (b"cache-control", b"no-cache")]
+        if_none_match = dict(scope["headers"]).get(b"if-none-match")
+        if if_none_match and etag_matches(if_none_match, etag):
+            NOT_MODIFIED.inc()
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        key = (scope["path"], scope["query_string"])
+        entry = self._get(key, version)
+        if entry is not None:
+            CACHE_HITS.inc()
+            status, headers, body = entry
+            await send({"type": "http.response.start", "status": status, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        CACHE_MISSES.inc()
+        captured = {"cacheable": False, "size": 0, "body": []}
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start":
+                headers = [(k, v) for k, v in message.get("headers", []) if k.lower() not in (b"etag", b"cache-control")]
+                headers += validators
+                message = {**message, "headers": headers}
+                captured.update(cacheable=message["status"] == 200, status=message["status"], headers=headers)
+            elif message["type"] == "http.response.body" and captured["cacheable"]:
+                body = message.get("body", b"")
+                captured["size"] += len(body)
+                if captured["size"] > self.max_body:
+                    # trop gros (export JSONL complet...) : transmis sans être gardé
+                    captured.update(cacheable=False, body=[])
+                else:
+                    captured["body"].append(body)
+                    if not message.get("more_body", False):
+                        self._set(key, version, (captured["status"], captured["headers"], b"".join(captured["body"])))
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
@@ -0,0 +1,110 @@
+"""Non-régression des plans d'exécution des requêtes de l'API ETL.
+
+Un corpus volumineux est inséré dans une transaction annulée à la fin du module :
+chaque requête doit passer par un index (aucun parcours séquentiel des grosses
+tables) et rester sous son budget de temps (EXPLAIN ANALYZE).
+"""
+import json
+
+import pytest
+
+import db
+import etl_api
+from pagination import encode_cursor, page_query
+
+FICHIERS = 2000
+CHUNKS_PAR_FICHIER = 20
+QA_PAR_CHUNK = 2
+BUDGET_MS = 50
+
+
+@pytest.fixture(scope="module")
+def cur():
+    conn = db.connect()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO aide_ligne_fichier (nom_fichier)
+        SELECT 'plan_' || n || '.pdf' FROM generate_series(1, %s) n
+    """, (FICHIERS,))
+    cur.execute("""
+        INSERT INTO aide_ligne_chunk (titre, contenu, id_source, page, nombre_tokens)
+        SELECT 'titre', repeat('contenu ', 50) || 'procédure ' || f.id_source, f.id_source, p, 10 + p
+        FROM aide_ligne_fichier f, generate_series(1, %s) p
+        WHERE f.nom_fichier LIKE 'plan\\_%%'
+    """, (CHUNKS_PAR_FICHIER,))
+    cur.execute("""
+        INSERT INTO aide_ligne_qa (question, réponse, id_chunk)
+        SELECT 'question ' || n, 'réponse ' || n, c.id_chunk
+        FROM aide_ligne_chunk c
+        JOIN aide_ligne_fichier f ON f.id_source = c.id_source AND f.nom_fichier LIKE 'plan\\_%%',
+        generate_series(1, %s) n
+    """, (QA_PAR_CHUNK,))
+    cur.execute("ANALYZE aide_ligne_fichier, aide_ligne_chunk, aide_ligne_qa")
+    cur.execute("SELECT id_source FROM aide_ligne_fichier WHERE nom_fichier = %s", (f"plan_{FICHIERS // 2}.pdf",))
+    cur.id_source = cur.fetchone()["id_source"]
+    cur.execute("SELECT (SELECT max(id_chunk) FROM aide_ligne_chunk) AS c, (SELECT max(id_qa) FROM aide_ligne_qa) AS q")
+    cur.max_ids = cur.fetchone()
+    yield cur
+    conn.rollback()
+    conn.close()
+
+
+def explain(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+    row = cur.fetchone()
+    return row["QUERY PLAN"][0] if isinstance(row["QUERY PLAN"], list) else json.loads(row["QUERY PLAN"])[0]
+
+
+def scanned(node):
+    """(type de nœud, table) de tous les nœuds du plan."""
+    yield node["Node Type"], node.get("Relation Name")
+    for child in node.get("Plans", []):
+        yield from scanned(child)
+
+
+def assert_indexed(cur, sql, params):
+    plan = explain(cur, sql, params)
+    seq = [table for kind, table in scanned(plan["Plan"])
+           if kind == "Seq Scan" and table in ("aide_ligne_chunk", "aide_ligne_qa", "aide_ligne_fichier")]
+    assert not seq, f"parcours séquentiel de {seq}"
+    assert plan["Execution Time"] < BUDGET_MS, f"{plan['Execution Time']:.1f}ms > {BUDGET_MS}ms"
+
+
+def test_qa_by_file(cur):
+    assert_indexed(cur, etl_api.QA_BY_FILE_QUERY, (cur.id_source,))
+
+
+def test_chunks_with_qa_by_file(cur):
+    assert_indexed(cur, etl_api.CHUNKS_WITH_QA_QUERY, (cur.id_source,))
+
+
+def test_chunks_by_file_page(cur):
+    sql, params = page_query(etl_api.CHUNKS_BY_FILE_QUERY, ["id_source = %s"], [cur.id_source],
+                             ("id_chunk",), limit=100)
+    assert_indexed(cur, sql, params)
+
+
+def test_deep_keyset_pages(cur):
+    deep_chunk = encode_cursor([cur.max_ids["c"] - 150])
+    assert_indexed(cur, *page_query(etl_api.CHUNKS_QUERY, [], [], ("id_chunk",), deep_chunk, 100))
+    deep_qa = encode_cursor([cur.max_ids["q"] - 150])
+    assert_indexed(cur, *page_query(etl_api.QA_CONTEXT_QUERY, [], [], ("qa.id_qa",), deep_qa, 100))
+
+    cur.execute("SELECT created_at, id_source FROM aide_ligne_fichier ORDER BY id_source LIMIT 1 OFFSET 150")
+    row = cur.fetchone()
+    deep_file = encode_cursor([row["created_at"], row["id_source"]])
+    assert_indexed(cur, *page_query(etl_api.FICHIERS_QUERY, [], [], ("created_at", "id_source"),
+                                    deep_file, 100, descending=True))
+
+
+def test_cascade_delete(cur):
+    # suppression d'un PDF par le watchdog : cascade sur ses chunks puis leurs Q/R
+    cur.execute("SAVEPOINT cascade")
+    plan = explain(cur, "DELETE FROM aide_ligne_fichier WHERE id_source = %s", (cur.id_source,))
+    cur.execute("ROLLBACK TO SAVEPOINT cascade")
+    assert plan["Execution Time"] < BUDGET_MS, f"{plan['Execution Time']:.1f}ms > {BUDGET_MS}ms"
+
+
+def test_full_text_search(cur):
+    # GIN sur les deux tables ; extraits calculés pour la seule page renvoyée
+    assert_indexed(cur, *etl_api.search_query(f"procédure {cur.id_source}", limit=20))
@@ -0,0 +1,93 @@
+# Migrations versionnées du schéma PostgreSQL, partagées par l'API ETL et le watchdog.
+# Chaque fichier sql/NNNN_nom.sql est appliqué une seule fois, dans l'ordre, dans sa
+# propre transaction ; la table schema_migrations garde la trace des versions appliquées.
+#
+#     python -m migrations.migrate          (variables POSTGRES_*)
+import logging
+import os
+import re
+from pathlib import Path
+
+import psycopg2
+
+SQL_DIR = Path(__file__).resolve().parent / "sql"
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+# verrou consultatif : les deux services peuvent démarrer en même temps
+LOCK_ID = 4242
+
+logger = logging.getLogger(__name__)
+
+
+def available_migrations():
+    """(version, nom, chemin) des fichiers SQL, triés par version."""
+    found = []
+    for path in SQL_DIR.iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            found.append((int(match.group(1)), match.group(2), path))
+    return sorted(found)
+
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            nom TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def pending_migrations(conn):
+    # curseur tuple explicite : l'API ETL passe des connexions en RealDictCursor
+    with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as cur:
+        _ensure_table(cur)
+        cur.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return [m for m in available_migrations() if m[0] not in applied]
+
+
+def migrate(conn):
+    """Applique les migrations manquantes ; retourne les versions appliquées."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+    conn.commit()
+    applied = []
+    try:
+        for version, name, path in pending_migrations(conn):
+            with conn.cursor() as cur:
+                cur.execute(path.read_text(encoding="utf-8"))
+                cur.execute("INSERT INTO schema_migrations (version, nom) VALUES (%s, %s)", (version, name))
+            conn.commit()
+            applied.append(version)
+            logger.info(f"Migration {version:04d}_{name} appliquée")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+        conn.commit()
+    return applied
+
+
+def connect():
+    return psycopg2.connect(
+        dbname=os.environ.get("POSTGRES_DB", "etl_db"),
+        user=os.environ["POSTGRES_USER"],
+        password=os.environ["POSTGRES_PASSWORD"],
+        host=os.environ.get("POSTGRES_HOST", "db"),
+        port="5432",
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    conn = connect()
+    try:
+        versions = migrate(conn)
+        print(f"{len(versions)} migration(s) appliquée(s)" if versions else "Schéma à jour")
+    finally:
+        conn.close()
@@ -0,0 +1,12 @@
+-- Index des clés étrangères : PostgreSQL n'en crée pas automatiquement.
+-- Sans eux, /qa/{id}, /fichier/{id}, /chunks/{id} et chaque ON DELETE CASCADE
+-- (suppression d'un PDF) parcourent les tables entières.
+
+-- Chunks d'un fichier, triés comme /fichier/{id} (page, id_chunk)
+CREATE INDEX IF NOT EXISTS idx_chunk_id_source ON aide_ligne_chunk (id_source, page, id_chunk);
+
+-- Q/R d'un chunk (jointures et cascade depuis aide_ligne_chunk)
+CREATE INDEX IF NOT EXISTS idx_qa_id_chunk ON aide_ligne_qa (id_chunk);
+
+-- Pagination keyset de /fichiers (tri created_at DESC, id_source DESC)
+CREATE INDEX IF NOT EXISTS idx_fichier_created_at ON aide_ligne_fichier (created_at DESC, id_source DESC);
@@ -0,0 +1,32 @@
+-- Version du corpus : compteur croissant incrémenté à chaque écriture sur les tables
+-- du corpus (ingestion ou suppression d'un PDF par le watchdog, cascades comprises).
+-- L'API ETL s'en sert pour ses ETag et son cache de réponses ; chaque nouvelle
+-- version est publiée par NOTIFY sur le canal corpus_version, à la validation.
+
+CREATE TABLE IF NOT EXISTS corpus_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- une seule ligne
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO corpus_version (id) VALUES (TRUE) ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_corpus_version() RETURNS trigger AS $$
+DECLARE
+    new_version BIGINT;
+BEGIN
+    UPDATE corpus_version
+    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+    RETURNING version INTO new_version;
+    PERFORM pg_notify('corpus_version', new_version::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- par instruction (pas par ligne) : une insertion en masse ne coûte qu'une incrémentation
+CREATE TRIGGER fichier_corpus_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON aide_ligne_fichier
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+CREATE TRIGGER chunk_corpus_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON aide_ligne_chunk
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
+CREATE TRIGGER qa_corpus_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON aide_ligne_qa
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
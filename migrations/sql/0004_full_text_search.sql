@@ -0,0 +1,19 @@
+-- Recherche plein texte en français (route /search de l'API ETL).
+-- Colonnes générées : PostgreSQL recalcule le vecteur de chaque ligne insérée ou
+-- modifiée, rien à maintenir côté watchdog. Titre / question pèsent plus (poids A)
+-- que le contenu / la réponse (poids B) dans le classement.
+
+ALTER TABLE aide_ligne_chunk ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('french', coalesce(titre, '')), 'A') ||
+        setweight(to_tsvector('french', contenu), 'B')
+    ) STORED;
+
+ALTER TABLE aide_ligne_qa ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('french', question), 'A') ||
+        setweight(to_tsvector('french', réponse), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_chunk_search ON aide_ligne_chunk USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_qa_search ON aide_ligne_qa USING GIN (search_vector);
@@ -0,0 +1,17 @@
+-- Embeddings des chunks, calculés par le watchdog à l'ingestion (même encodeur que le
+-- chunker sémantique). Vecteur stocké en float32 little-endian brut (bytea de
+-- 4 * dimension octets) : l'API ETL le recopie tel quel dans ses exports .npy / Arrow.
+-- Table à part : les lectures des chunks ne chargent pas les vecteurs.
+
+CREATE TABLE IF NOT EXISTS aide_ligne_chunk_embedding (
+    id_chunk INTEGER PRIMARY KEY REFERENCES aide_ligne_chunk(id_chunk) ON DELETE CASCADE,
+    modele TEXT NOT NULL,
+    dimension INTEGER NOT NULL CHECK (dimension > 0),
+    vecteur BYTEA NOT NULL CHECK (octet_length(vecteur) = 4 * dimension),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_chunk_embedding_modele ON aide_ligne_chunk_embedding (modele, id_chunk);
+
+CREATE TRIGGER chunk_embedding_corpus_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON aide_ligne_chunk_embedding
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_version();
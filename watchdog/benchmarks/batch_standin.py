@@ -0,0 +1,84 @@
+"""Remplaçant local de l'API Batch d'OpenAI : fichier de requêtes JSONL -> fichier de résultats JSONL.
+
+Même format que l'API (une ligne {"id", "custom_id", "response": {"status_code", "body"}, "error"}
+par requête, dans un ordre quelconque), pour tester de bout en bout le mode lot des Q/R :
+
+    python pipeline_etl.py --batch-requests /app/resultat_extraction/batch/backlog.jsonl
+    python benchmarks/batch_standin.py /app/resultat_extraction/batch/backlog.jsonl results.jsonl
+    python pipeline_etl.py --merge-batch results.jsonl
+
+Par défaut les réponses sont fabriquées hors ligne (n Q/R déterministes tirées du
+contenu du chunk) ; `--llm` envoie chaque requête à l'API interactive via llm_dispatch
+(appels concurrents sous budget), utile si l'API Batch n'est pas disponible.
+`--fail` fait échouer une requête sur N, pour vérifier qu'elles restent à refaire.
+"""
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import llm_dispatch  # noqa: E402
+
+
+def offline_answer(body):
+    """Réponse au format demandé par le prompt : {"question i": {question: réponse}} pour n questions."""
+    prompt = body["messages"][-1]["content"]
+    n = int(re.search(r"Génère (\d+) questions", prompt).group(1))
+    content = prompt.split("\n\n", 1)[-1]
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", content) if s.strip()] or [content]
+    return json.dumps({
+        f"question {i}": {f"Que dit la documentation ({i}) ?": sentences[(i - 1) % len(sentences)]}
+        for i in range(1, n + 1)
+    }, ensure_ascii=False)
+
+
+def completion(body, content):
+    tokens = sum(len(m["content"]) for m in body["messages"]) // 4
+    return {
+        "id": "chatcmpl-local", "object": "chat.completion", "model": body["model"],
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": tokens, "completion_tokens": len(content) // 4,
+                  "total_tokens": tokens + len(content) // 4},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("requests", type=Path)
+    parser.add_argument("results", type=Path)
+    parser.add_argument("--llm", action="store_true", help="réponses de l'API interactive")
+    parser.add_argument("--fail", type=int, default=0, help="une requête sur N en erreur")
+    args = parser.parse_args()
+
+    with open(args.requests, "r", encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+
+    if args.llm:
+        from openai import OpenAI
+        client = OpenAI(max_retries=0)  # reprises par llm_dispatch seul
+
+        def answer(request):
+            response = llm_dispatch.dispatcher.call(client.chat.completions.create, **request["body"])
+            return response.model_dump()
+    else:
+        def answer(request):
+            return completion(request["body"], offline_answer(request["body"]))
+
+    bodies = llm_dispatch.dispatcher.map(answer, requests)
+    with open(args.results, "w", encoding="utf-8") as f:
+        # ordre de sortie non garanti par l'API : la fusion ne doit dépendre que des custom_id
+        for i, (request, body) in reversed(list(enumerate(zip(requests, bodies)))):
+            if args.fail and i % args.fail == 0:
+                result = {"response": None, "error": {"code": "server_error", "message": "Échec simulé"}}
+            else:
+                result = {"response": {"status_code": 200, "request_id": f"req_{i}", "body": body}, "error": None}
+            f.write(json.dumps({"id": f"batch_req_{i}", "custom_id": request["custom_id"], **result},
+                               ensure_ascii=False) + "\n")
+    print(f"{len(requests)} requêtes -> {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Débit d'insertion d'un document (lignes/s) : INSERT ligne à ligne vs COPY en une transaction.
+
+Génère un document synthétique (`--chunks` chunks, `--qa` Q/R par chunk, un embedding
+par chunk) et l'insère dans une base dédiée, créée et migrée si besoin, avec
+l'ancienne boucle (un INSERT ... RETURNING par chunk, un INSERT par Q/R et par
+embedding) puis avec insert_file_and_chunks. Vérifie que les deux chargements
+donnent les mêmes lignes. À lancer dans le conteneur watchdog :
+
+    python benchmarks/bench_bulk_insert.py --chunks 10000 --qa 4
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import psycopg2
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+import pipeline_etl  # noqa: E402
+
+BENCH_DB = "etl_bench_insert"
+
+
+def synthetic_document(chunks, qa, dimension):
+    rng = np.random.default_rng(0)
+    data = [{
+        "titre": f"Section {i // 20}",
+        "contenu": f"Paragraphe {i} : saisie des absences\tet des plannings.\nLigne suivante, \\ chemin {i}.",
+        "page": i // 5,
+        "nom_fichier": "synthetique.pdf",
+        "nombre_tokens": 120,
+        "questions_reponses": [{"question": f"Question {j} du chunk {i} ?", "réponse": f"Réponse {j}."}
+                               for j in range(qa)],
+    } for i in range(chunks)]
+    return data, rng.standard_normal((chunks, dimension), dtype=np.float32)
+
+
+def insert_row_by_row(pdf_file, data, embeddings):
+    """Chargement d'origine : un aller-retour par ligne."""
+    conn = psycopg2.connect(**pipeline_etl.DB_CONFIG)
+    with conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO aide_ligne_fichier (nom_fichier) VALUES (%s) RETURNING id_source;", (pdf_file.name,))
+        id_source = cur.fetchone()[0]
+        for chunk, vector in zip(data, embeddings):
+            cur.execute("""
+                INSERT INTO aide_ligne_chunk (titre, contenu, id_source, page, nombre_tokens)
+                VALUES (%s, %s, %s, %s, %s) RETURNING id_chunk;
+            """, (chunk.get("titre"), chunk["contenu"], id_source, chunk.get("page"), chunk.get("nombre_tokens")))
+            id_chunk = cur.fetchone()[0]
+            pipeline_etl.insert_embedding(cur, id_chunk, vector)
+            for qa in chunk["questions_reponses"]:
+                cur.execute("INSERT INTO aide_ligne_qa (question, réponse, id_chunk) VALUES (%s, %s, %s);",
+                            (qa["question"], qa["réponse"], id_chunk))
+    conn.close()
+
+
+def snapshot(name):
+    """Contenu inséré pour un fichier, indépendamment des id attribués."""
+    conn = psycopg2.connect(**pipeline_etl.DB_CONFIG)
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.titre, c.contenu, c.page, c.nombre_tokens, e.vecteur,
+                   array_agg(q.question || '|' || q.réponse ORDER BY q.id_qa)
+            FROM aide_ligne_chunk c
+            JOIN aide_ligne_fichier f ON f.id_source = c.id_source
+            LEFT JOIN aide_ligne_chunk_embedding e ON e.id_chunk = c.id_chunk
+            LEFT JOIN aide_ligne_qa q ON q.id_chunk = c.id_chunk
+            WHERE f.nom_fichier = %s
+            GROUP BY c.id_chunk, e.vecteur ORDER BY c.id_chunk;
+        """, (name,))
+        rows = [(*row[:4], bytes(row[4]), row[5]) for row in cur.fetchall()]
+        cur.execute("DELETE FROM aide_ligne_fichier WHERE nom_fichier = %s;", (name,))
+    conn.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=10_000)
+    parser.add_argument("--qa", type=int, default=4, help="Q/R par chunk")
+    parser.add_argument("--dimension", type=int, default=768)
+    args = parser.parse_args()
+
+    admin = psycopg2.connect(**{**pipeline_etl.DB_CONFIG, "dbname": "postgres"})
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (BENCH_DB,))
+        if not cur.fetchone():
+            cur.execute(f"CREATE DATABASE {BENCH_DB} ENCODING 'UTF8' TEMPLATE template0")
+    admin.close()
+    pipeline_etl.DB_CONFIG["dbname"] = BENCH_DB
+    pipeline_etl.setup_database()
+
+    data, embeddings = synthetic_document(args.chunks, args.qa, args.dimension)
+    rows = args.chunks * (2 + args.qa)  # chunk + embedding + Q/R
+    print(f"{args.chunks} chunks, {args.chunks * args.qa} Q/R, {args.chunks} embeddings ({rows} lignes)")
+
+    results = {}
+    for mode, load in (("ligne à ligne", insert_row_by_row), ("COPY", pipeline_etl.insert_file_and_chunks)):
+        name = f"synthetique {mode}.pdf"
+        start = time.perf_counter()
+        load(Path(name), data, embeddings)
+        elapsed = time.perf_counter() - start
+        results[mode] = snapshot(name)
+        print(f"{mode:<14} {elapsed:7.2f}s  {rows / elapsed:10.0f} lignes/s")
+    identical = results["ligne à ligne"] == results["COPY"] and len(results["COPY"]) == args.chunks
+    print("contenu identique" if identical else "CONTENU DIFFÉRENT")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Débit de l'extraction des pages d'un PDF (pages/s) selon le nombre de workers.
+
+Lance extract_pages sur le même PDF avec 1, 2, 4... workers et vérifie que le
+texte obtenu est identique, octet pour octet, à celui de l'extraction séquentielle.
+À lancer dans le conteneur watchdog (tesseract, variables d'environnement) :
+
+    python benchmarks/bench_extraction.py "/app/data-brute/Gestion Planning.pdf" --workers 1,2,4,8
+
+Par défaut les appels OpenAI (textes alternatifs des images) sont remplacés par
+un texte fixe tiré des octets de l'image : on mesure l'OCR et le prétraitement,
+sans latence réseau ni coût, et la sortie est déterministe. Le pool et le cache
+d'images repartent de zéro à chaque mesure (seuls les xref répétés d'un lot sont
+mutualisés). `--llm` garde les vrais appels (la comparaison octet pour octet n'a
+alors plus de sens).
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ["IMAGE_CACHE_PATH"] = ""  # cache d'images en mémoire, vidé à chaque mesure
+
+import extraction  # noqa: E402
+import image_cache  # noqa: E402
+
+
+def offline_caption(image_bytes, max_tokens=30):
+    return f"image {hashlib.sha1(image_bytes).hexdigest()[:8]}."
+
+
+def use_offline_captions():
+    """Textes alternatifs hors ligne, dans ce process et (initializer) dans chaque worker du pool."""
+    extraction.generate_text_image = offline_caption
+    extraction.generate_text_button = offline_caption
+    extraction.review_caption = lambda caption, max_tokens: caption
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--workers", default=f"1,2,4,{os.cpu_count()}")
+    parser.add_argument("--llm", action="store_true", help="garder les appels OpenAI")
+    args = parser.parse_args()
+
+    initializer = None
+    if not args.llm:
+        # les workers ne sont pas forkés d'ici : ils appliquent le remplacement au démarrage
+        initializer = use_offline_captions
+        use_offline_captions()
+
+    reference = None
+    print(f"{args.pdf.name}, {os.cpu_count()} cœurs")
+    for workers in sorted({1} | {int(n) for n in args.workers.split(",")}):  # 1 = référence séquentielle
+        image_cache._caches.clear()
+        start = time.perf_counter()
+        pages = extraction.extract_pages(str(args.pdf), workers=workers, initializer=initializer)
+        elapsed = time.perf_counter() - start
+        extraction.stop_extraction_pool()  # démarrage des workers compris dans la mesure, caches vidés
+        text = "".join(page + "\n" for page in pages).encode()
+        if reference is None:
+            reference = text
+        identical = "identique" if text == reference else "DIFFÉRENT"
+        print(f"{workers:>3} worker(s)  {len(pages)} pages en {elapsed:7.1f}s  "
+              f"{len(pages) / elapsed:6.2f} pages/s  sortie {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Débit des appels LLM (appels/s) : boucle séquentielle vs répartiteur concurrent (llm_dispatch).
+
+Les appels partent vers un faux serveur OpenAI local (stub_openai.py) qui simule la
+latence de l'API et ses quotas (429 + Retry-After au-delà de `--server-rpm`). Le
+répartiteur est réglé à `--rpm` : en dessous du quota serveur il ne déclenche aucun
+429 ; au-dessus, les 429 sont repris et comptés. Vérifie que les réponses
+reviennent dans l'ordre des requêtes.
+
+    python benchmarks/bench_llm_dispatch.py --calls 200 --latency 0.5 --concurrency 1,8,32
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from openai import OpenAI  # noqa: E402
+
+import llm_dispatch  # noqa: E402
+import stub_openai  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="latence simulée d'un appel (s)")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--rpm", type=float, default=llm_dispatch.LLM_RPM, help="budget du répartiteur")
+    parser.add_argument("--server-rpm", type=int, default=600, help="quota du faux serveur")
+    args = parser.parse_args()
+
+    server, quota = stub_openai.start(latency=args.latency, rpm=args.server_rpm)
+    client = OpenAI(base_url=f"http://127.0.0.1:{server.server_port}/v1", api_key="bench", max_retries=0)
+    prompts = [f"chunk {i}" for i in range(args.calls)]
+
+    print(f"{args.calls} appels, latence {args.latency}s, budget {args.rpm:.0f} rpm, "
+          f"quota serveur {args.server_rpm} rpm")
+    for concurrency in [int(n) for n in args.concurrency.split(",")]:
+        # chaque palier repart avec une fenêtre de quota vide
+        quota.window.clear()
+        quota.tokens = 0
+        rejected = quota.rejected
+        dispatcher = llm_dispatch.LLMDispatcher(concurrency=concurrency, rpm=args.rpm, backoff=0.5)
+
+        def ask(prompt):
+            response = dispatcher.call(client.chat.completions.create, model="gpt-4o", max_tokens=16,
+                                       messages=[{"role": "user", "content": prompt}])
+            return response.choices[0].message.content
+
+        start = time.perf_counter()
+        answers = dispatcher.map(ask, prompts)
+        elapsed = time.perf_counter() - start
+        ordered = "ordre conservé" if answers == prompts else "ORDRE PERDU"
+        print(f"{concurrency:>4} en vol  {elapsed:7.1f}s  {args.calls / elapsed:7.1f} appels/s  "
+              f"429={quota.rejected - rejected} (repris {dispatcher.stats['rate_limited']})  {ordered}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
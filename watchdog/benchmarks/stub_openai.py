@@ -0,0 +1,107 @@
+"""Faux point d'accès OpenAI /v1/chat/completions pour les benchmarks (bibliothèque standard).
+
+Chaque réponse arrive après `latency` secondes ; au-delà de `rpm` requêtes ou `tpm`
+tokens sur la dernière minute, le serveur répond 429 avec un en-tête Retry-After,
+comme l'API. La réponse reprend le dernier message reçu, ce qui permet de vérifier
+l'ordre des résultats.
+
+    python benchmarks/stub_openai.py --port 8790 --latency 0.5 --rpm 600
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Quota:
+    """Fenêtre glissante d'une minute sur les requêtes et les tokens."""
+
+    def __init__(self, rpm, tpm):
+        self.rpm, self.tpm = rpm, tpm
+        self.window = deque()  # (instant, tokens)
+        self.tokens = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def admit(self, tokens):
+        """None si la requête passe, sinon le délai (s) avant qu'elle puisse passer."""
+        with self._lock:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - 60:
+                self.tokens -= self.window.popleft()[1]
+            if len(self.window) < self.rpm and self.tokens + tokens <= self.tpm:
+                self.window.append((now, tokens))
+                self.tokens += tokens
+                return None
+            self.rejected += 1
+            return max(self.window[0][0] + 60 - now, 0.05) if self.window else 1.0
+
+
+def make_handler(quota, latency):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            prompt = " ".join(m["content"] if isinstance(m["content"], str) else "" for m in body["messages"])
+            tokens = len(prompt) // 4 + body.get("max_tokens", 16)
+            wait = quota.admit(tokens)
+            if wait is not None:
+                self._send(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                           "code": "rate_limit_exceeded"}},
+                           {"Retry-After": f"{wait:.2f}"})
+                return
+            time.sleep(latency)
+            self._send(200, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": body["messages"][-1]["content"]}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": 8,
+                          "total_tokens": len(prompt) // 4 + 8},
+            })
+
+        def _send(self, status, payload, headers=None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start(port=0, latency=0.5, rpm=600, tpm=1_000_000):
+    """Serveur démarré dans un thread ; retourne (serveur, quota)."""
+    quota = Quota(rpm, tpm)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(quota, latency))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, quota
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rpm", type=int, default=600)
+    parser.add_argument("--tpm", type=int, default=1_000_000)
+    args = parser.parse_args()
+    server, _ = start(args.port, args.latency, args.rpm, args.tpm)
+    print(f"http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,22 +7,40 @@ import openai
 from openai import OpenAI
 import os
 import base64
+import hashlib
 import re
 from transformers import AutoTokenizer
 import json
 import logging
+import math
+import multiprocessing
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
 from semantic_chunkers import StatisticalChunker
 from semantic_router.encoders import HuggingFaceEncoder
+from image_cache import DocumentImages, log_stats
+import llm_dispatch
 
 huggingface = os.environ['HUGGING_FACE_TOKEN']
 # Charger le tokenizer du modèle Mistral 7B
 tokenizer = AutoTokenizer.from_pretrained("mistralai/Mistral-7B-Instruct-v0.3", token=huggingface)
 
 openai.api_key = os.environ["OPENAI_API_KEY"]
-client = OpenAI()
+# max_retries=0 : les 429 sont repris par llm_dispatch seul, dans le budget RPM/TPM
+client = OpenAI(max_retries=0)
 
-encoder = HuggingFaceEncoder(name="sentence-transformers/all-mpnet-base-v2")
+
+def chat_completion(**kwargs):
+    """client.chat.completions.create dans le budget RPM/TPM du compte, 429 repris (llm_dispatch)."""
+    return llm_dispatch.dispatcher.call(client.chat.completions.create, **kwargs)
+
+# encodeur du chunker, réutilisé pour les embeddings des chunks finaux stockés en base
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+EMBEDDING_BATCH = int(os.getenv("EMBEDDING_BATCH", "32"))
+encoder = HuggingFaceEncoder(name=EMBEDDING_MODEL)
 chunker = StatisticalChunker(
         threshold_adjustment=0.02,
         encoder = encoder,
@@ -31,6 +49,15 @@ chunker = StatisticalChunker(
         window_size = 80
         )
 
+# Extraction des pages : 1 = séquentielle ; au-delà, pool de process (OCR sur plusieurs cœurs)
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
+EXTRACTION_BATCHES_PER_WORKER = 4  # lots de pages par worker, pour équilibrer la charge
+# forkserver (ou spawn) : jamais de fork direct du watchdog, déjà multi-thread
+EXTRACTION_START_METHOD = os.getenv("EXTRACTION_START_METHOD", "forkserver")
+
+_pool = None
+_pool_workers = 0
+
 def encode_image_to_base64(image_bytes):
     """Encode une image en Base64 pour l'envoyer à OpenAI."""
     return base64.b64encode(image_bytes).decode("utf-8")
@@ -67,7 +94,7 @@ def truncate(text):
 
 def review_extracted_text(extracted_text, max_tokens):
     """" Revoit le texte extrait pour estimer s'il peut contituer un texte alternatif. Concerne essentiellement les captures de boutons avec du texte"""
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "Tu es un assistant qui relit les textes extraits par OCR des images et les nettoie des mots superflus ou reformule si nécessaire pour les rendre adaptés aux lecteurs d'écran. S'il n'y a rien à changer, rends le texte extrait comme il t'a été fourni. Si tu ne sais pas rends le texte extrait d'origine. Ta réponse est ce qui sera lu par le screen reader pour faire comprendre un bouton."},
@@ -81,7 +108,7 @@ def review_extracted_text(extracted_text, max_tokens):
 
 def review_caption(caption, max_tokens):
     """ Revoit les textes alternatifs générés pour les images (essentiellement les captures d'écran qui ont en OCR plus de 30 characters)"""
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "Tu es un assistant qui relit les textes alternatifs générés pour des images ou des boutons et les nettoie des mots superflus ou reformule si nécessaire pour les rendre adaptés aux lecteurs d'écran."},
@@ -96,7 +123,7 @@ def generate_text_image(image_bytes, max_tokens=30):
     """Envoie l'image à OpenAI GPT-4o pour générer une description concise d'une image qui est une capture d'écran Octime"""
     image_base64 = encode_image_to_base64(image_bytes)
     image_url = f"data:image/png;base64,{image_base64}"
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "Tu es un assistant qui génère des textes alternatifs pour des images, qui seront utilisés par des lecteurs d'écran."},
@@ -115,7 +142,7 @@ def generate_text_button(image_bytes, max_tokens=15):
     """Envoie l'image à OpenAI GPT-4o pour générer une description concise d'une image qui est une icône"""
     image_base64 = encode_image_to_base64(image_bytes)
     image_url = f"data:image/png;base64,{image_base64}"
-    response = client.chat.completions.create(
+    response = chat_completion(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "Tu es un assistant qui génère des textes alternatifs pour des icônes et boutons inclus dans une documentation en ligne afin de la rendre accessible au screen reader."},
@@ -136,6 +163,17 @@ def calculate_tokens(text):
     return len(tokens)
 
 
+def embed_chunks(texts, batch_size=EMBEDDING_BATCH):
+    """Embeddings normalisés des textes, par lots ; matrice float32 (nb textes, dimension)."""
+    texts = list(texts)
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = []
+    for start in range(0, len(texts), batch_size):
+        vectors.extend(encoder(docs=texts[start:start + batch_size]))
+    return np.asarray(vectors, dtype=np.float32)
+
+
 def clean_chunk_content(content, title_to_remove):
     """Nettoie le contenu des chunks en enlevant les informations de bas de page."""
     lines = content.split("\n")
@@ -184,6 +222,182 @@ def add_overlap_to_chunks(chunks, overlap_sentences=1):
 
 
 
+def describe_image(image_bytes):
+    """OCR puis texte alternatif via OpenAI ; retourne (texte alternatif, appels OCR, appels API)."""
+    # Charger l'image avec PIL
+    image = Image.open(io.BytesIO(image_bytes))
+    image = preprocess_image_for_ocr(image)
+
+    # Application de l'OCR
+    extracted_text = pytesseract.image_to_string(image, config='--psm 6').strip()
+    extracted_text = clean_text(extracted_text)
+    logging.info(f"Texte OCR brut : {extracted_text}")
+
+    # Classification des images via OpenAI (génération puis relecture : 2 appels)
+    if len(extracted_text) > 30:
+        placeholder = f"[Image: {truncate(review_caption(generate_text_image(image_bytes, 30), 30))}]"
+    elif len(extracted_text) > 5:
+        # placeholder = f"[Image: {extracted_text}]"
+        placeholder = f"[Bouton: {truncate(review_caption(generate_text_button(image_bytes, 15), 15))}]"
+    else:
+        if extracted_text == "de,":
+            return "[Alt: attention]", 1, 0
+        placeholder = f"[Icône: {truncate(review_caption(generate_text_button(image_bytes, 15), 15))}]"
+
+        if ("triangle" in placeholder.lower() or "triangulaire" in placeholder.lower() or "pyramide" in placeholder.lower()) and not "triangle rouge" in placeholder.lower():
+            placeholder = ""
+    return placeholder, 1, 2
+
+
+def extract_page_text(doc, page_num, images):
+    """Texte reconstruit d'une page : blocs de texte et textes alternatifs des images, triés par position."""
+    page = doc[page_num]
+
+    ### 1. EXTRAIRE LE TEXTE GLOBAL (LIGNE PAR LIGNE) ###
+    text_blocks = page.get_text("blocks")
+    text_elements = [{"type": "text", "content": blk[4].strip(), "x": blk[0], "y": blk[1], "width": blk[2] - blk[0]} for blk in text_blocks if blk[4].strip()]
+    
+    ### 2. EXTRAIRE LES IMAGES ET LEURS POSITIONS ###
+    page_images = page.get_images(full=True)
+    doc_lock = threading.Lock()  # PyMuPDF n'est pas thread-safe : lecture des octets une à une
+
+    def image_placeholder(xref):
+        # Texte alternatif : xref déjà vu, cache persistant, sinon OCR + OpenAI
+        def load_bytes():
+            with doc_lock:
+                return doc.extract_image(xref)["image"]
+        return images.placeholder(xref, load_bytes)
+
+    # images distinctes de la page décrites en parallèle (appels LLM concurrents, dans l'ordre)
+    distinct = list(dict.fromkeys(img[0] for img in page_images))
+    resolved = dict(zip(distinct, llm_dispatch.dispatcher.map(image_placeholder, distinct)))
+
+    image_elements = []
+    for img_index, img in enumerate(page_images):
+        logging.info(f"Image {img_index} détectée sur la page {page_num}")
+        xref = img[0]  # Identifiant unique de l'image
+        # Protection contre images sans bbox
+        rects = page.get_image_rects(xref)
+        bbox = rects[0]  # Obtenir la position de l'image (x1, y1, x2, y2)
+
+        # première occurrence déjà résolue ; les suivantes comptent comme xref déjà vu
+        placeholder = resolved.pop(xref) if xref in resolved else image_placeholder(xref)
+        logging.info(f"Placeholder généré : {placeholder}")
+
+        image_elements.append({"type": "image", "content": placeholder, "x": bbox[0], "y": bbox[1], "width": bbox[2] - bbox[0]})
+    
+    ### 3. TRIER LES ÉLÉMENTS PAR POSITION ###
+    all_elements = text_elements + image_elements
+    all_elements = sorted(all_elements, key=lambda e: (e["y"], e["x"]))
+    
+    ### 4. RECONSTRUCTION DU TEXTE ###
+    page_text = "\n"
+    for e in all_elements:
+        content = e['content'].strip()
+
+        if content:
+            page_text += f"{content}\n"
+
+    # Nettoyage basique
+    page_text = page_text.replace("OCTIME - Module web Employé", "")
+    page_text = page_text.replace("OCTIME - Gestion v 11", "")
+    page_text = page_text.replace("Gestion v 11", "")
+    page_text = page_text.replace("© 2025 OCTIME", "")
+    page_text = page_text.replace("© 2025 Octime", "")
+
+    # Nettoyage dynamique sur motifs fragmentés
+    page_text = re.sub(r"\d+[\s\n\r]+Principes[\s\n\r]+généraux", "", page_text, flags=re.IGNORECASE)
+    page_text = re.sub(r"\d+[\s\n\r]+Module[\s\n\r]+de[\s\n\r]+gestion", "", page_text, flags=re.IGNORECASE)
+    page_text = re.sub(r"\d+[\s\n\r]+Consultation", "", page_text, flags=re.IGNORECASE)
+    page_text = re.sub(r"\d+[\s\n\r]+Saisie", "", page_text, flags=re.IGNORECASE)
+
+    # Nettoyage des espaces multiples
+    page_text = re.sub(r"\s{2,}", " ", page_text).strip()
+    return page_text
+
+
+def _init_extraction_worker(budget, initializer=None):
+    # chaque worker ouvre ses propres connexions HTTP vers OpenAI
+    global client
+    client = OpenAI(max_retries=0)
+    # budget RPM/TPM du compte en mémoire partagée : le même pour le watchdog et tous les workers
+    llm_dispatch.configure(budget=budget)
+    if initializer is not None:
+        initializer()
+
+
+def start_extraction_pool(workers=None, initializer=None):
+    """Pool de process d'extraction, créé une fois et gardé (au démarrage du watchdog, avant l'observateur).
+
+    Les workers ne sont pas forkés depuis le watchdog, dont les threads (observateur,
+    logging, pools du tokenizer et de torch) pourraient laisser un verrou pris dans
+    l'enfant : en forkserver ils partent d'un serveur mono-thread qui a importé ce module
+    (modèles chargés une fois). `initializer()` est exécuté en plus dans chaque worker.
+    Le process courant et les workers tirent leurs appels LLM d'un même budget (llm_dispatch.shared_budget).
+    """
+    global _pool, _pool_workers
+    workers = workers or EXTRACTION_WORKERS
+    if _pool is not None and _pool_workers != workers:
+        stop_extraction_pool()
+    if _pool is None and workers > 1:
+        context = multiprocessing.get_context(EXTRACTION_START_METHOD)
+        if EXTRACTION_START_METHOD == "forkserver":
+            context.set_forkserver_preload([__name__])
+        budget = llm_dispatch.shared_budget(context=context)
+        llm_dispatch.configure(budget=budget)
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                    initializer=_init_extraction_worker, initargs=(budget, initializer))
+        _pool_workers = workers
+    return _pool
+
+
+def stop_extraction_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown()
+        _pool, _pool_workers = None, 0
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Tâche d'un worker : rouvre le document (un fitz.Document ne passe pas d'un process à l'autre).
+
+    Retourne les textes des pages et les statistiques du cache d'images du lot.
+    """
+    images = DocumentImages(describe_image)
+    with fitz.open(pdf_path) as doc:
+        return [extract_page_text(doc, page_num, images) for page_num in range(start, stop)], images.stats
+
+
+def extract_pages(pdf_path, workers=None, initializer=None):
+    """Textes des pages du PDF, dans l'ordre des pages.
+
+    Avec plusieurs workers, les pages sont réparties par lots sur le pool de process
+    (start_extraction_pool : OCR et prétraitement des images sur tous les cœurs) puis
+    remises dans l'ordre : le résultat est identique à celui de l'extraction séquentielle.
+    """
+    workers = workers or EXTRACTION_WORKERS
+    name = os.path.basename(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = len(doc)
+        if workers <= 1 or page_count < 2:
+            images = DocumentImages(describe_image)
+            pages = [extract_page_text(doc, page_num, images) for page_num in range(page_count)]
+            log_stats(name, images.stats)
+            return pages
+
+    # plusieurs lots par worker : un lot chargé en images ne laisse pas les autres cœurs inactifs
+    size = max(1, math.ceil(page_count / (workers * EXTRACTION_BATCHES_PER_WORKER)))
+    starts = range(0, page_count, size)
+    stops = [min(start + size, page_count) for start in starts]
+    pool = start_extraction_pool(workers, initializer)
+    batches = list(pool.map(_extract_page_range, repeat(pdf_path), starts, stops))
+    stats = Counter()
+    for _, batch_stats in batches:
+        stats.update(batch_stats)
+    log_stats(name, stats)
+    return [page_text for batch, _ in batches for page_text in batch]
+
+
 def generate_content_from_pdf(pdf_path):
     # Obtenir le nom du fichier avec l'extension
     file_name_with_extension = os.path.basename(pdf_path)
@@ -205,87 +419,8 @@ def generate_content_from_pdf(pdf_path):
         titre = file_name  # ou file_name.replace(".pdf", "")
         logging.warning(f"Aucun préfixe détecté pour {file_name}, titre = {titre}")
    
-    doc = fitz.open(pdf_path)
-    
-    # Extraction et reconstruction du texte
-    final_document = ""
-
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-
-        ### 1. EXTRAIRE LE TEXTE GLOBAL (LIGNE PAR LIGNE) ###
-        text_blocks = page.get_text("blocks")
-        text_elements = [{"type": "text", "content": blk[4].strip(), "x": blk[0], "y": blk[1], "width": blk[2] - blk[0]} for blk in text_blocks if blk[4].strip()]
-        
-        ### 2. EXTRAIRE LES IMAGES ET LEURS POSITIONS ###
-        image_elements = []
-        for img_index, img in enumerate(page.get_images(full=True)):
-            logging.info(f"Image {img_index} détectée sur la page {page_num}")
-            xref = img[0]  # Identifiant unique de l'image
-            base_image = doc.extract_image(xref)
-            image_bytes = base_image["image"]
-            # Protection contre images sans bbox
-            rects = page.get_image_rects(xref)
-            bbox = rects[0]  # Obtenir la position de l'image (x1, y1, x2, y2)
-
-            # Charger l'image avec PIL
-            image = Image.open(io.BytesIO(image_bytes))
-            image = preprocess_image_for_ocr(image)
-            
-            # Application de l'OCR
-            extracted_text = pytesseract.image_to_string(image, config='--psm 6').strip()
-            extracted_text = clean_text(extracted_text)
-            logging.info(f"Texte OCR brut : {extracted_text}")
-            
-            # Classification des images via OpenAI
-            if len(extracted_text) > 30:
-                placeholder = f"[Image: {truncate(review_caption(generate_text_image(image_bytes, 30), 30))}]"
-            elif len(extracted_text) > 5:
-                # placeholder = f"[Image: {extracted_text}]"
-                placeholder = f"[Bouton: {truncate(review_caption(generate_text_button(image_bytes, 15), 15))}]"
-            else:
-                if extracted_text == "de,":
-                    placeholder = "[Alt: attention]"
-                else : 
-                    placeholder = f"[Icône: {truncate(review_caption(generate_text_button(image_bytes, 15), 15))}]"
-                    
-                    if ("triangle" in placeholder.lower() or "triangulaire" in placeholder.lower() or "pyramide" in placeholder.lower()) and not "triangle rouge" in placeholder.lower():
-                        placeholder = ""
-            logging.info(f"Placeholder généré : {placeholder}")
-                
-            
-            image_elements.append({"type": "image", "content": placeholder, "x": bbox[0], "y": bbox[1], "width": bbox[2] - bbox[0]})
-        
-        ### 3. TRIER LES ÉLÉMENTS PAR POSITION ###
-        all_elements = text_elements + image_elements
-        all_elements = sorted(all_elements, key=lambda e: (e["y"], e["x"]))
-        
-        ### 4. RECONSTRUCTION DU TEXTE ###
-        page_text = "\n"
-        for e in all_elements:
-            content = e['content'].strip()
-
-            if content:
-                page_text += f"{content}\n"
-
-        # Nettoyage basique
-        page_text = page_text.replace("OCTIME - Module web Employé", "")
-        page_text = page_text.replace("OCTIME - Gestion v 11", "")
-        page_text = page_text.replace("Gestion v 11", "")
-        page_text = page_text.replace("© 2025 OCTIME", "")
-        page_text = page_text.replace("© 2025 Octime", "")
-
-        # Nettoyage dynamique sur motifs fragmentés
-        page_text = re.sub(r"\d+[\s\n\r]+Principes[\s\n\r]+généraux", "", page_text, flags=re.IGNORECASE)
-        page_text = re.sub(r"\d+[\s\n\r]+Module[\s\n\r]+de[\s\n\r]+gestion", "", page_text, flags=re.IGNORECASE)
-        page_text = re.sub(r"\d+[\s\n\r]+Consultation", "", page_text, flags=re.IGNORECASE)
-        page_text = re.sub(r"\d+[\s\n\r]+Saisie", "", page_text, flags=re.IGNORECASE)
-
-        # Nettoyage des espaces multiples
-        page_text = re.sub(r"\s{2,}", " ", page_text).strip()
-
-        final_document += page_text + "\n"
-        # logging.info(f"final_document {final_document}")
+    # Extraction et reconstruction du texte, page par page (en parallèle si EXTRACTION_WORKERS > 1)
+    final_document = "".join(page_text + "\n" for page_text in extract_pages(pdf_path))
 
     chunks = chunker(docs=[final_document])
     #print(chunks)
@@ -329,38 +464,43 @@ def generate_content_from_pdf(pdf_path):
     return json_data, prefix, titre
 
 
-def generate_questions_truth(text, nb_tokens):
+def questions_truth_request(text, nb_tokens):
+    """Paramètres de l'appel chat.completions qui génère les Q/R d'un chunk (interactif ou par lot)."""
     n = nb_tokens // 300 + 2
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            temperature=0.3,
-            messages=[
-                {"role": "system", "content": f"""Tu es un assistant au sein de la société Octime qui produit un logiciel de gestion des temps. Tu génères des questions réponses sur la base de contenu qui te sont fournis. Les questions générées doivent ressembler à celles posées par les utilisateurs du produit Octime (l'outil de gestion des temps). Elles sont de format varié. Tes réponses doivent être détaillées, didactiques et précises. Tu réponds sous la forme d'une liste de {n} JSON dont le format est le suivant : 
-                {{
-                    "question 1":{{"la question que tu génères":"la réponse que tu génères à ta question}},
-                    "question 2":{{"la question que tu génères":"la réponse que tu génères à ta question}},
-                    ...
-                }}"""},
-                {"role": "user", "content": f"Génère {n} questions avec leur réponse au format JSON demandé sur le contenu suivant:\n\n{text}"}
-            ],
-            response_format={"type": "json_object"},
-        )
+    return dict(
+        model="gpt-4o-mini",
+        temperature=0.3,
+        messages=[
+            {"role": "system", "content": f"""Tu es un assistant au sein de la société Octime qui produit un logiciel de gestion des temps. Tu génères des questions réponses sur la base de contenu qui te sont fournis. Les questions générées doivent ressembler à celles posées par les utilisateurs du produit Octime (l'outil de gestion des temps). Elles sont de format varié. Tes réponses doivent être détaillées, didactiques et précises. Tu réponds sous la forme d'une liste de {n} JSON dont le format est le suivant : 
+            {{
+                "question 1":{{"la question que tu génères":"la réponse que tu génères à ta question}},
+                "question 2":{{"la question que tu génères":"la réponse que tu génères à ta question}},
+                ...
+            }}"""},
+            {"role": "user", "content": f"Génère {n} questions avec leur réponse au format JSON demandé sur le contenu suivant:\n\n{text}"}
+        ],
+        response_format={"type": "json_object"},
+    )
+
 
-        content = response.choices[0].message.content
+def parse_questions_truth(content):
+    """Réponse du LLM (chaîne JSON) -> dict de Q/R, {} si elle n'est pas parseable."""
+    try:
+        llm_answer = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        logging.warning(f"Réponse LLM non parseable en JSON :\n{content}")
+        return {}
+    logging.info(f"question truth {llm_answer}")
+    return llm_answer if isinstance(llm_answer, dict) else {}
 
-        # Si le retour est du JSON sous forme de string, le parser
-        try:
-            llm_answer = json.loads(content)
-        except json.JSONDecodeError:
-            logging.warning(f"Réponse LLM non parseable en JSON :\n{content}")
-            return {}
 
-        llm_answer = json.loads(response.choices[0].message.content)
-        logging.info(f"question truth {llm_answer}")
-        return llm_answer
+def generate_questions_truth(text, nb_tokens):
+    try:
+        response = chat_completion(**questions_truth_request(text, nb_tokens))
+        return parse_questions_truth(response.choices[0].message.content)
     except Exception as e:
-        logging.info(f"Erreur lors de la génération des questions/réponses : {e}")
+        # erreur persistante après les reprises de llm_dispatch : le chunk reste sans Q/R, à refaire
+        logging.warning(f"Erreur lors de la génération des questions/réponses : {e}")
         return {}
 
 
@@ -376,6 +516,80 @@ def transform_questions_answers(questions_answers):
     return transformed
 
 
+def has_questions(chunk):
+    return bool(chunk.get("questions_reponses"))
+
+
+def generate_questions_for_chunks(chunks):
+    """Génère les Q/R des chunks qui n'en ont pas, appels LLM en parallèle (llm_dispatch)."""
+    todo = [chunk for chunk in chunks if not has_questions(chunk)]
+
+    def generate(chunk):
+        content = chunk["contenu"]
+        return transform_questions_answers(generate_questions_truth(content, calculate_tokens(content)))
+
+    for chunk, questions_reponses in zip(todo, llm_dispatch.dispatcher.map(generate, todo)):
+        chunk["questions_reponses"] = questions_reponses
+    missing = sum(not has_questions(chunk) for chunk in todo)
+    if missing:
+        logging.warning(f"{missing}/{len(todo)} chunks sans Q/R après génération (à refaire, ex. --batch-requests)")
+
+
+def batch_custom_id(chunk, index):
+    """Identifiant stable d'une requête du lot : même fichier, même position et même contenu -> même id."""
+    key = f"{chunk.get('nom_fichier')}\0{index}\0{chunk['contenu']}"
+    return "qa-" + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def write_questions_batch(chunks, batch_path, append=False):
+    """Écrit les requêtes de Q/R des chunks qui n'en ont pas au format JSONL de l'API Batch d'OpenAI.
+
+    Une ligne par chunk : {"custom_id", "method", "url", "body"} ; `append` cumule plusieurs
+    documents (backlog) dans le même fichier. Retourne le nombre de requêtes écrites.
+    """
+    written = 0
+    Path(batch_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(batch_path, "a" if append else "w", encoding="utf-8") as f:
+        for index, chunk in enumerate(chunks):
+            if has_questions(chunk):
+                continue
+            body = questions_truth_request(chunk["contenu"], calculate_tokens(chunk["contenu"]))
+            f.write(json.dumps({"custom_id": batch_custom_id(chunk, index), "method": "POST",
+                                "url": "/v1/chat/completions", "body": body}, ensure_ascii=False) + "\n")
+            written += 1
+    logging.info(f"{written} requêtes de Q/R écrites dans {batch_path}")
+    return written
+
+
+def read_batch_results(results_path):
+    """Fichier de résultats du lot -> ({custom_id: contenu de la réponse}, [custom_id des requêtes en erreur])."""
+    answers, failed = {}, []
+    with open(results_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                logging.warning(f"Requête {result.get('custom_id')} en erreur dans le lot : {result.get('error')}")
+                failed.append(result.get("custom_id"))
+                continue
+            answers[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return answers, failed
+
+
+def merge_questions_batch(chunks, answers):
+    """Reporte dans les chunks sans Q/R les réponses du lot (`read_batch_results`) ; retourne les chunks complétés."""
+    merged = []
+    for index, chunk in enumerate(chunks):
+        content = answers.get(batch_custom_id(chunk, index))
+        if content is None or has_questions(chunk):
+            continue
+        chunk["questions_reponses"] = transform_questions_answers(parse_questions_truth(content))
+        merged.append(chunk)
+    return merged
+
+
 def generate_questions_from_json(input_json_path, output_json_path):
     """Génère des questions/réponses à partir d'un JSON existant et sauvegarde le résultat dans un nouveau JSON."""
     # Ouvrir le JSON existant
@@ -383,13 +597,7 @@ def generate_questions_from_json(input_json_path, output_json_path):
         data = json.load(f)
 
     # Générer des questions/réponses pour chaque chunk de contenu
-    for chunk in data:
-        if "questions_reponses" not in chunk or not chunk["questions_reponses"]:
-            content = chunk["contenu"]
-            nb_tokens = calculate_tokens(content)
-            questions_answers = generate_questions_truth(content, nb_tokens)
-            transformed_questions_answers = transform_questions_answers(questions_answers)
-            chunk["questions_reponses"] = transformed_questions_answers
+    generate_questions_for_chunks(data)
 
 
     # Sauvegarder le résultat dans un nouveau JSON
@@ -0,0 +1,166 @@
+# Cache persistant des textes alternatifs d'images (SQLite). Les mêmes icônes, boutons
+# et captures reviennent sur presque chaque page et dans chaque PDF : une image déjà
+# analysée (OCR + appels GPT-4o) est retrouvée
+#  - par le SHA-256 de ses octets (copie exacte),
+#  - sinon par un hash perceptuel (dHash 64 bits) proche, à proportions égales :
+#    une copie redimensionnée ou réencodée de la même icône.
+# Dans un document, un même xref n'est résolu qu'une fois.
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+
+from PIL import Image
+
+IMAGE_CACHE_PATH = os.getenv("IMAGE_CACHE_PATH", "/app/resultat_extraction/image_cache.sqlite")
+IMAGE_CACHE_DISTANCE = int(os.getenv("IMAGE_CACHE_DISTANCE", "3"))  # bits de dHash différents tolérés
+IMAGE_CACHE_ASPECT = 0.1  # écart relatif de proportions toléré pour un rapprochement perceptuel
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS image_alt (
+    sha256 TEXT PRIMARY KEY,
+    dhash TEXT NOT NULL,
+    aspect REAL NOT NULL,
+    placeholder TEXT NOT NULL,
+    ocr_calls INTEGER NOT NULL,
+    api_calls INTEGER NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+def dhash(image, size=8) -> int:
+    """Hash perceptuel par différences : un bit par pixel voisin plus clair, sur une vignette 9x8."""
+    pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            bits = (bits << 1) | (pixels[row * (size + 1) + col] > pixels[row * (size + 1) + col + 1])
+    return bits
+
+
+class ImageCache:
+    """Textes alternatifs déjà calculés, partagés entre documents, process et redémarrages."""
+
+    def __init__(self, path=IMAGE_CACHE_PATH, distance=IMAGE_CACHE_DISTANCE):
+        self.distance = distance
+        # WAL : les workers d'extraction lisent et écrivent en même temps
+        self.conn = sqlite3.connect(path or ":memory:", timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(SCHEMA)
+        self.conn.commit()
+        self._lock = threading.Lock()
+        self._near = []  # (dhash, proportions, sha256) pour la recherche perceptuelle
+        self._last_rowid = 0
+
+    def exact(self, sha256):
+        with self._lock:
+            return self.conn.execute(
+                "SELECT placeholder, ocr_calls, api_calls FROM image_alt WHERE sha256 = ?", (sha256,)
+            ).fetchone()
+
+    def similar(self, phash, aspect):
+        """Entrée de dHash le plus proche (à `distance` bits près) et de mêmes proportions, ou None."""
+        with self._lock:
+            # entrées ajoutées depuis (autres workers compris)
+            for rowid, sha256, hashed, other_aspect in self.conn.execute(
+                    "SELECT rowid, sha256, dhash, aspect FROM image_alt WHERE rowid > ? ORDER BY rowid",
+                    (self._last_rowid,)):
+                self._near.append((int(hashed, 16), other_aspect, sha256))
+                self._last_rowid = rowid
+            best = None
+            for hashed, other_aspect, sha256 in self._near:
+                if abs(aspect - other_aspect) > IMAGE_CACHE_ASPECT * max(aspect, other_aspect):
+                    continue
+                bits = bin(hashed ^ phash).count("1")
+                if bits <= self.distance and (best is None or bits < best[0]):
+                    best = (bits, sha256)
+        return self.exact(best[1]) if best else None
+
+    def put(self, sha256, phash, aspect, placeholder, ocr_calls, api_calls):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO image_alt (sha256, dhash, aspect, placeholder, ocr_calls, api_calls) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, f"{phash:016x}", aspect, placeholder, ocr_calls, api_calls),
+            )
+            self.conn.commit()
+
+
+_caches = {}
+
+
+def get_image_cache() -> ImageCache:
+    """Cache du process courant (une connexion SQLite ne se partage pas après un fork)."""
+    pid = os.getpid()
+    if pid not in _caches:
+        _caches[pid] = ImageCache()
+    return _caches[pid]
+
+
+class DocumentImages:
+    """Résolution des images d'un document : xref déjà vu, puis cache persistant, puis `describe`.
+
+    `describe(image_bytes)` retourne (texte alternatif, appels OCR, appels API) ;
+    `stats` compte les images, les succès par niveau et les appels évités.
+    """
+
+    def __init__(self, describe, cache=None):
+        self.describe = describe
+        self.cache = cache or get_image_cache()
+        self.by_xref = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()  # images d'une page résolues depuis plusieurs threads
+
+    def _count(self, **counts):
+        with self._lock:
+            self.stats.update(counts)
+
+    def placeholder(self, xref, load_bytes):
+        self._count(images=1)
+        if xref in self.by_xref:
+            self._count(xref_hits=1)
+            placeholder, ocr_calls, api_calls = self.by_xref[xref]
+            self._saved(ocr_calls, api_calls)
+            return placeholder
+
+        image_bytes = load_bytes()
+        sha256 = hashlib.sha256(image_bytes).hexdigest()
+        entry = self.cache.exact(sha256)
+        if entry is not None:
+            self._count(exact_hits=1)
+        else:
+            image = Image.open(io.BytesIO(image_bytes))
+            phash, aspect = dhash(image), image.width / image.height
+            entry = self.cache.similar(phash, aspect)
+            if entry is not None:
+                self._count(perceptual_hits=1)
+                self.cache.put(sha256, phash, aspect, *entry)  # la prochaine copie identique sort en exact
+            else:
+                self._count(misses=1)
+                placeholder, ocr_calls, api_calls = self.describe(image_bytes)
+                self.cache.put(sha256, phash, aspect, placeholder, ocr_calls, api_calls)
+                self.by_xref[xref] = (placeholder, ocr_calls, api_calls)
+                return placeholder
+        placeholder, ocr_calls, api_calls = entry
+        self._saved(ocr_calls, api_calls)
+        self.by_xref[xref] = entry
+        return placeholder
+
+    def _saved(self, ocr_calls, api_calls):
+        self._count(ocr_saved=ocr_calls, api_saved=api_calls)
+
+
+def log_stats(name, stats):
+    """Bilan du cache pour un document (statistiques éventuellement additionnées entre workers)."""
+    images = stats["images"]
+    hits = images - stats["misses"]
+    logging.info(
+        f"Cache images {name} : {images} images, {hits} servies par le cache "
+        f"({hits / images if images else 0:.0%} ; xref {stats['xref_hits']}, "
+        f"exactes {stats['exact_hits']}, perceptuelles {stats['perceptual_hits']}), "
+        f"{stats['ocr_saved']} OCR et {stats['api_saved']} appels API évités"
+    )
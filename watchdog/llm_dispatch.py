@@ -0,0 +1,163 @@
+# Appels OpenAI concurrents sous budget : le temps d'ingestion n'est plus
+# « nombre d'appels x latence » mais borné par les quotas du compte.
+#  - LLM_CONCURRENCY appels en vol au plus (threads) ;
+#  - budgets LLM_RPM requêtes / LLM_TPM tokens par minute, rechargés en continu,
+#    en mémoire partagée (shared_budget) entre le watchdog et ses workers d'extraction ;
+#  - 429, 5xx, coupure réseau ou timeout : nouvel essai après Retry-After ou un délai
+#    exponentiel (avec gigue), dans le même budget ; seule couche de reprise (clients en max_retries=0) ;
+#  - map() rend les résultats dans l'ordre des entrées.
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "6"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "1"))  # premier délai après un 429 (s), doublé à chaque essai
+LLM_BACKOFF_MAX = 60.0
+# erreurs passagères reprises comme les 429 (APITimeoutError hérite d'APIConnectionError)
+TRANSIENT_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+RPM, TPM, REQUESTS, TOKENS, UPDATED = range(5)  # cases de l'état d'un RateLimiter
+
+
+def shared_budget(rpm=LLM_RPM, tpm=LLM_TPM, context=None):
+    """État d'un RateLimiter en mémoire partagée, à transmettre aux process qui se partagent le compte.
+
+    Passé à la création des process (initargs d'un pool, créés avec le même `context`
+    multiprocessing), il donne un seul budget RPM/TPM pour tous : la somme des appels
+    ne dépasse pas rpm / tpm, quel que soit le nombre de workers et même si le parent
+    appelle en même temps qu'eux.
+    """
+    context = context or multiprocessing.get_context()
+    return context.Array("d", [rpm, tpm, rpm, tpm, time.monotonic()])
+
+
+class RateLimiter:
+    """Double seau à jetons (requêtes et tokens par minute), rempli en continu jusqu'au budget d'une minute.
+
+    Avec `budget` (shared_budget()), les seaux sont partagés entre process et rpm / tpm sont ceux du budget.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, clock=time.monotonic, sleep=time.sleep, budget=None):
+        self.clock, self.sleep = clock, sleep
+        if budget is None:
+            self._state, self._lock = [rpm, tpm, rpm, tpm, clock()], threading.Lock()
+        else:
+            self._state, self._lock = budget, budget.get_lock()
+        self.rpm, self.tpm = self._state[RPM], self._state[TPM]
+
+    def _refill(self):
+        state = self._state
+        now = self.clock()
+        elapsed, state[UPDATED] = max(now - state[UPDATED], 0), now
+        state[REQUESTS] = min(self.rpm, state[REQUESTS] + elapsed * self.rpm / 60)
+        state[TOKENS] = min(self.tpm, state[TOKENS] + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens):
+        """Bloque jusqu'à ce qu'une requête de `tokens` tokens tienne dans les deux budgets."""
+        tokens = min(tokens, self.tpm)  # une requête plus grosse que le budget passe quand il est plein
+        state = self._state
+        while True:
+            with self._lock:
+                self._refill()
+                if state[REQUESTS] >= 1 and state[TOKENS] >= tokens:
+                    state[REQUESTS] -= 1
+                    state[TOKENS] -= tokens
+                    return
+                wait = max((1 - state[REQUESTS]) * 60 / self.rpm, (tokens - state[TOKENS]) * 60 / self.tpm)
+            self.sleep(max(wait, 0.001))
+
+    def adjust(self, tokens):
+        """Corrige le budget de tokens d'après la consommation réelle (usage renvoyé par l'API)."""
+        with self._lock:
+            self._refill()
+            self._state[TOKENS] -= tokens
+
+
+def retry_after(error):
+    """Délai demandé par le serveur (en-tête Retry-After, en secondes), ou None."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_tokens(kwargs):
+    """Tokens d'un appel chat.completions : ~4 caractères par token du prompt, plus la réponse maximale."""
+    prompt = 0
+    for message in kwargs.get("messages", []):
+        content = message["content"]
+        if isinstance(content, str):
+            prompt += len(content)
+        else:  # contenu multimodal : texte + image (coût forfaitaire d'une image basse définition)
+            prompt += sum(len(part.get("text", "")) for part in content) + 85 * 4
+    return prompt // 4 + kwargs.get("max_tokens", 1000)
+
+
+class LLMDispatcher:
+    """Exécute les appels LLM en parallèle sous les budgets RPM/TPM, avec reprise des 429 et erreurs passagères."""
+
+    def __init__(self, concurrency=LLM_CONCURRENCY, rpm=LLM_RPM, tpm=LLM_TPM,
+                 max_retries=LLM_MAX_RETRIES, backoff=LLM_BACKOFF, budget=None):
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rpm, tpm, budget=budget)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.stats = {"calls": 0, "rate_limited": 0, "transient_errors": 0}
+        self._lock = threading.Lock()
+
+    def call(self, create, **kwargs):
+        """`create(**kwargs)` (ex. client.chat.completions.create) dans le budget ; 429, 5xx, réseau -> nouvel essai."""
+        estimated = estimate_tokens(kwargs)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                response = create(**kwargs)
+            except TRANSIENT_ERRORS as e:
+                rate_limited = isinstance(e, openai.RateLimitError)
+                with self._lock:
+                    self.stats["rate_limited" if rate_limited else "transient_errors"] += 1
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after(e)
+                if delay is None:
+                    delay = min(self.backoff * 2 ** attempt, LLM_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+                error = "429" if rate_limited else type(e).__name__
+                logging.info(f"{error} du fournisseur LLM, nouvel essai dans {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                continue
+            with self._lock:
+                self.stats["calls"] += 1
+            usage = getattr(response, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.limiter.adjust(usage.total_tokens - estimated)
+            return response
+
+    def map(self, fn, items):
+        """`[fn(item) for item in items]` avec `concurrency` appels simultanés, résultats dans l'ordre."""
+        items = list(items)
+        if self.concurrency <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items)), thread_name_prefix="llm") as pool:
+            return list(pool.map(fn, items))
+
+
+dispatcher = LLMDispatcher()
+
+
+def configure(**kwargs):
+    """Remplace le répartiteur du process (ex. budget=shared_budget() partagé avec les workers d'extraction)."""
+    global dispatcher
+    dispatcher = LLMDispatcher(**kwargs)
+    return dispatcher
@@ -1,18 +1,26 @@
+import argparse
+import io
 import psycopg2
 import json
 import os
 from pathlib import Path
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import FileSystemEventHandler, FileDeletedEvent
 import time
 import logging
+from migrations.migrate import migrate
 
 # Import des fonctions depuis ton script d'extraction
 from extraction import (
     generate_content_from_pdf,
-    calculate_tokens,
-    generate_questions_truth,
-    transform_questions_answers
+    generate_questions_for_chunks,
+    write_questions_batch,
+    read_batch_results,
+    merge_questions_batch,
+    has_questions,
+    embed_chunks,
+    start_extraction_pool,
+    EMBEDDING_MODEL
 )
 
 # Configuration de la base de données PostgreSQL
@@ -27,6 +35,10 @@ DB_CONFIG = {
 # Répertoire montés
 EXTRACTION_DIR = Path("/app/resultat_extraction")
 DATA_BRUTE = Path("/app/data-brute")
+BATCH_DIR = EXTRACTION_DIR / "batch"
+
+# Q/R générées à l'ingestion (interactive) ou écrites dans un fichier de lot à soumettre (batch)
+QA_MODE = os.getenv("QA_MODE", "interactive")
 
 # Configuration des logs
 logging.basicConfig(
@@ -55,93 +67,108 @@ def create_database_if_not_exists():
 
 
 def setup_database():
-    """Crée les tables dans PostgreSQL selon la nouvelle structure."""
-    create_tables_sql = """
-    -- Création de la table des fichiers sources
-    CREATE TABLE IF NOT EXISTS aide_ligne_fichier (
-        id_source SERIAL PRIMARY KEY,  -- Clé primaire, auto-incrémentée
-        nom_fichier TEXT NOT NULL UNIQUE,  -- Nom du fichier, unique pour éviter les doublons
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP  -- Date d'insertion automatique
-    );
-
-    -- Création de la table des chunks extraits
-    CREATE TABLE IF NOT EXISTS aide_ligne_chunk (
-        id_chunk SERIAL PRIMARY KEY,  -- Clé primaire, auto-incrémentée
-        titre TEXT,  -- Titre du chunk
-        contenu TEXT NOT NULL,  -- Contenu du chunk, obligatoire
-        id_source INT NOT NULL,  -- Référence au fichier source
-        page INTEGER,  -- Numéro de la page du chunk
-        nombre_tokens INTEGER,  -- Nombre de tokens dans le chunk
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Date d'insertion automatique
-        FOREIGN KEY (id_source) REFERENCES aide_ligne_fichier(id_source) ON DELETE CASCADE  -- Suppression en cascade si le fichier source est supprimé
-    );
-
-    -- Création de la table des questions-réponses associées aux chunks
-    CREATE TABLE IF NOT EXISTS aide_ligne_qa (
-        id_qa SERIAL PRIMARY KEY,  -- Clé primaire, auto-incrémentée
-        question TEXT NOT NULL,  -- Question générée
-        réponse TEXT NOT NULL,  -- Réponse correspondante
-        id_chunk INT NOT NULL,  -- Référence au chunk source
-        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Date d'insertion automatique
-        FOREIGN KEY (id_chunk) REFERENCES aide_ligne_chunk(id_chunk) ON DELETE CASCADE  -- Suppression en cascade si le chunk est supprimé
-    );
+    """Applique les migrations du schéma (dossier migrations/ partagé avec l'API ETL).
+
+    Un échec est fatal : sans schéma, chaque insertion échouerait ensuite.
     """
     try:
         with psycopg2.connect(**DB_CONFIG) as conn:
-            with conn.cursor() as cur:
-                cur.execute(create_tables_sql)
-            conn.commit()
-        logging.info("Tables créées avec succès !")
+            versions = migrate(conn)
+        conn.close()
+        logging.info(f"Schéma à jour ({len(versions)} migration(s) appliquée(s))")
     except Exception as e:
-        logging.info(f"Erreur lors de la création des tables : {e}")
+        logging.error(f"Erreur lors de la migration du schéma : {e}")
+        raise
 
 
-def insert_file_and_chunks(pdf_file, data):
-    # Insérer le fichier dans aide_ligne_fichier
-    try: 
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
+EMBEDDING_INSERT = """
+    INSERT INTO aide_ligne_chunk_embedding (id_chunk, modele, dimension, vecteur)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (id_chunk) DO UPDATE
+    SET modele = EXCLUDED.modele, dimension = EXCLUDED.dimension, vecteur = EXCLUDED.vecteur;
+"""
 
-        # insérer le fichier dans aide_ligne_fichier
-        cur.execute("""
-            INSERT INTO aide_ligne_fichier (nom_fichier) VALUES (%s)
-            ON CONFLICT (nom_fichier) DO NOTHING RETURNING id_source;;
-        """, (pdf_file.name,))
-        result = cur.fetchone()
-        id_source = result[0] if result else None
 
-        if id_source is None:
-            logging.info(f"Le fichier {pdf_file.name} existe déjà en base.")
-            return
-        
-        inserted_chunks = 0
-        inserted_qas = 0
-
-        # Insérer les chunks
-        for chunk in data:
-            # logging.info(chunk)
-            cur.execute("""
-                INSERT INTO aide_ligne_chunk (titre, contenu, id_source, page, nombre_tokens)
-                VALUES (%s, %s, %s, %s, %s) RETURNING id_chunk;
-            """, (chunk.get("titre"), chunk["contenu"], id_source, chunk.get("page"), chunk.get("nombre_tokens")))
-            id_chunk = cur.fetchone()[0]
-            inserted_chunks += 1
-            
-            # Insérer les QA
-            for qa in chunk.get("questions_reponses", []):
+def embedding_row(id_chunk, vector):
+    """Ligne de aide_ligne_chunk_embedding : vecteur en float32 brut (little-endian, lu tel quel par l'API ETL)."""
+    vector = vector.astype("<f4", copy=False)
+    return id_chunk, EMBEDDING_MODEL, vector.shape[0], vector.tobytes()
+
+
+def insert_embedding(cur, id_chunk, vector):
+    id_chunk, modele, dimension, vecteur = embedding_row(id_chunk, vector)
+    cur.execute(EMBEDDING_INSERT, (id_chunk, modele, dimension, psycopg2.Binary(vecteur)))
+
+
+COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def copy_value(value):
+    """Valeur au format texte de COPY (NULL, bytea en hexadécimal, caractères spéciaux échappés)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_rows(cur, table, columns, rows):
+    """Insère `rows` en un seul COPY FROM STDIN : un aller-retour au lieu d'un INSERT par ligne."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(map(copy_value, row)) + "\n")
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+# id_chunk réservés d'avance : chaque chunk connaît son id avant le COPY (triés : ordre du document conservé)
+CHUNK_IDS_QUERY = """
+    SELECT nextval(pg_get_serial_sequence('aide_ligne_chunk', 'id_chunk')) FROM generate_series(1, %s);
+"""
+
+
+def insert_file_and_chunks(pdf_file, data, embeddings=None):
+    """Insère le fichier, ses chunks, leurs Q/A et embeddings (ligne i de `embeddings`) en une transaction.
+
+    Chunks, Q/A et embeddings partent chacun en un COPY ; une erreur annule tout le fichier.
+    """
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            with conn, conn.cursor() as cur:
+                # insérer le fichier dans aide_ligne_fichier
                 cur.execute("""
-                    INSERT INTO aide_ligne_qa (question, réponse, id_chunk)
-                    VALUES (%s, %s, %s);
-                """, (qa["question"], qa["réponse"], id_chunk))
-                inserted_qas += 1
-    
-        conn.commit()
-        cur.close()
-        conn.close()
-        logging.info(f"{inserted_chunks} chunks insérés et {inserted_qas} Q/A insérées en base avec succès !")
+                    INSERT INTO aide_ligne_fichier (nom_fichier) VALUES (%s)
+                    ON CONFLICT (nom_fichier) DO NOTHING RETURNING id_source;
+                """, (pdf_file.name,))
+                result = cur.fetchone()
+                id_source = result[0] if result else None
+
+                if id_source is None:
+                    logging.info(f"Le fichier {pdf_file.name} existe déjà en base.")
+                    return
+
+                cur.execute(CHUNK_IDS_QUERY, (len(data),))
+                ids = sorted(row[0] for row in cur.fetchall())
+                copy_rows(cur, "aide_ligne_chunk", ("id_chunk", "titre", "contenu", "id_source", "page", "nombre_tokens"), (
+                    (id_chunk, chunk.get("titre"), chunk["contenu"], id_source, chunk.get("page"), chunk.get("nombre_tokens"))
+                    for id_chunk, chunk in zip(ids, data)
+                ))
+                qas = [
+                    (qa["question"], qa["réponse"], id_chunk)
+                    for id_chunk, chunk in zip(ids, data)
+                    for qa in chunk.get("questions_reponses", [])
+                ]
+                copy_rows(cur, "aide_ligne_qa", ("question", "réponse", "id_chunk"), qas)
+                if embeddings is not None:
+                    copy_rows(cur, "aide_ligne_chunk_embedding", ("id_chunk", "modele", "dimension", "vecteur"),
+                              (embedding_row(id_chunk, vector) for id_chunk, vector in zip(ids, embeddings)))
+        finally:
+            conn.close()
+        logging.info(f"{len(ids)} chunks insérés et {len(qas)} Q/A insérées en base avec succès !")
         logging.info("Données insérées en base avec succès !")
     except Exception as e:
-        logging.info(f"Erreur lors de l'insertion des données en base : {e}")
+        logging.info(f"Erreur lors de l'insertion des données en base (aucune ligne insérée) : {e}")
 
 
 # ############################################################################################
@@ -176,6 +203,105 @@ def remove_file_from_database(file_name):
 
 
 
+def embed_missing_chunks(batch_size=256):
+    """Calcule les embeddings des chunks qui n'en ont pas (ingérés avant, ou autre modèle)."""
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        total = 0
+        while True:
+            with conn, conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.id_chunk, c.contenu
+                    FROM aide_ligne_chunk c
+                    LEFT JOIN aide_ligne_chunk_embedding e ON e.id_chunk = c.id_chunk
+                    WHERE e.id_chunk IS NULL OR e.modele <> %s
+                    ORDER BY c.id_chunk
+                    LIMIT %s;
+                """, (EMBEDDING_MODEL, batch_size))
+                rows = cur.fetchall()
+                if not rows:
+                    break
+                embeddings = embed_chunks(contenu for _, contenu in rows)
+                if len(embeddings) != len(rows):
+                    # sinon les mêmes chunks seraient resélectionnés indéfiniment
+                    raise ValueError(f"{len(embeddings)} embeddings calculés pour {len(rows)} chunks")
+                for (id_chunk, _), vector in zip(rows, embeddings):
+                    insert_embedding(cur, id_chunk, vector)
+                total += len(rows)
+        conn.close()
+        if total:
+            logging.info(f"{total} embeddings de chunks calculés au démarrage")
+    except Exception as e:
+        logging.info(f"Erreur lors du calcul des embeddings manquants : {e}")
+
+
+def write_backlog_batch(batch_path):
+    """Requêtes de Q/R de tous les JSON extraits dont des chunks n'ont pas encore de Q/R, dans un seul lot."""
+    Path(batch_path).unlink(missing_ok=True)
+    total = 0
+    for json_path in sorted(EXTRACTION_DIR.glob("*_QA.json")):
+        with open(json_path, "r", encoding="utf-8") as f:
+            total += write_questions_batch(json.load(f), batch_path, append=True)
+    logging.info(f"Lot de {total} requêtes de Q/R écrit dans {batch_path}")
+    return total
+
+
+def insert_batch_questions(cur, nom_fichier, chunks, merged):
+    """Insère les Q/R reçues par lot (un COPY) ; les chunks en base sont ceux du JSON, dans l'ordre des id_chunk."""
+    cur.execute("""
+        SELECT c.id_chunk FROM aide_ligne_chunk c
+        JOIN aide_ligne_fichier f ON f.id_source = c.id_source
+        WHERE f.nom_fichier = %s ORDER BY c.id_chunk;
+    """, (nom_fichier,))
+    ids = [row[0] for row in cur.fetchall()]
+    if len(ids) != len(chunks):
+        logging.warning(f"{nom_fichier} : {len(ids)} chunks en base pour {len(chunks)} dans le JSON, Q/R non insérées")
+        return 0
+    # chunks sans Q/R en base uniquement : une fusion rejouée n'insère pas de doublons
+    cur.execute("SELECT DISTINCT id_chunk FROM aide_ligne_qa WHERE id_chunk = ANY(%s);", (ids,))
+    answered = {row[0] for row in cur.fetchall()}
+    merged = {id(chunk) for chunk in merged}
+    qas = [
+        (qa["question"], qa["réponse"], id_chunk)
+        for id_chunk, chunk in zip(ids, chunks)
+        if id(chunk) in merged and id_chunk not in answered
+        for qa in chunk["questions_reponses"]
+    ]
+    copy_rows(cur, "aide_ligne_qa", ("question", "réponse", "id_chunk"), qas)
+    return len(qas)
+
+
+def merge_batch_results(results_path):
+    """Fusionne un fichier de résultats de lot dans les JSON extraits et en base (une transaction par fichier).
+
+    Retourne (chunks complétés, Q/A insérées, chunks toujours sans Q/R) : requêtes en erreur
+    ou absentes du fichier, signalées dans le log et à resoumettre par --batch-requests.
+    """
+    answers, failed = read_batch_results(results_path)
+    merged_chunks = inserted = pending = 0
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        for json_path in sorted(EXTRACTION_DIR.glob("*_QA.json")):
+            with open(json_path, "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            merged = merge_questions_batch(chunks, answers)
+            pending += sum(not has_questions(chunk) for chunk in chunks)
+            if not merged:
+                continue
+            with conn, conn.cursor() as cur:
+                inserted += insert_batch_questions(cur, merged[0]["nom_fichier"], chunks, merged)
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(chunks, f, ensure_ascii=False, indent=4)
+            merged_chunks += len(merged)
+    finally:
+        conn.close()
+    logging.info(f"Lot {results_path} : {len(answers)} réponses, {merged_chunks} chunks complétés, {inserted} Q/A insérées")
+    if failed or pending:
+        logging.warning(f"Lot {results_path} : {len(failed)} requêtes en erreur, {pending} chunks toujours sans Q/R "
+                        f"(erreurs ou réponses absentes du fichier, à resoumettre avec --batch-requests)")
+    return merged_chunks, inserted, pending
+
+
 def fichier_deja_traite(nom_fichier):
     """Vérifie si un fichier a déjà été traité (présent en base)"""
     try:
@@ -197,37 +323,55 @@ class WatchdogHandler(FileSystemEventHandler):
     def on_created(self, event):
         if event.src_path.endswith(".pdf"):
             logging.info(f"Nouveau fichier détecté : {event.src_path}")
-            pdf_path = Path(event.src_path)
-            logging.info(f"Nouveau PDF détecté : {pdf_path.name}")
-            
-            # Vérification base
-            if fichier_deja_traite(pdf_path.name):
-                logging.info(f"⏭️ Le fichier {pdf_path.name} a déjà été traité. Ignoré.")
-                return
+            self.process_pdf(Path(event.src_path))
+
+    def on_moved(self, event):
+        """L'app écrit les uploads dans un fichier temporaire caché puis le renomme en .pdf."""
+        if Path(event.src_path).suffix.lower() == ".pdf":
+            self.on_deleted(FileDeletedEvent(event.src_path))
+        if event.dest_path.endswith(".pdf"):
+            logging.info(f"Fichier renommé en PDF : {event.dest_path}")
+            self.process_pdf(Path(event.dest_path))
+
+    def process_pdf(self, pdf_path):
+        """Extraction, génération des Q/R et insertion en base d'un nouveau PDF."""
+        logging.info(f"Nouveau PDF détecté : {pdf_path.name}")
+        
+        # Vérification base
+        if fichier_deja_traite(pdf_path.name):
+            logging.info(f"⏭️ Le fichier {pdf_path.name} a déjà été traité. Ignoré.")
+            return
+
+        try:
+            # Étape 1 : extraction + parsing
+            json_data, prefix, titre = generate_content_from_pdf(str(pdf_path))
+
+            # Étape 2 : génération des Q/R (appels LLM en parallèle, dans les budgets RPM/TPM),
+            # ou requêtes mises de côté pour l'API Batch, fusionnées ensuite par --merge-batch
+            if QA_MODE == "batch":
+                write_questions_batch(json_data, BATCH_DIR / f"{prefix} {titre}_QA_requests.jsonl")
+            else:
+                generate_questions_for_chunks(json_data)
 
+            # Étape 3 : sauvegarde finale
+            output_json = EXTRACTION_DIR / f"{prefix} {titre}_QA.json"
+            with open(output_json, "w", encoding="utf-8") as f:
+                json.dump(json_data, f, ensure_ascii=False, indent=4)
+
+            # Étape 4 : embeddings des chunks (l'ingestion continue sans eux en cas d'échec)
             try:
-                # Étape 1 : extraction + parsing
-                json_data, prefix, titre = generate_content_from_pdf(str(pdf_path))
+                embeddings = embed_chunks(chunk["contenu"] for chunk in json_data)
+            except Exception as e:
+                embeddings = None
+                logging.info(f"Erreur lors du calcul des embeddings de {pdf_path.name} : {e}")
 
-                # Étape 2 : génération des Q/R
-                for chunk in json_data:
-                    if "questions_reponses" not in chunk or not chunk["questions_reponses"]:
-                        nb_tokens = calculate_tokens(chunk["contenu"])
-                        qa = generate_questions_truth(chunk["contenu"], nb_tokens)
-                        chunk["questions_reponses"] = transform_questions_answers(qa)
+            # Étape 5 : insertion en base
+            insert_file_and_chunks(pdf_path, json_data, embeddings)
 
-                # Étape 3 : sauvegarde finale
-                output_json = EXTRACTION_DIR / f"{prefix} {titre}_QA.json"
-                with open(output_json, "w", encoding="utf-8") as f:
-                    json.dump(json_data, f, ensure_ascii=False, indent=4)
+        except Exception as e:
+            logging.info(f"Erreur lors du traitement de {pdf_path.name} : {e}")
 
-                # Étape 4 : insertion en base
-                insert_file_and_chunks(pdf_path, json_data)
 
-            except Exception as e:
-                logging.info(f"Erreur lors du traitement de {pdf_path.name} : {e}")
-    
-    
     def on_deleted(self, event):
         """Lorsqu'un fichier PDF est supprimé de data_brute/, on supprime les données associées en base."""
         path = Path(event.src_path)
@@ -266,8 +410,25 @@ def start_watchdog():
     # setup_database()
     # start_watchdog()
 def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--watch", action="store_true", help="surveiller data-brute (comportement par défaut)")
+    parser.add_argument("--batch-requests", type=Path, metavar="JSONL",
+                        help="écrire les requêtes de Q/R manquantes de tous les documents extraits, puis quitter")
+    parser.add_argument("--merge-batch", type=Path, metavar="JSONL",
+                        help="fusionner un fichier de résultats de lot dans les JSON et en base, puis quitter")
+    args = parser.parse_args()
+
     setup_database()
-    start_watchdog()   
+    if args.batch_requests:
+        print(f"{write_backlog_batch(args.batch_requests)} requêtes écrites dans {args.batch_requests}")
+    elif args.merge_batch:
+        merged, inserted, pending = merge_batch_results(args.merge_batch)
+        print(f"{merged} chunks complétés, {inserted} Q/A insérées, {pending} chunks toujours sans Q/R")
+    else:
+        embed_missing_chunks()
+        # pool d'extraction créé une fois, avant le thread de l'observateur
+        start_extraction_pool()
+        start_watchdog()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+Image = pytest.importorskip("PIL.Image")
+
+os.environ["IMAGE_CACHE_PATH"] = ""  # cache d'images en mémoire, propre à chaque process
+
+import extraction  # noqa: E402
+
+
+def offline_caption(image_bytes, max_tokens=30):
+    return f"image {hashlib.sha1(image_bytes).hexdigest()[:8]}."
+
+
+def offline_captions():
+    # initializer des workers : textes alternatifs sans appel OpenAI, sortie déterministe
+    extraction.generate_text_image = offline_caption
+    extraction.generate_text_button = offline_caption
+    extraction.review_caption = lambda caption, max_tokens: caption
+
+
+@pytest.fixture
+def small_pdf(tmp_path):
+    """PDF de 6 pages : titres, paragraphes et une même image sur les pages paires."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (240, 120), (30, 120, 200)).save(buffer, format="PNG")
+    document = fitz.open()
+    for number in range(6):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Section {number}", fontsize=18)
+        page.insert_text((72, 110), f"Saisie des absences, page {number}.", fontsize=11)
+        if number % 2 == 0:
+            page.insert_image(fitz.Rect(72, 140, 312, 260), stream=buffer.getvalue())
+    path = tmp_path / "petit.pdf"
+    document.save(path)
+    document.close()
+    return str(path)
+
+
+def test_extract_pages_same_result_with_workers(small_pdf):
+    offline_captions()
+    try:
+        sequential = extraction.extract_pages(small_pdf, workers=1)
+        parallel = extraction.extract_pages(small_pdf, workers=2, initializer=offline_captions)
+        # deuxième passage sur le même pool : créé une fois, pas par document
+        pool = extraction._pool
+        again = extraction.extract_pages(small_pdf, workers=2, initializer=offline_captions)
+        assert extraction._pool is pool
+    finally:
+        extraction.stop_extraction_pool()
+    assert len(sequential) == 6
+    assert parallel == sequential
+    assert again == sequential
+
+
+def test_openai_client_does_not_retry():
+    # les 429 ne sont repris que par llm_dispatch, dans le budget RPM/TPM
+    assert extraction.client.max_retries == 0
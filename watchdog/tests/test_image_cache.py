@@ -0,0 +1,139 @@
+import io
+import logging
+
+from PIL import Image, ImageDraw
+
+from image_cache import DocumentImages, ImageCache, dhash, log_stats
+
+
+def icon(size=(120, 60), color=(200, 40, 40)):
+    """Icône synthétique : dégradé horizontal et disque, assez de relief pour le dHash."""
+    image = Image.new("RGB", size)
+    draw = ImageDraw.Draw(image)
+    for x in range(size[0]):
+        shade = int(255 * x / size[0])
+        draw.line([(x, 0), (x, size[1])], fill=(shade, shade, shade))
+    draw.ellipse([size[0] // 3, size[1] // 4, size[0] // 3 + size[1] // 2, size[1] * 3 // 4], fill=color)
+    return image
+
+
+def encode(image, format="PNG", **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+class Describer:
+    """`describe` factice : compte les analyses complètes (1 OCR + 2 appels API par image)."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, image_bytes):
+        self.calls.append(image_bytes)
+        return f"[Icône: image {len(self.calls)}]", 1, 2
+
+
+def test_xref_hit_within_document():
+    describe = Describer()
+    images = DocumentImages(describe, ImageCache(""))
+    loads = []
+
+    def load():
+        loads.append(1)
+        return encode(icon())
+
+    assert images.placeholder(7, load) == "[Icône: image 1]"
+    assert images.placeholder(7, load) == "[Icône: image 1]"
+    assert len(describe.calls) == 1
+    assert len(loads) == 1  # xref déjà vu : octets non relus
+    assert images.stats["xref_hits"] == 1
+    assert images.stats["misses"] == 1
+
+
+def test_exact_hit_across_documents():
+    cache = ImageCache("")
+    describe = Describer()
+    data = encode(icon())
+    DocumentImages(describe, cache).placeholder(1, lambda: data)
+
+    other = DocumentImages(describe, cache)
+    assert other.placeholder(42, lambda: data) == "[Icône: image 1]"
+    assert len(describe.calls) == 1
+    assert other.stats["exact_hits"] == 1
+    assert other.stats["misses"] == 0
+
+
+def test_perceptual_hit_on_reencoded_image():
+    cache = ImageCache("")
+    describe = Describer()
+    original = icon()
+    DocumentImages(describe, cache).placeholder(1, lambda: encode(original))
+
+    # même icône, réencodée en JPEG et légèrement redimensionnée : octets différents
+    copy = encode(original.resize((132, 66)), "JPEG", quality=70)
+    assert bin(dhash(original) ^ dhash(Image.open(io.BytesIO(copy)))).count("1") <= cache.distance
+    images = DocumentImages(describe, cache)
+    assert images.placeholder(2, lambda: copy) == "[Icône: image 1]"
+    assert len(describe.calls) == 1
+    assert images.stats["perceptual_hits"] == 1
+
+    # la copie est enregistrée sous son propre SHA-256 : la suivante sort en exact
+    again = DocumentImages(describe, cache)
+    again.placeholder(3, lambda: copy)
+    assert again.stats["exact_hits"] == 1
+
+
+def test_miss_on_different_image():
+    cache = ImageCache("")
+    describe = Describer()
+    DocumentImages(describe, cache).placeholder(1, lambda: encode(icon()))
+
+    different = icon().transpose(Image.FLIP_LEFT_RIGHT)  # dégradé inversé : dHash opposé
+    images = DocumentImages(describe, cache)
+    assert images.placeholder(2, lambda: encode(different)) == "[Icône: image 2]"
+    assert len(describe.calls) == 2
+    assert images.stats["misses"] == 1
+    assert images.stats["perceptual_hits"] == 0
+
+
+def test_other_proportions_are_not_matched():
+    cache = ImageCache("")
+    describe = Describer()
+    DocumentImages(describe, cache).placeholder(1, lambda: encode(icon((120, 60))))
+    images = DocumentImages(describe, cache)
+    images.placeholder(2, lambda: encode(icon((120, 120))))
+    assert images.stats["misses"] == 1
+
+
+def test_log_stats_counts_saved_calls(caplog):
+    cache = ImageCache("")
+    describe = Describer()
+    data = encode(icon())
+    images = DocumentImages(describe, cache)
+    images.placeholder(1, lambda: data)  # analyse complète
+    images.placeholder(1, lambda: data)  # xref
+    images.placeholder(2, lambda: data)  # exacte
+    assert images.stats["ocr_saved"] == 2
+    assert images.stats["api_saved"] == 4
+
+    with caplog.at_level(logging.INFO):
+        log_stats("doc.pdf", images.stats)
+    assert "3 images, 2 servies par le cache (67% ; xref 1, exactes 1, perceptuelles 0)" in caplog.text
+    assert "2 OCR et 4 appels API évités" in caplog.text
+
+
+def test_cache_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "image_cache.sqlite")
+    describe = Describer()
+    original = icon()
+    DocumentImages(describe, ImageCache(path)).placeholder(1, lambda: encode(original))
+
+    # nouveau process / redémarrage : entrées relues depuis le fichier, exactes et perceptuelles
+    reopened = ImageCache(path)
+    images = DocumentImages(describe, reopened)
+    assert images.placeholder(1, lambda: encode(original)) == "[Icône: image 1]"
+    assert images.placeholder(2, lambda: encode(original.resize((132, 66)), "JPEG", quality=70)) == "[Icône: image 1]"
+    assert len(describe.calls) == 1
+    assert images.stats["exact_hits"] == 1
+    assert images.stats["perceptual_hits"] == 1
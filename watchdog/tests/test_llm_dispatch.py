@@ -0,0 +1,91 @@
+import multiprocessing
+
+import httpx
+import openai
+import pytest
+
+import llm_dispatch
+
+
+def acquire_requests(budget, count):
+    limiter = llm_dispatch.RateLimiter(budget=budget)
+    for _ in range(count):
+        limiter.acquire(10)
+
+
+def test_shared_budget_is_global_across_processes():
+    # 3 workers tirent chacun 2 requêtes d'un même budget de 6 requêtes par minute
+    context = multiprocessing.get_context("spawn")
+    budget = llm_dispatch.shared_budget(rpm=6, tpm=1000, context=context)
+    workers = [context.Process(target=acquire_requests, args=(budget, 2)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+
+    # budget épuisé pour tous (recharge de 0,1 requête par seconde) : aucune part par process
+    limiter = llm_dispatch.RateLimiter(budget=budget)
+    with limiter._lock:
+        limiter._refill()
+        assert budget[llm_dispatch.REQUESTS] < 1
+
+
+def test_shared_budget_waits_for_refill():
+    # deux limiteurs (deux process) sur un budget de 2 requêtes par minute : la 3e attend 30 s
+    budget = llm_dispatch.shared_budget(rpm=2, tpm=1000)
+    now = [budget[llm_dispatch.UPDATED]]
+    waits = []
+
+    def sleep(delay):
+        waits.append(delay)
+        now[0] += delay
+
+    first = llm_dispatch.RateLimiter(budget=budget, clock=lambda: now[0], sleep=sleep)
+    second = llm_dispatch.RateLimiter(budget=budget, clock=lambda: now[0], sleep=sleep)
+    first.acquire(10)
+    second.acquire(10)
+    assert waits == []
+    first.acquire(10)
+    assert waits == [30]
+
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+
+def server_error():
+    response = httpx.Response(500, request=REQUEST, json={"error": {"message": "boom"}})
+    return openai.InternalServerError("boom", response=response, body=None)
+
+
+@pytest.mark.parametrize("errors", [
+    [server_error()],
+    [openai.APIConnectionError(request=REQUEST)],
+    [openai.APITimeoutError(request=REQUEST), server_error()],
+])
+def test_transient_errors_are_retried_within_budget(errors):
+    dispatcher = llm_dispatch.LLMDispatcher(rpm=60, tpm=100000, backoff=0)
+    attempts = []
+
+    def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) <= len(errors):
+            raise errors[len(attempts) - 1]
+        return "réponse"
+
+    assert dispatcher.call(create, messages=[{"role": "user", "content": "chunk"}], max_tokens=10) == "réponse"
+    assert len(attempts) == len(errors) + 1
+    assert dispatcher.stats == {"calls": 1, "rate_limited": 0, "transient_errors": len(errors)}
+    # chaque essai est décompté du budget, reprises comprises
+    assert dispatcher.limiter._state[llm_dispatch.REQUESTS] < 60 - len(attempts) + 1
+
+
+def test_transient_error_raised_after_max_retries():
+    dispatcher = llm_dispatch.LLMDispatcher(max_retries=2, backoff=0)
+
+    def create(**kwargs):
+        raise server_error()
+
+    with pytest.raises(openai.InternalServerError):
+        dispatcher.call(create, messages=[], max_tokens=10)
+    assert dispatcher.stats["transient_errors"] == 3
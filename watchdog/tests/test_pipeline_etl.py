@@ -0,0 +1,193 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import psycopg2
+import pytest
+
+pytest.importorskip("fitz")
+
+import pipeline_etl  # noqa: E402
+
+TEST_DB = "etl_test_watchdog"
+STANDIN = Path(__file__).resolve().parents[1] / "benchmarks" / "batch_standin.py"
+
+
+@pytest.fixture(scope="module")
+def database():
+    """Base dédiée aux tests, créée et migrée si besoin (jamais etl_db)."""
+    config = dict(pipeline_etl.DB_CONFIG)
+    try:
+        admin = psycopg2.connect(**{**config, "dbname": "postgres"})
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL indisponible : {e}")
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (TEST_DB,))
+        if not cur.fetchone():
+            cur.execute(f"CREATE DATABASE {TEST_DB} ENCODING 'UTF8' TEMPLATE template0")
+    admin.close()
+    pipeline_etl.DB_CONFIG["dbname"] = TEST_DB
+    pipeline_etl.setup_database()
+    yield
+    pipeline_etl.DB_CONFIG["dbname"] = config["dbname"]
+
+
+def query(sql, params=()):
+    conn = psycopg2.connect(**pipeline_etl.DB_CONFIG)
+    with conn, conn.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+    conn.close()
+    return rows
+
+
+def delete_file(name):
+    conn = psycopg2.connect(**pipeline_etl.DB_CONFIG)
+    with conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM aide_ligne_fichier WHERE nom_fichier = %s;", (name,))
+    conn.close()
+
+
+def qa_count(name):
+    return query("""
+        SELECT count(*) FROM aide_ligne_qa q
+        JOIN aide_ligne_chunk c ON c.id_chunk = q.id_chunk
+        JOIN aide_ligne_fichier f ON f.id_source = c.id_source
+        WHERE f.nom_fichier = %s;
+    """, (name,))[0][0]
+
+
+def custom_ids(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["custom_id"] for line in f]
+
+
+def test_batch_requests_standin_and_merge(database, tmp_path, monkeypatch, caplog):
+    name = "lot de test.pdf"
+    delete_file(name)
+    chunks = [{
+        "titre": f"Section {i}",
+        "contenu": f"Saisie des absences, étape {i}. Valider le planning. Contrôler le solde.",
+        "page": i,
+        "nom_fichier": name,
+        "nombre_tokens": 20,
+        "questions_reponses": [],
+    } for i in range(6)]
+    chunks[5]["questions_reponses"] = [{"question": "Déjà là ?", "réponse": "Oui."}]
+    pipeline_etl.insert_file_and_chunks(Path(name), chunks)
+    monkeypatch.setattr(pipeline_etl, "EXTRACTION_DIR", tmp_path)
+    json_path = tmp_path / "1 lot de test_QA.json"
+    json_path.write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+    try:
+        # requêtes des 5 chunks sans Q/R, mêmes custom_id d'une écriture à l'autre
+        requests = tmp_path / "lot.jsonl"
+        assert pipeline_etl.write_backlog_batch(requests) == 5
+        first = custom_ids(requests)
+        assert pipeline_etl.write_backlog_batch(requests) == 5
+        assert custom_ids(requests) == first
+        assert len(set(first)) == 5
+
+        # une requête sur 2 en erreur (0, 2, 4), puis une ligne perdue : seules 1 et 3 reviennent
+        results = tmp_path / "resultats.jsonl"
+        subprocess.run([sys.executable, str(STANDIN), str(requests), str(results), "--fail", "2"],
+                       check=True, capture_output=True)
+        lines = results.read_text(encoding="utf-8").splitlines()
+        results.write_text("\n".join(line for line in lines if json.loads(line)["custom_id"] != first[1]) + "\n",
+                           encoding="utf-8")
+
+        with caplog.at_level("WARNING"):
+            merged, inserted, pending = pipeline_etl.merge_batch_results(results)
+        assert merged == 1
+        assert pending == 4  # 3 en erreur + 1 absente
+        assert inserted == qa_count(name) - 1 > 0
+        assert "3 requêtes en erreur, 4 chunks toujours sans Q/R" in caplog.text
+        for custom_id in (first[0], first[2], first[4]):
+            assert f"Requête {custom_id} en erreur" in caplog.text
+
+        # le prochain lot ne reprend que les chunks encore sans Q/R, sous les mêmes custom_id
+        assert pipeline_etl.write_backlog_batch(requests) == 4
+        assert custom_ids(requests) == [first[0], first[1], first[2], first[4]]
+
+        # fusion rejouée, depuis le JSON complété ou d'origine : aucun doublon en base
+        before = qa_count(name)
+        assert pipeline_etl.merge_batch_results(results) == (0, 0, 4)
+        json_path.write_text(json.dumps(chunks, ensure_ascii=False), encoding="utf-8")
+        assert pipeline_etl.merge_batch_results(results) == (1, 0, 4)
+        assert qa_count(name) == before
+    finally:
+        delete_file(name)
+
+
+TRICKY = "tab\tretour\nchariot\r antislash \\ et \\N littéral, pas NULL"
+
+
+def document(name, chunks=5, qa=3):
+    return [{
+        "titre": None if i == 1 else f"Section {i} {TRICKY}",
+        "contenu": f"Chunk {i} : {TRICKY}",
+        "page": None if i == 2 else i,
+        "nom_fichier": name,
+        "nombre_tokens": 10 + i,
+        "questions_reponses": [{"question": f"Q{j} du chunk {i} ?\t\\N", "réponse": f"R{j}\n{TRICKY}"}
+                               for j in range(qa)],
+    } for i in range(chunks)]
+
+
+def test_insert_file_and_chunks_copy_round_trip(database):
+    name = "copy aller-retour.pdf"
+    delete_file(name)
+    data = document(name)
+    embeddings = np.random.default_rng(0).standard_normal((len(data), 8), dtype=np.float32)
+    # octets spéciaux du format texte de COPY dans le bytea : \\, \t, \n, \r, \0
+    embeddings[0] = np.frombuffer(b"\\\t\n\r\x00\\N\x00" * 4, dtype="<f4")
+    try:
+        pipeline_etl.insert_file_and_chunks(Path(name), data, embeddings)
+        rows = query("""
+            SELECT c.id_chunk, c.titre, c.contenu, c.page, c.nombre_tokens, e.vecteur, e.dimension
+            FROM aide_ligne_chunk c
+            JOIN aide_ligne_fichier f ON f.id_source = c.id_source
+            JOIN aide_ligne_chunk_embedding e ON e.id_chunk = c.id_chunk
+            WHERE f.nom_fichier = %s ORDER BY c.id_chunk;
+        """, (name,))
+        # ordre du document conservé (id_chunk réservés par nextval, triés)
+        assert [(titre, contenu, page, tokens) for _, titre, contenu, page, tokens, _, _ in rows] == [
+            (chunk["titre"], chunk["contenu"], chunk["page"], chunk["nombre_tokens"]) for chunk in data]
+        assert [bytes(vecteur) for *_, vecteur, _ in rows] == [vector.tobytes() for vector in embeddings]
+        assert {dimension for *_, dimension in rows} == {8}
+
+        # chaque Q/A pointe sur le chunk dont elle vient
+        ids = [row[0] for row in rows]
+        qas = query("SELECT id_chunk, question, réponse FROM aide_ligne_qa WHERE id_chunk = ANY(%s) ORDER BY id_qa;",
+                    (ids,))
+        assert qas == [(id_chunk, qa["question"], qa["réponse"])
+                       for id_chunk, chunk in zip(ids, data) for qa in chunk["questions_reponses"]]
+
+        # la séquence a avancé : un INSERT avec l'id par défaut ne percute pas les id réservés
+        conn = psycopg2.connect(**pipeline_etl.DB_CONFIG)
+        with conn, conn.cursor() as cur:
+            cur.execute("SELECT id_source FROM aide_ligne_fichier WHERE nom_fichier = %s;", (name,))
+            cur.execute("INSERT INTO aide_ligne_chunk (contenu, id_source) VALUES ('suite', %s) RETURNING id_chunk;",
+                        (cur.fetchone()[0],))
+            assert cur.fetchone()[0] > max(ids)
+        conn.close()
+    finally:
+        delete_file(name)
+
+
+def test_insert_file_and_chunks_failure_rolls_back(database, monkeypatch):
+    name = "copy en échec.pdf"
+    delete_file(name)
+    data = document(name)
+    embeddings = np.zeros((len(data), 8), dtype=np.float32)
+    # troisième COPY (embeddings) refusé par PostgreSQL : dimension non entière
+    monkeypatch.setattr(pipeline_etl, "embedding_row",
+                        lambda id_chunk, vector: (id_chunk, "modele", "pas un entier", vector.tobytes()))
+    pipeline_etl.insert_file_and_chunks(Path(name), data, embeddings)
+
+    assert query("SELECT count(*) FROM aide_ligne_fichier WHERE nom_fichier = %s;", (name,)) == [(0,)]
+    assert query("SELECT count(*) FROM aide_ligne_chunk WHERE contenu = %s;", (data[0]["contenu"],)) == [(0,)]
+    assert query("SELECT count(*) FROM aide_ligne_qa WHERE question = %s;",
+                 (data[0]["questions_reponses"][0]["question"],)) == [(0,)]